@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+from __future__ import print_function
+import argparse
+import json
+import timeit
+import uuid
+
+import arrow
+
+from bench_memory import synthetic_response
+from orloclient.objects import Package, cast_records
+
+__author__ = 'alforbes'
+
+"""
+Compare casting the packages of a large /releases response one value at a
+time, as list_packages did with arrow.get, and in bulk with cast_records
+
+    python benchmarks/bench_cast.py --count 20000
+"""
+
+
+def per_value(packages):
+    # cast_type as it was: the item name is checked and arrow.get called for
+    # every value
+    result = []
+    for p in packages:
+        pkg = Package(p['release_id'], p['id'], p['name'], p['version'])
+        for item, value in p.items():
+            if item.endswith('_id') or item == 'id':
+                value = uuid.UUID(value)
+            elif 'time' in item:
+                value = arrow.get(value)
+            setattr(pkg, item, value)
+        result.append(pkg)
+    return result
+
+
+def bulk(packages):
+    result = []
+    for p, cast in zip(packages, cast_records(packages)):
+        pkg = Package(p['release_id'], p['id'], p['name'], p['version'])
+        pkg.__dict__.update(cast)
+        result.append(pkg)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--count', type=int, default=20000,
+                        help='Packages, one per release')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    releases = json.loads(synthetic_response(args.count))['releases']
+    packages = [p for r in releases for p in r['packages']]
+
+    def best(func):
+        return min(timeit.repeat(lambda: func(packages), number=1,
+                                 repeat=args.repeat))
+
+    baseline = best(per_value)
+    print('{} packages'.format(len(packages)))
+    print('{:<10} {:>8.1f}ms'.format('per value', baseline * 1000))
+    fast = best(bulk)
+    print('{:<10} {:>8.1f}ms ({:.1f}x)'.format(
+        'bulk', fast * 1000, baseline / fast))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+from __future__ import print_function
+import argparse
+import json
+from collections import Counter
+from timeit import default_timer
+
+from bench_memory import synthetic_response
+from orloclient.columnar import package_columns
+from orloclient.objects import cast_type
+
+__author__ = 'alforbes'
+
+"""
+Compare a reporting aggregation over packages, looping over the raw
+dictionaries and casting each time with cast_type, against the NumPy columns
+
+The aggregation is the mean duration from the times, the failure rate, and
+the number of packages per status.
+
+    python benchmarks/bench_columnar.py --count 1000000
+"""
+
+
+def nested(releases):
+    total, count, statuses = 0.0, 0, Counter()
+    for release in releases:
+        for package in release['packages']:
+            stime = cast_type('stime', package['stime'])
+            ftime = cast_type('ftime', package['ftime'])
+            total += (ftime - stime).total_seconds()
+            count += 1
+            statuses[package['status']] += 1
+    return total / count, statuses['FAILED'] / float(count), statuses
+
+
+def columnar(releases):
+    import numpy
+    columns = package_columns(releases, format='numpy')
+    seconds = (columns['ftime'] - columns['stime']) / numpy.timedelta64(1, 's')
+    names, counts = numpy.unique(columns['status'].astype('U'),
+                                 return_counts=True)
+    statuses = Counter(dict(zip(names.tolist(), counts.tolist())))
+    return (seconds.mean(), (columns['status'] == 'FAILED').mean(),
+            statuses)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--count', type=int, default=100000,
+                        help='Packages, one per release')
+    args = parser.parse_args()
+
+    releases = json.loads(synthetic_response(args.count))['releases']
+    print('{} packages'.format(args.count))
+    results = []
+    for name, func in (('nested', nested), ('columnar', columnar)):
+        start = default_timer()
+        results.append(func(releases))
+        print('{:<10} {:>8.2f}s'.format(name, default_timer() - start))
+    assert results[0][2] == results[1][2]
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,59 @@
+#!/usr/bin/env python
+from __future__ import print_function
+import argparse
+import timeit
+
+import requests
+
+from bench_memory import synthetic_response
+from orloclient.jsoncodec import CODECS
+
+__author__ = 'alforbes'
+
+"""
+Compare decoding and encoding a large /releases response with each JSON codec
+
+"response.json()" is how the client decoded responses before: requests
+decodes the body to text, then parses it with the json module.
+
+    python benchmarks/bench_json.py --count 50000
+"""
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--count', type=int, default=50000,
+                        help='Releases in the response')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    body = synthetic_response(args.count).encode('utf-8')
+    response = requests.Response()
+    response.status_code = 200
+    response._content = body
+    response.headers['Content-Type'] = 'application/json'
+
+    def best(func):
+        return min(timeit.repeat(func, number=1, repeat=args.repeat))
+
+    print('{} releases, {:.1f} MiB'.format(
+        args.count, len(body) / 1024.0 / 1024))
+    baseline = best(response.json)
+    print('{:<16} decode {:>8.1f}ms'.format('response.json()', baseline * 1000))
+
+    for name, codec_class in CODECS.items():
+        try:
+            codec = codec_class()
+        except ImportError:
+            print('{:<16} not installed'.format(name))
+            continue
+        document = codec.loads(body)
+        decode = best(lambda: codec.loads(body))
+        encode = best(lambda: codec.dumps(document, indent=2))
+        print('{:<16} decode {:>8.1f}ms ({:>4.1f}x)  encode indent=2 '
+              '{:>8.1f}ms'.format(name, decode * 1000, baseline / decode,
+                                  encode * 1000))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+from __future__ import print_function
+import argparse
+import json
+import logging
+import timeit
+
+import requests
+
+from bench_memory import synthetic_response
+from orloclient import OrloClient
+
+__author__ = 'alforbes'
+
+"""
+Measure what debug logging used to cost with DEBUG disabled
+
+The client used to format its debug messages before calling logger.debug,
+whether or not they would be logged. For a response, that meant decoding its
+whole text, and for get_package, pretty-printing the document. This times
+_expect_200_json_response against the same work plus that formatting.
+
+    python benchmarks/bench_logging.py --count 20000
+"""
+
+
+def make_response(body):
+    response = requests.Response()
+    response.status_code = 200
+    response._content = body.encode('utf-8')
+    response.headers['Content-Type'] = 'application/json'
+    return response
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--count', type=int, default=20000,
+                        help='Releases in the response')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    logging.getLogger('orloclient').setLevel(logging.INFO)
+    client = OrloClient('http://localhost:5000')
+    response = make_response(synthetic_response(args.count))
+    document = json.loads(response.content)
+
+    def lazy():
+        client._expect_200_json_response(response)
+
+    def eager():
+        # What every call did before, on top of parsing
+        "Response {}:\n{}".format(response.status_code, response.text)
+        client._expect_200_json_response(response)
+
+    def lazy_dump():
+        if logging.getLogger('orloclient.client').isEnabledFor(logging.DEBUG):
+            json.dumps(document, indent=2)
+
+    def eager_dump():
+        'Response Dict:\n{}'.format(json.dumps(document, indent=2))
+
+    print('{} releases, {:.1f} MiB response, DEBUG disabled'.format(
+        args.count, len(response.content) / 1024.0 / 1024))
+    for name, lazy_func, eager_func in (
+            ('response', lazy, eager),
+            ('document dump', lazy_dump, eager_dump)):
+        lazy_time = min(timeit.repeat(lazy_func, number=1, repeat=args.repeat))
+        eager_time = min(timeit.repeat(eager_func, number=1,
+                                       repeat=args.repeat))
+        print('{:<14} eager {:>8.1f}ms  lazy {:>8.1f}ms  saved {:>8.1f}ms'.format(
+            name, eager_time * 1000, lazy_time * 1000,
+            (eager_time - lazy_time) * 1000))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+from __future__ import print_function
+import argparse
+import gc
+import json
+import random
+import tracemalloc
+import uuid
+
+from orloclient import Release, ReleaseRecord
+
+__author__ = 'alforbes'
+
+"""
+Compare the memory held by Release objects and ReleaseRecord objects
+
+Each run parses a synthetic /releases response, builds the objects, drops the
+parsed response and measures what is still allocated.
+
+    python benchmarks/bench_memory.py --count 100000
+"""
+
+PLATFORMS = ['web', 'api', 'batch', 'mobile']
+TEAMS = ['adtech', 'search', 'payments', None]
+USERS = ['alice', 'bob', 'carol', 'dave', 'erin']
+STATUSES = ['SUCCESSFUL', 'FAILED', 'IN_PROGRESS']
+
+
+def synthetic_response(count, packages_per_release=1):
+    releases = []
+    for i in range(count):
+        rid = str(uuid.uuid4())
+        time = '2016-{:02d}-{:02d}T{:02d}:{:02d}:{:02d}Z'.format(
+            i % 12 + 1, i % 28 + 1, i % 24, i % 60, (i * 7) % 60)
+        releases.append({
+            'id': rid,
+            'platforms': [random.choice(PLATFORMS)],
+            'team': random.choice(TEAMS),
+            'user': random.choice(USERS),
+            'references': [],
+            'notes': [],
+            'metadata': {},
+            'stime': time,
+            'ftime': time,
+            'duration': i % 600,
+            'packages': [{
+                'id': str(uuid.uuid4()),
+                'release_id': rid,
+                'name': 'package_{}'.format(j),
+                'version': '1.0.{}'.format(i % 50),
+                'status': random.choice(STATUSES),
+                'rollback': False,
+                'diff_url': None,
+                'stime': time,
+                'ftime': time,
+                'duration': i % 60,
+            } for j in range(packages_per_release)],
+        })
+    return json.dumps({'releases': releases})
+
+
+def measure(body, build):
+    """
+    Return the bytes still allocated after building objects from body
+    """
+    gc.collect()
+    tracemalloc.start()
+    objects = build(json.loads(body)['releases'])
+    gc.collect()
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del objects
+    return current
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--count', type=int, default=100000)
+    parser.add_argument('--packages', type=int, default=1,
+                        help='Packages per release')
+    args = parser.parse_args()
+
+    body = synthetic_response(args.count, args.packages)
+
+    results = [
+        ('Release', measure(
+            body, lambda rs: [Release.from_dict(None, r) for r in rs])),
+        ('ReleaseRecord', measure(
+            body, lambda rs: [ReleaseRecord(r) for r in rs])),
+    ]
+
+    baseline = results[0][1]
+    print('{} releases, {} package(s) each'.format(args.count, args.packages))
+    for name, size in results:
+        print('{:<15} {:>10.1f} MiB {:>8.1f} bytes/release {:>6.0%}'.format(
+            name, size / 1024.0 / 1024, float(size) / args.count,
+            float(size) / baseline))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+from __future__ import print_function
+import argparse
+import json
+import os
+import tempfile
+from timeit import default_timer
+
+from bench_memory import synthetic_response
+from orloclient.mirror import LocalMirror
+
+__author__ = 'alforbes'
+
+"""
+Time typical dashboard queries against a LocalMirror of synthetic releases
+
+    python benchmarks/bench_mirror.py --count 100000
+"""
+
+
+class StaticClient(object):
+    uri = 'http://orlo.example.com'
+
+    def __init__(self, releases):
+        self.releases = releases
+
+    def stream_releases(self, raw=False, **filters):
+        return iter(self.releases)
+
+    def get_release_json(self, release_id):
+        raise NotImplementedError
+
+
+QUERIES = [
+    ('versions of package_0 on web',
+     'get_packages', dict(name='package_0', platform='web')),
+    ('latest release of team search',
+     'get_releases', dict(team='search', desc=True, limit=1)),
+    ('failed packages since a date',
+     'get_packages', dict(status='FAILED', stime_after='2016-12-01T00:00:00Z')),
+]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--count', type=int, default=100000,
+                        help='Releases in the mirror')
+    args = parser.parse_args()
+
+    releases = json.loads(synthetic_response(args.count))['releases']
+    path = os.path.join(tempfile.mkdtemp(), 'mirror.sqlite')
+    mirror = LocalMirror(StaticClient(releases), path)
+    start = default_timer()
+    mirror.sync()
+    print('{} releases synced in {:.1f}s'.format(
+        args.count, default_timer() - start))
+
+    for name, method, filters in QUERIES:
+        start = default_timer()
+        result = getattr(mirror, method)(raw=True, **filters)
+        print('{:<32} {:>7} results {:>8.1f}ms'.format(
+            name, len(result), (default_timer() - start) * 1000))
+    os.remove(path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+from __future__ import print_function
+import argparse
+import json
+import timeit
+import uuid
+
+from bench_memory import synthetic_response
+from orloclient import ClientError
+from orloclient.objects import RELEASE_SCHEMA, Release, cast_time
+from orloclient.mock_orlo import MockOrloClient
+
+__author__ = 'alforbes'
+
+"""
+Compare attribute access on Release objects with the field schema, against
+the item name scanning that cast_type did before
+
+Each Release is fresh, so every attribute read goes through __getattr__ and
+the cast. Times are cast by the same cached parser in both, so the difference
+is the dispatch, which is also timed on its own for items that aren't cast.
+
+    python benchmarks/bench_schema.py --count 20000
+"""
+
+ATTRIBUTES = ('user', 'team', 'duration', 'platforms', 'references',
+              'metadata', 'stime', 'ftime')
+
+
+def scanning_cast(item, value):
+    # cast_type as it was
+    if item.endswith('_id') or item == 'id':
+        return uuid.UUID(value)
+    if 'time' in item:
+        return cast_time(value)
+    return value
+
+
+class ScanningRelease(Release):
+    def __getattr__(self, item):
+        if self.stale:
+            self.fetch()
+        if item == 'data':
+            return self._data
+        try:
+            return self._cache[item]
+        except KeyError:
+            pass
+        if item == 'packages':
+            value = self._cache[item] = self.list_packages()
+            return value
+        try:
+            if len(self._data['releases']) > 1:
+                raise ClientError("Expected one release in dictionary")
+            value = self._data['releases'][0][item]
+        except KeyError:
+            raise ClientError(
+                "This object does not have attribute '{}'".format(item))
+        value = self._cache[item] = scanning_cast(item, value)
+        return value
+
+
+def read_all(cls, client, releases):
+    for r in releases:
+        release = cls.from_dict(client, r)
+        for attribute in ATTRIBUTES:
+            getattr(release, attribute)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--count', type=int, default=20000,
+                        help='Releases')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    client = MockOrloClient('http://localhost:5000')
+    releases = json.loads(synthetic_response(args.count))['releases']
+    reads = args.count * len(ATTRIBUTES)
+
+    def best(cls):
+        return min(timeit.repeat(lambda: read_all(cls, client, releases),
+                                 number=1, repeat=args.repeat))
+
+    before = best(ScanningRelease)
+    after = best(Release)
+    print('{} attribute reads'.format(reads))
+    for name, seconds in (('scanning', before), ('schema', after)):
+        print('{:<10} {:>8.1f}ms {:>10.0f} reads/s'.format(
+            name, seconds * 1000, reads / seconds))
+
+    items = [(item, r[item]) for r in releases
+             for item in ATTRIBUTES if 'time' not in item]
+
+    def schema_cast(item, value):
+        cast = RELEASE_SCHEMA.get(item)
+        return value if cast is None else cast(value)
+
+    print('{} dispatches'.format(len(items)))
+    for name, func in (('scanning', scanning_cast), ('schema', schema_cast)):
+        seconds = min(timeit.repeat(
+            lambda: [func(item, value) for item, value in items],
+            number=1, repeat=args.repeat))
+        print('{:<10} {:>8.1f}ms {:>10.0f} casts/s'.format(
+            name, seconds * 1000, len(items) / seconds))
+
+
+if __name__ == '__main__':
+    main()
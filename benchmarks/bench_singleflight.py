@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+from __future__ import print_function
+import argparse
+import json
+import random
+import threading
+import time
+import uuid
+from six.moves import socketserver
+from six.moves.BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+
+from orloclient import OrloClient
+
+__author__ = 'alforbes'
+
+"""
+Count the requests reaching the server when many threads read the same
+releases, with and without coalescing
+
+A local server answers /releases/<id> after a fixed latency. Each thread
+repeatedly fetches a release picked at random from a small set, so many
+threads ask for the same one at once.
+
+    python benchmarks/bench_singleflight.py --threads 50 --releases 5
+"""
+
+
+class CountingServer(socketserver.ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+    # Enough for every thread to connect at once
+    request_queue_size = 256
+
+    def __init__(self, latency):
+        HTTPServer.__init__(self, ('127.0.0.1', 0), Handler)
+        self.latency = latency
+        self.requests = 0
+        self.lock = threading.Lock()
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        with self.server.lock:
+            self.server.requests += 1
+        time.sleep(self.server.latency)
+        release_id = self.path.rsplit('/', 1)[1]
+        body = json.dumps({'releases': [{'id': release_id}]}).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def run(server, coalesce, threads, release_ids, reads):
+    """
+    Return the server requests and seconds taken for threads * reads calls
+    """
+    uri = 'http://{}:{}'.format(*server.server_address)
+    client = OrloClient(uri, pool_maxsize=threads, coalesce=coalesce)
+    start_line = threading.Barrier(threads) if hasattr(
+        threading, 'Barrier') else None
+
+    def read():
+        if start_line is not None:
+            start_line.wait()
+        for _ in range(reads):
+            client.get_release_json(random.choice(release_ids))
+
+    server.requests = 0
+    workers = [threading.Thread(target=read) for _ in range(threads)]
+    start = time.time()
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    elapsed = time.time() - start
+    client.close()
+    return server.requests, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--threads', type=int, default=50)
+    parser.add_argument('--releases', type=int, default=5,
+                        help='Distinct releases read')
+    parser.add_argument('--reads', type=int, default=20,
+                        help='Reads per thread')
+    parser.add_argument('--latency', type=float, default=0.02,
+                        help='Server response time, in seconds')
+    args = parser.parse_args()
+
+    server = CountingServer(args.latency)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    release_ids = [str(uuid.uuid4()) for _ in range(args.releases)]
+
+    calls = args.threads * args.reads
+    print('{} threads, {} reads each of {} release(s), {:.0f}ms latency'.format(
+        args.threads, args.reads, args.releases, args.latency * 1000))
+    for name, coalesce in (('uncoalesced', False), ('coalesced', True)):
+        requests, elapsed = run(server, coalesce, args.threads, release_ids,
+                                args.reads)
+        print('{:<12} {:>6} server requests for {} calls ({:>5.1%}) '
+              '{:>6.2f}s'.format(name, requests, calls,
+                                 float(requests) / calls, elapsed))
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
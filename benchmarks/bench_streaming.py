@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+from __future__ import print_function
+import argparse
+import timeit
+import tracemalloc
+
+from bench_memory import synthetic_response
+from orloclient import jsoncodec
+from orloclient.streaming import ArrayItemParser
+
+__author__ = 'alforbes'
+
+"""
+Compare parsing a large /releases response whole and as a stream
+
+Reports the time until the first release is available, the total time, and
+the peak memory allocated while parsing, counting each release as discarded
+once handled. The body is fed in chunks as read from the network.
+
+    python benchmarks/bench_streaming.py --count 50000
+"""
+
+
+def whole(chunks):
+    body = b''.join(chunks)
+    first = None
+    for release in jsoncodec.loads(body)['releases']:
+        if first is None:
+            first = timeit.default_timer()
+    return first
+
+
+def streamed(chunks):
+    parser = ArrayItemParser('releases')
+    first = None
+    for chunk in chunks:
+        for release in parser.feed(chunk):
+            if first is None:
+                first = timeit.default_timer()
+    parser.close()
+    return first
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--count', type=int, default=50000,
+                        help='Releases in the response')
+    parser.add_argument('--chunk-size', type=int, default=65536)
+    args = parser.parse_args()
+
+    body = synthetic_response(args.count).encode('utf-8')
+    chunks = [body[i:i + args.chunk_size]
+              for i in range(0, len(body), args.chunk_size)]
+    print('{} releases, {:.1f} MiB, codec {}'.format(
+        args.count, len(body) / 1024.0 / 1024, jsoncodec.get_codec().name))
+
+    for name, func in (('whole', whole), ('streamed', streamed)):
+        start = timeit.default_timer()
+        first = func(chunks)
+        total = timeit.default_timer() - start
+
+        tracemalloc.start()
+        func(chunks)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+        print('{:<10} first {:>8.1f}ms  total {:>8.1f}ms  peak {:>8.1f} MiB'
+              .format(name, (first - start) * 1000, total * 1000,
+                      peak / 1024.0 / 1024))
+
+
+if __name__ == '__main__':
+    main()
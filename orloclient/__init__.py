@@ -1,11 +1,54 @@
 from __future__ import print_function
+import sys
+from importlib import import_module
+from ._version import __version__
 from .config import config
-from .client import OrloClient
 from .exceptions import OrloError, ClientError, ServerError, ConnectionError, \
-    OrloServerError, OrloClientError # legacy exceptions for backwards
-                                     # compatibility
-from .objects import Release, Package
-from .mock_orlo import MockOrloClient
-from pkg_resources import get_distribution
+    CircuitOpenError
+from .exceptions import OrloServerError, OrloClientError # legacy exceptions for
+                                                         # backwards compatibility
 
-__version__ = get_distribution(__name__).version
+# The rest of the public API is imported on first use, so that importing
+# orloclient (and running the command line client) doesn't pay for requests
+# and arrow until they are needed. Attribute name -> module.
+_lazy_attributes = {
+    'OrloClient': '.client',
+    'Release': '.objects',
+    'Package': '.objects',
+    'ReleaseRecord': '.records',
+    'PackageRecord': '.records',
+    'BulkResult': '.bulk',
+    'ResponseCache': '.cache',
+    'RetryPolicy': '.retry',
+    'CircuitBreakers': '.retry',
+    'Metrics': '.instrumentation',
+    'StatsdExporter': '.instrumentation',
+    'SampledTrace': '.instrumentation',
+    'LocalMirror': '.mirror',
+    'MockOrloClient': '.mock_orlo',
+}
+
+__all__ = ['__version__', 'config', 'OrloError', 'ClientError', 'ServerError',
+           'ConnectionError', 'CircuitOpenError', 'OrloServerError',
+           'OrloClientError'] + sorted(_lazy_attributes)
+
+
+def __getattr__(name):
+    try:
+        module = _lazy_attributes[name]
+    except KeyError:
+        raise AttributeError(
+            "module {!r} has no attribute {!r}".format(__name__, name))
+    value = getattr(import_module(module, __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_lazy_attributes))
+
+
+if sys.version_info < (3, 7):
+    # No module __getattr__ (PEP 562), import everything up front
+    for _name in _lazy_attributes:
+        __getattr__(_name)
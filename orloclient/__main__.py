@@ -1,12 +1,9 @@
 from __future__ import print_function
 import argparse
 import logging
-import json
 import sys
-import uuid
 from os.path import expanduser
-from orloclient import __version__
-from orloclient import OrloClient
+from orloclient import __version__, jsoncodec
 
 if sys.version_info >= (3, 0):
     from configparser import ConfigParser
@@ -16,6 +13,10 @@ else:
 
 __author__ = 'alforbes'
 
+# Importing the client pulls in requests, which is slow. It is imported by
+# main() once a command is going to run, so that --help and --version are fast.
+OrloClient = None
+
 logging.basicConfig(format='%(message)s')
 logger = logging.getLogger('orloclient')
 logger.setLevel(logging.INFO)
@@ -25,6 +26,10 @@ config = ConfigParser()
 config.add_section('client')
 config.set('client', 'uri', 'http://localhost:5000')
 config.set('client', 'verify_ssl', 'true')
+config.set('client', 'cache', 'false')
+config.set('client', 'cache_path', '')
+config.set('client', 'daemon', 'true')
+config.set('client', 'socket_path', '')
 config.read([
     '/etc/orlo/orlo.ini',
     expanduser('~/.orlo.ini'),
@@ -34,7 +39,7 @@ config.read([
 
 def action_get_release(client, args):
     release = client.get_release(args.release)
-    logger.info(json.dumps(
+    logger.info(jsoncodec.dumps(
         release.data,
         indent=2
     ))
@@ -42,7 +47,7 @@ def action_get_release(client, args):
 
 def action_get_package(client, args):
     package = client.get_package(args.package)
-    logger.info(json.dumps(
+    logger.info(jsoncodec.dumps(
         package.data,
         indent=2
     ))
@@ -72,33 +77,16 @@ def action_create_package(client, args):
 
 
 def action_start(client, args):
+    # get_package returns everything we print, no need to fetch the release
     package = client.get_package(args.package)
-    release = client.get_release(package.release_id)
-
     client.package_start(package)
-    release.fetch()
-
-    logger.info(json.dumps(
-        [
-            p.to_dict() for p in release.packages \
-                if p.id == uuid.UUID(package.id)
-        ][0]
-    ))
+    logger.info(jsoncodec.dumps(package.to_dict()))
 
 
 def action_stop(client, args):
     package = client.get_package(args.package)
-    release = client.get_release(package.release_id)
-
     client.package_stop(package)
-    release.fetch()
-
-    logger.info(json.dumps(
-        [
-            p.to_dict() for p in release.packages \
-            if p.id == uuid.UUID(package.id)
-            ][0]
-    ))
+    logger.info(jsoncodec.dumps(package.to_dict()))
 
 
 def action_list(client, args):
@@ -113,15 +101,27 @@ def action_list(client, args):
         kwargs[l[0]] = l[1]
 
 
+    if args.stream:
+        if args.packages:
+            items = client.iter_packages(raw=True, **kwargs)
+        else:
+            items = client.iter_releases(raw=True, **kwargs)
+
+        # One JSON document per line, written as each page arrives
+        for item in items:
+            print(jsoncodec.dumps(item['id'] if args.id_only else item))
+            sys.stdout.flush()
+        return
+
     if args.packages:
         out = client.get_packages(raw=True, **kwargs)
     else:
         out = client.get_releases(raw=True, **kwargs)
 
     if args.id_only:
-        print(json.dumps([item['id'] for item in out], indent=2))
+        print(jsoncodec.dumps([item['id'] for item in out], indent=2))
     else:
-        print(json.dumps(out, indent=2))
+        print(jsoncodec.dumps(out, indent=2))
 
 
 def action_stats(client, args):
@@ -132,7 +132,7 @@ def action_stats(client, args):
         stime=args.time_after,
         ftime=args.time_before,
     )
-    print(json.dumps(out, indent=2))
+    print(jsoncodec.dumps(out, indent=2))
 
 
 def action_info(client, args):
@@ -141,15 +141,178 @@ def action_info(client, args):
         name=args.name,
         platform=args.platform,
     )
-    print(json.dumps(out, indent=2))
+    print(jsoncodec.dumps(out, indent=2))
 
 
 def action_versions(client, args):
     out = client.get_versions(platform=args.platform)
-    print(json.dumps(out, indent=2))
+    print(jsoncodec.dumps(out, indent=2))
+
+
+def action_daemon(args):
+    """
+    Serve forwarded commands until interrupted, see daemon.py
+    """
+    import signal
+    from orloclient.daemon import Daemon
+
+    daemon = Daemon(
+        run_forwarded,
+        socket_path=args.socket_path or None,
+        coalesce=lambda command: command['object'] in READ_ONLY_COMMANDS,
+        client_factory=daemon_client,
+        debug=args.debug,
+    )
+    # Exit through serve_forever's cleanup, which removes the socket
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    try:
+        daemon.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+def action_batch(args):
+    """
+    Run commands read from a file or stdin, see batch.py
+
+    :return: Exit status, 1 if any command failed
+    """
+    from orloclient.batch import Batch
+    from orloclient.capture import OutputCapture
+
+    parser = build_parser()
+    if args.jobs < 1:
+        parser.error('--jobs must be at least 1')
+    subparsers = subcommand_parsers(parser)
+    # Options given to "batch" apply to every command
+    shared = dict((k, v) for k, v in vars(args).items()
+                  if k not in ('object', 'func', 'file', 'jobs'))
+
+    def parse(argv):
+        if argv[0] in STANDALONE_COMMANDS:
+            parser.error("{} cannot be run in a batch".format(argv[0]))
+        return parser.parse_args(argv, namespace=argparse.Namespace(**shared))
+
+    client = make_client(args, pool_maxsize=max(args.jobs, 10))
+
+    def execute(command_args):
+        return ACTIONS[command_args.object](client, command_args)
+
+    executor = None
+    if args.jobs > 1:
+        from concurrent.futures import ThreadPoolExecutor
+        executor = ThreadPoolExecutor(max_workers=args.jobs)
+    try:
+        with OutputCapture(debug=args.debug) as capture:
+            failed = Batch(parse, execute, capture, subparsers, jobs=args.jobs,
+                           executor=executor).run(args.file, sys.stdout)
+    finally:
+        if executor is not None:
+            executor.shutdown()
+        client.close()
+    return 1 if failed else 0
+
+
+# Subcommand -> action(client, args)
+ACTIONS = {
+    'create-release': action_create_release,
+    'create-package': action_create_package,
+    'get-release': action_get_release,
+    'get-package': action_get_package,
+    'start': action_start,
+    'stop': action_stop,
+    'list': action_list,
+    'stats': action_stats,
+    'info': action_info,
+    'versions': action_versions,
+}
+
+# Subcommands that don't change anything, identical ones running at the same
+# time in the daemon share one result
+READ_ONLY_COMMANDS = frozenset([
+    'get-release', 'get-package', 'list', 'stats', 'info', 'versions'])
+
+# Subcommands run as action(args), which are never forwarded to the daemon
+STANDALONE_COMMANDS = frozenset(['batch', 'daemon'])
+
+
+def make_client(args, **kwargs):
+    """
+    :param kwargs: Passed to OrloClient
+    """
+    global OrloClient
+    if OrloClient is None:
+        from orloclient.client import OrloClient
+
+    cache = None
+    if args.cache:
+        from orloclient.cache import SQLiteResponseCache
+        cache = SQLiteResponseCache(args.cache_path or None)
+
+    return OrloClient(
+        uri=args.uri,
+        verify_ssl=False if args.insecure else True,
+        cache=cache,
+        **kwargs
+    )
+
+
+def daemon_client(uri, verify_ssl):
+    """
+    Create a client kept by the daemon, with an in-memory cache
+    """
+    global OrloClient
+    if OrloClient is None:
+        from orloclient.client import OrloClient
+    from orloclient.cache import ResponseCache
+
+    return OrloClient(uri=uri, verify_ssl=verify_ssl, cache=ResponseCache())
+
+
+def run_forwarded(daemon, command):
+    """
+    Run a command forwarded to the daemon, with one of its warm clients
+    """
+    args = argparse.Namespace(**command)
+    client = daemon.client(args.uri, verify_ssl=False if args.insecure else True)
+    ACTIONS[args.object](client, args)
+
 
+def forward(args):
+    """
+    Run the command in the daemon, if one is listening
 
-def main():
+    Streamed listings are always run directly, the daemon only returns output
+    once a command has finished.
+
+    :return: The command's exit status, or None if it was not forwarded
+    """
+    if (args.no_daemon or args.object in STANDALONE_COMMANDS or
+            getattr(args, 'stream', False)):
+        return None
+
+    from orloclient import daemon
+    command = dict((k, v) for k, v in vars(args).items() if k != 'func')
+    reply = daemon.forward(command, socket_path=args.socket_path or None)
+    if reply is None:
+        logger.debug("No daemon listening, running directly")
+        return None
+    sys.stdout.write(reply['stdout'])
+    sys.stderr.write(reply['stderr'])
+    return reply['status']
+
+
+def subcommand_parsers(parser):
+    """
+    Subcommand name -> its ArgumentParser
+    """
+    for action in parser._actions:
+        if isinstance(action, argparse._SubParsersAction):
+            return action.choices
+    return {}
+
+
+def build_parser():
     parser = argparse.ArgumentParser()
     parser.add_argument('--version', '-v', action='version',
                         version='%(prog)s {}'.format(__version__))
@@ -162,6 +325,22 @@ def main():
         '--insecure', '-I', action='store_true',
         default=False if config.getboolean('client', 'verify_ssl') else True,
         help='Do not verify SSL/TLS connections')
+    parser.add_argument(
+        '--cache', '-c', action='store_true',
+        default=config.getboolean('client', 'cache'),
+        help='Cache responses on disk, shared between invocations')
+    parser.add_argument(
+        '--cache-path', default=config.get('client', 'cache_path'),
+        help='Location of the cache database, default '
+             '~/.cache/orloclient/responses.sqlite')
+    parser.add_argument(
+        '--no-daemon', action='store_true',
+        default=not config.getboolean('client', 'daemon'),
+        help='Run the command directly, even if a daemon is listening')
+    parser.add_argument(
+        '--socket-path', default=config.get('client', 'socket_path'),
+        help='Daemon socket, default $XDG_RUNTIME_DIR/orloclient.sock or '
+             '~/.cache/orloclient/daemon.sock')
 
     subparsers = parser.add_subparsers(dest='object')
     pp_package = argparse.ArgumentParser(add_help=False)
@@ -208,6 +387,11 @@ def main():
         '-i', '--id-only', action='store_true',
        help="Only print id values, not full release json"
     )
+    pp_list.add_argument(
+        '-s', '--stream', action='store_true',
+        help="Fetch all matching results page by page, printing one JSON "
+             "document per line (NDJSON) as they arrive"
+    )
 
     pp_info = argparse.ArgumentParser(add_help=False)
     pp_info.add_argument('field', help='Field to report on',
@@ -277,17 +461,42 @@ def main():
         'versions', help='Fetch current package versions',
         parents=[pp_versions]
     ).set_defaults(func=action_versions)
-
-    args = parser.parse_args()
+    subparsers.add_parser(
+        'daemon', help='Keep connections and a cache warm for other '
+                       'invocations, listening on --socket-path',
+    ).set_defaults(func=action_daemon)
+    pp_batch = subparsers.add_parser(
+        'batch', help='Run commands read one per line, as arguments or JSON '
+                      'objects, writing a JSON result line for each')
+    pp_batch.add_argument(
+        'file', nargs='?', type=argparse.FileType('r'), default=sys.stdin,
+        help='File to read commands from, default stdin')
+    pp_batch.add_argument(
+        '-j', '--jobs', type=int, default=1,
+        help='Number of commands to run at once. Commands on the same '
+             'release or package still run in order')
+    pp_batch.set_defaults(func=action_batch)
+
+    return parser
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.object is None:
+        parser.error('a command is required')
     if args.debug:
         logger.setLevel(logging.DEBUG)
     logger.debug(args)
 
-    client = OrloClient(
-        uri=args.uri,
-        verify_ssl=False if args.insecure else True,
-    )
-    args.func(client, args)
+    if args.object in STANDALONE_COMMANDS:
+        status = args.func(args)
+    else:
+        status = forward(args)
+        if status is None:
+            args.func(make_client(args), args)
+    if status:
+        raise SystemExit(status)
 
 
 if __name__ == "__main__":
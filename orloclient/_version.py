@@ -0,0 +1,2 @@
+# Read by setup.py, keep this file free of imports
+__version__ = '0.4.5'
@@ -0,0 +1,706 @@
+import asyncio
+import logging
+from collections import OrderedDict
+
+import aiohttp
+
+from . import columnar, jsoncodec
+from .bulk import BulkResult, success_by_package
+from .exceptions import ClientError, ServerError, ConnectionError
+from .objects import Release, Package
+from .singleflight import AsyncSingleFlight, flight_key
+from .streaming import ArrayItemParser
+from .watch import Interval, ReleaseTracker, conditional, remember
+
+__author__ = 'alforbes'
+logger = logging.getLogger(__name__)
+
+"""
+Asyncio version of OrloClient
+
+Requires Python 3.5+ and aiohttp, install with "pip install orloclient[async]".
+The methods mirror those of OrloClient, but are coroutines:
+
+    async with AsyncOrloClient('http://localhost:5000') as client:
+        release = await client.get_release(release_id)
+"""
+
+
+def _query(params):
+    """
+    Query parameters as aiohttp accepts them
+
+    aiohttp does not drop None values the way requests does, and raises
+    TypeError for values other than strings and numbers. Values are formatted
+    as OrloClient formats its filters.
+    """
+    return dict((k, '{}'.format(v)) for k, v in params.items()
+                if v is not None)
+
+
+async def run_bulk(func, items, max_workers):
+    """
+    Await func for each item concurrently, see bulk.run_bulk
+
+    :param func: Coroutine function taking a single item
+    :param items: Iterable of items
+    :param int max_workers: Maximum number of concurrent calls, 0 for no
+        limit
+    :return list: BulkResult for each item, in the order given
+    """
+    items = list(items)
+    semaphore = asyncio.Semaphore(max_workers or len(items) or 1)
+
+    async def call(item):
+        async with semaphore:
+            try:
+                return BulkResult(item, await func(item), None)
+            except Exception as e:
+                return BulkResult(item, None, e)
+
+    return list(await asyncio.gather(*[call(item) for item in items]))
+
+
+class AsyncBaseClient(object):
+    """
+    Wraps aiohttp, mainly to catch exceptions
+
+    As with BaseClient, only exceptions derived from OrloError are raised.
+    """
+
+    def __init__(self, timeout=10, verify_ssl=True, pool_maxsize=100,
+                 pool_maxsize_per_host=0, keep_alive=True, coalesce=True):
+        """
+        :param int timeout: Timeout for each request, in seconds
+        :param bool verify_ssl: Verify TLS certificates
+        :param int pool_maxsize: Maximum number of open connections, 0 for
+            no limit
+        :param int pool_maxsize_per_host: Maximum number of open connections
+            to a single host, 0 for no limit
+        :param bool keep_alive: Re-use connections between requests
+        :param bool coalesce: Have concurrent identical GETs share one
+            request, see singleflight.py
+        """
+        self.timeout = timeout
+        self.verify_ssl = verify_ssl
+        self.pool_maxsize = pool_maxsize
+        self.pool_maxsize_per_host = pool_maxsize_per_host
+        self.keep_alive = keep_alive
+        self.get_headers = {'Content-Type': 'application/json'}
+        self.singleflight = AsyncSingleFlight() if coalesce else None
+
+        self._session = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
+
+    @property
+    def session(self):
+        """
+        The pooled aiohttp session, created on first use
+
+        Must be accessed from within the event loop the client is used in.
+        """
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.pool_maxsize,
+                limit_per_host=self.pool_maxsize_per_host,
+                force_close=not self.keep_alive,
+                ssl=None if self.verify_ssl else False,
+            )
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+            )
+        return self._session
+
+    async def close(self):
+        """
+        Release pooled connections
+        """
+        session, self._session = self._session, None
+        if session is not None:
+            await session.close()
+
+    async def _request(self, method, url, **kwargs):
+        """
+        Issue a request and read the body, so the connection can be released
+
+        :return: aiohttp response with the body already read, and kept as
+            response.body_bytes. read() raises once the connection is released
+        """
+        logger.debug("%s args: %s, kwargs: %s", method, url, kwargs)
+        try:
+            async with self.session.request(method, url, **kwargs) as response:
+                response.body_bytes = await response.read()
+                return response
+        except aiohttp.ClientConnectionError as e:
+            raise ConnectionError(
+                "{} while connecting to Orlo server at {}.".format(
+                    e.__class__.__name__, url)
+            )
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            raise ServerError(
+                "Could not read from Orlo server at {u}; aiohttp raised {e}: {m}".format(
+                    u=url, e=e.__class__.__name__, m=e
+                ))
+
+    async def _get(self, url, params=None, headers=None):
+        """
+        Wraps a GET request with standard parameters
+
+        :param dict headers: Sent in addition to the standard headers
+        """
+        if params:
+            params = _query(params)
+        request_headers = self.get_headers
+        if headers:
+            request_headers = dict(request_headers, **headers)
+        if self.singleflight is None:
+            return await self._request(
+                'GET', url, params=params, headers=request_headers)
+        return await self.singleflight.do(
+            flight_key(url, params, headers), self._request,
+            'GET', url, params=params, headers=request_headers)
+
+    async def _post(self, url, **kwargs):
+        """
+        Wraps a POST request with standard parameters
+        """
+        return await self._request('POST', url, **kwargs)
+
+
+class AsyncOrloClient(AsyncBaseClient):
+    """
+    Asyncio reference object to our Orlo server
+
+    Mirrors OrloClient method for method, see there for documentation.
+    """
+
+    def __init__(self, uri, timeout=10, verify_ssl=True, pool_maxsize=100,
+                 pool_maxsize_per_host=0, keep_alive=True, coalesce=True):
+        super(AsyncOrloClient, self).__init__(
+            timeout=timeout,
+            verify_ssl=verify_ssl,
+            pool_maxsize=pool_maxsize,
+            pool_maxsize_per_host=pool_maxsize_per_host,
+            keep_alive=keep_alive,
+            coalesce=coalesce,
+        )
+        self.uri = uri
+
+    async def flush(self, timeout=None):
+        """
+        Present for parity with OrloClient. Package events are always sent
+        as they are made, there is never anything queued
+        """
+        return True
+
+    @staticmethod
+    async def _expect_200_json_response(response, status_code=200):
+        """
+        Check for an appropriate status code
+
+        :param response: aiohttp response object, with the body read
+        :param int status_code: The expected status_code
+        :return dict:
+        """
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Response %s:\n%s", response.status,
+                         await response.text())
+
+        if response.status == 204:
+            return True
+        elif response.status == status_code:
+            try:
+                return jsoncodec.loads(response.body_bytes)
+            except ValueError:
+                raise ClientError(
+                    "Could not decode json from Orlo response:\n{}".format(
+                        await response.text()))
+        else:
+            msg = "Orlo server returned code {code}:\n{text}".format(
+                code=response.status, text=await response.text())
+
+            if response.status in (301, 302):
+                raise ServerError("Got redirect while attempting to POST")
+            elif response.status >= 500:
+                raise ServerError(msg)
+            else:
+                raise ClientError(msg)
+
+    async def ping(self):
+        response = await self._get(self.uri + '/ping')
+        return response.status == 200
+
+    async def get_release(self, release_id):
+        response_dict = await self.get_release_json(release_id)
+
+        if len(response_dict['releases']) > 1:
+            raise ServerError("Got list of length > 1")
+
+        return AsyncRelease(self, response_dict['releases'][0]['id'],
+                            data=response_dict)
+
+    async def get_releases(self, raw=False, **kwargs):
+        response = await self._get(
+            "{url}/releases".format(url=self.uri), params=kwargs)
+        response_dict = await self._expect_200_json_response(response)
+
+        if raw:
+            return response_dict['releases']
+        else:
+            return AsyncRelease.from_dicts(self, response_dict['releases'])
+
+    async def iter_releases(self, raw=False, page_size=100, **kwargs):
+        async for r in self._iter_pages('releases', page_size, kwargs):
+            yield r if raw else AsyncRelease.from_dict(self, r)
+
+    async def stream_releases(self, raw=False, chunk_size=65536, **kwargs):
+        async for r in self._stream_collection('releases', chunk_size, kwargs):
+            yield r if raw else AsyncRelease.from_dict(self, r)
+
+    async def watch(self, release_ids, interval=1.0, max_interval=30.0,
+                    backoff=1.5, timeout=None, batch=True):
+        """
+        Yield an event for each change to the releases, until all are finished
+
+        See OrloClient.watch.
+        """
+        tracker = ReleaseTracker(release_ids)
+        wait = Interval(interval, max_interval, backoff)
+        loop = asyncio.get_event_loop()
+        deadline = None if timeout is None else loop.time() + timeout
+        # See watch.watch
+        last = {}
+
+        while tracker.active:
+            releases = await self._watch_poll(tracker, last, batch)
+            changed = False
+            for release in releases:
+                for event in tracker.update(release):
+                    changed = True
+                    yield event
+            if not tracker.active:
+                return
+
+            delay = wait.next(changed)
+            if deadline is not None:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    return
+                delay = min(delay, remaining)
+            await asyncio.sleep(delay)
+
+    async def _watch_poll(self, tracker, last, batch):
+        """
+        Fetch the active releases, see watch._poll
+        """
+        releases = []
+        missing = list(tracker.active)
+        stime_after = tracker.stime_after()
+        if batch and len(missing) > 1 and stime_after is not None:
+            document = await self._watch_get(
+                "{url}/releases".format(url=self.uri),
+                {'stime_after': stime_after}, last)
+            if document is not None:
+                found = dict((r['id'], r)
+                             for r in document.get('releases', ()))
+                releases = [found[rid] for rid in missing if rid in found]
+                missing = [rid for rid in missing if rid not in found]
+
+        documents = await asyncio.gather(*[
+            self._watch_get("{url}/releases/{rid}".format(
+                url=self.uri, rid=rid), None, last) for rid in missing])
+        for document in documents:
+            releases.extend(document['releases'])
+        return releases
+
+    async def _watch_get(self, url, params, last):
+        """
+        GET a document conditionally, see watch._get
+        """
+        key, validators, previous = conditional(last, url, params)
+        response = await self._get(url, params=params, headers=validators)
+        if response.status == 304 and previous is not None:
+            return previous
+        if response.status == 404 and params is not None:
+            return None
+        document = await self._expect_200_json_response(response)
+        remember(last, key, response.headers, document)
+        return document
+
+    async def get_releases_by_id(self, release_ids, max_workers=None):
+        async def fetch(release_id):
+            releases = (await self.get_release_json(release_id))['releases']
+            if not releases:
+                raise ClientError("Release {} not found".format(release_id))
+            return AsyncRelease.from_dict(self, releases[0])
+        return await self._get_by_id(fetch, release_ids, max_workers)
+
+    async def get_packages_by_id(self, package_ids, max_workers=None):
+        async def fetch(package_id):
+            packages = (await self.get_package_json(package_id))['packages']
+            if not packages:
+                raise ClientError("Package {} not found".format(package_id))
+            return Package.from_dict(packages[0])
+        return await self._get_by_id(fetch, package_ids, max_workers)
+
+    async def _get_by_id(self, fetch, ids, max_workers):
+        """
+        See OrloClient._get_by_id
+        """
+        ids = list(ids)
+        results = dict(
+            (r.item, r) for r in await run_bulk(
+                fetch, OrderedDict.fromkeys(ids),
+                max_workers or self.pool_maxsize))
+        return [results[i] for i in ids]
+
+    async def get_release_json(self, release_id):
+        url = "{url}/releases/{rid}".format(url=self.uri, rid=release_id)
+        response = await self._get(url)
+        return await self._expect_200_json_response(response)
+
+    async def get_package_json(self, package_id):
+        url = "{url}/packages/{pid}".format(url=self.uri, pid=package_id)
+        response = await self._get(url)
+        return await self._expect_200_json_response(response)
+
+    async def create_release(self, user, platforms,
+                             team=None, references=None, note=None,
+                             metadata=None):
+        data = {
+            'platforms': platforms,
+            'user': user,
+        }
+
+        if team:
+            data['team'] = team
+        if references:
+            data['references'] = references
+        if note:
+            data['note'] = note
+        if metadata:
+            data['metadata'] = metadata
+
+        response = await self._post(
+            '{}/releases'.format(self.uri),
+            json=data,
+            allow_redirects=False,
+        )
+
+        doc = await self._expect_200_json_response(response)
+        return AsyncRelease(self, doc['id'])
+
+    async def create_package(self, release, name, version):
+        response = await self._post(
+            '{}/releases/{}/packages'.format(self.uri, release.release_id),
+            json={
+                'name': name,
+                'version': version,
+            },
+            allow_redirects=False,
+        )
+
+        pkg = await self._expect_200_json_response(response)
+        return Package(release.id, pkg['id'], name, version)
+
+    async def create_packages(self, release, packages, max_workers=None):
+        return await run_bulk(
+            lambda p: self.create_package(release, p[0], p[1]),
+            packages, max_workers or self.pool_maxsize,
+        )
+
+    @staticmethod
+    def release_start():
+        """
+        Releases are automatically started when they are created
+        """
+        pass
+
+    async def release_stop(self, release):
+        response = await self._post(
+            '{}/releases/{}/stop'.format(self.uri, release.release_id),
+            allow_redirects=False,
+        )
+        return await self._expect_200_json_response(response, status_code=204)
+
+    async def get_package(self, package_id):
+        response_dict = await self.get_package_json(package_id)
+
+        packages_list = [
+            Package.from_dict(p) for p in response_dict['packages']
+        ]
+        if len(packages_list) > 1:
+            raise ServerError("Got list of length > 1")
+
+        return packages_list[0]
+
+    async def get_packages(self, raw=False, **kwargs):
+        response = await self._get(
+            "{url}/packages".format(url=self.uri), params=kwargs)
+        response_dict = await self._expect_200_json_response(response)
+
+        if raw:
+            return response_dict['packages']
+        else:
+            return Package.from_dicts(response_dict['packages'])
+
+    async def iter_packages(self, raw=False, page_size=100, **kwargs):
+        async for p in self._iter_pages('packages', page_size, kwargs):
+            yield p if raw else Package.from_dict(p)
+
+    async def stream_packages(self, raw=False, chunk_size=65536, **kwargs):
+        async for p in self._stream_collection('packages', chunk_size, kwargs):
+            yield p if raw else Package.from_dict(p)
+
+    async def export_releases(self, format=None, **kwargs):
+        releases = [r async for r in self.stream_releases(raw=True, **kwargs)]
+        return columnar.release_columns(releases, format=format)
+
+    async def export_packages(self, format=None, **kwargs):
+        packages = [p async for p in self.stream_packages(raw=True, **kwargs)]
+        return columnar.package_columns(packages, format=format)
+
+    async def _stream_collection(self, collection, chunk_size, filters):
+        """
+        Yield the items of a collection as they are parsed from the response
+
+        See OrloClient._stream_collection.
+        """
+        url = "{url}/{collection}".format(url=self.uri, collection=collection)
+        params = _query(filters)
+        logger.debug("GET args: %s, kwargs: %s", url, params)
+        try:
+            async with self.session.get(
+                    url, params=params, headers=self.get_headers) as response:
+                if response.status != 200:
+                    response.body_bytes = await response.read()
+                    if response.status == 404:
+                        try:
+                            body = jsoncodec.loads(response.body_bytes)
+                            if body.get(collection) == []:
+                                return
+                        except ValueError:
+                            pass
+                    await self._expect_200_json_response(response)
+                    return
+
+                parser = ArrayItemParser(collection)
+                async for chunk in response.content.iter_chunked(chunk_size):
+                    for item in parser.feed(chunk):
+                        yield item
+                    if parser.done:
+                        break
+                for item in parser.close():
+                    yield item
+        except aiohttp.ClientConnectionError as e:
+            raise ConnectionError(
+                "{} while connecting to Orlo server at {}.".format(
+                    e.__class__.__name__, url)
+            )
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            raise ServerError(
+                "Could not read from Orlo server at {u}; aiohttp raised {e}: {m}".format(
+                    u=url, e=e.__class__.__name__, m=e
+                ))
+
+    async def _iter_pages(self, collection, page_size, filters):
+        """
+        Yield the items of a collection, prefetching the next page
+
+        See OrloClient._iter_pages.
+        """
+        filters = dict(filters)
+        limit = filters.pop('limit', None)
+        remaining = int(limit) if limit is not None else None
+        offset = int(filters.pop('offset', 0))
+        url = "{url}/{collection}".format(url=self.uri, collection=collection)
+
+        async def fetch(offset, count):
+            params = dict(filters, limit=count, offset=offset)
+            response = await self._get(url, params=params)
+            if response.status == 404:
+                # Orlo answers 404 with an empty list when nothing matches
+                try:
+                    body = jsoncodec.loads(response.body_bytes)
+                    if body.get(collection) == []:
+                        return []
+                except ValueError:
+                    pass
+            return (await self._expect_200_json_response(response))[collection]
+
+        def next_count():
+            if remaining is None:
+                return page_size
+            return min(page_size, remaining)
+
+        count = next_count()
+        task = asyncio.ensure_future(fetch(offset, count)) if count else None
+        try:
+            while task is not None:
+                page = await task
+                offset += len(page)
+                if remaining is not None:
+                    remaining -= len(page)
+
+                task = None
+                if len(page) == count:
+                    count = next_count()
+                    if count:
+                        task = asyncio.ensure_future(fetch(offset, count))
+
+                for item in page:
+                    yield item
+        finally:
+            if task is not None:
+                task.cancel()
+
+    async def package_start(self, package):
+        response = await self._post(
+            '{}/releases/{}/packages/{}/start'.format(
+                self.uri, package.release_id, package.id),
+            allow_redirects=False,
+        )
+        return await self._expect_200_json_response(response, status_code=204)
+
+    async def package_stop(self, package, success=True):
+        response = await self._post(
+            '{}/releases/{}/packages/{}/stop'.format(
+                self.uri, package.release_id, package.id),
+            json={
+                'success': success,
+            },
+            allow_redirects=False,
+        )
+        return await self._expect_200_json_response(response, status_code=204)
+
+    async def packages_start(self, packages, max_workers=None):
+        return await run_bulk(
+            self.package_start, packages, max_workers or self.pool_maxsize)
+
+    async def packages_stop(self, packages, success=True, max_workers=None):
+        if isinstance(success, dict):
+            packages = list(packages)
+            success = success_by_package(packages, success)
+
+            def stop(package):
+                return self.package_stop(
+                    package, success=success[str(package.id)])
+        else:
+            def stop(package):
+                return self.package_stop(package, success=success)
+
+        return await run_bulk(stop, packages, max_workers or self.pool_maxsize)
+
+    async def package_add_results(self, package, results):
+        response = await self._post(
+            '{}/releases/{}/packages/{}/results'.format(
+                self.uri, package.release_id, package.id),
+            json={
+                'content': results,
+            },
+            allow_redirects=False,
+        )
+        return await self._expect_200_json_response(response, status_code=204)
+
+    async def get_info(self, field, name=None, platform=None):
+        url_path = {
+            'uri': self.uri,
+            'field': field if field else '',
+            'name': '/' + name if name else '',
+        }
+
+        response = await self._get(
+            '{uri}/info/{field}{name}'.format(**url_path),
+            params={'platform': platform},
+        )
+        return await self._expect_200_json_response(response)
+
+    async def get_stats(self, field=None, name=None, platform=None,
+                        stime=None, ftime=None):
+        url_path = {
+            'uri': self.uri,
+            'field': '/' + field if field else '',
+            'name': '/' + name if name else '',
+        }
+
+        response = await self._get(
+            '{uri}/stats{field}{name}'.format(**url_path),
+            params={'platform': platform, 'stime': stime, 'ftime': ftime},
+        )
+        return await self._expect_200_json_response(response)
+
+    async def get_versions(self, platform=None):
+        url = "{url}/info/packages/versions{platform}".format(
+            url=self.uri,
+            platform=platform if platform else ''
+        )
+        response = await self._get(url)
+        return await self._expect_200_json_response(response)
+
+
+class AsyncRelease(Release):
+    """
+    A Release whose data is fetched with an awaitable
+
+    Attribute access cannot block, so the data must be loaded first with
+    "await release.fetch()", or fetched on demand with
+    "await release.get('stime')". Releases returned by the client are
+    pre-hydrated. Package objects never fetch anything lazily, so the ones
+    in "packages" are plain Package instances.
+    """
+
+    def __getattr__(self, item):
+        if self.stale:
+            raise ClientError(
+                "Release {} is not loaded or stale, await fetch() or "
+                "get('{}') first".format(self.release_id, item))
+        return super(AsyncRelease, self).__getattr__(item)
+
+    async def fetch(self):
+        """
+        Fetch the data for a release
+        """
+        self._set_data(await self.client.get_release_json(self.release_id))
+
+    async def refresh(self):
+        """
+        Fetch the current state of the release, regardless of staleness
+        """
+        await self.fetch()
+        return self
+
+    async def get(self, item):
+        """
+        Return an attribute, fetching the release first if required
+
+        :param string item: The attribute name
+        """
+        if self.stale:
+            await self.fetch()
+        return getattr(self, item)
+
+    async def add_package(self, name, version):
+        """
+        Create a package and add it to this release
+
+        :param name:
+        :param version:
+        """
+        return await self.client.create_package(self, name, version)
+
+    async def add_packages(self, packages, max_workers=None):
+        """
+        Create several packages concurrently and add them to this release
+
+        :param list packages: List of (name, version) tuples
+        :param int max_workers: Maximum concurrent requests
+        :return list: BulkResult for each (name, version), in the order given
+        """
+        return await self.client.create_packages(
+            self, packages, max_workers=max_workers)
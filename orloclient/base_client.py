@@ -1,7 +1,13 @@
 from __future__ import print_function
 import requests
 import logging
-from .exceptions import ConnectionError, ServerError
+import threading
+from timeit import default_timer
+from requests.adapters import HTTPAdapter
+from .exceptions import CircuitOpenError, ConnectionError, ServerError
+from .instrumentation import RequestEvent, body_size, emit, endpoint_name
+from .retry import CircuitBreakers, RetryPolicy
+from .singleflight import SingleFlight, flight_key
 
 __author__ = 'alforbes'
 
@@ -18,40 +24,196 @@ OrloError.
 
 
 class BaseClient(object):
-    def __init__(self, timeout=10, verify_ssl=True):
+    def __init__(self, timeout=10, verify_ssl=True, pool_connections=10,
+                 pool_maxsize=10, keep_alive=True, max_retries=0, retry=None,
+                 circuit_breaker=None, coalesce=True, hooks=None):
+        """
+        :param int timeout: Timeout for each request, in seconds
+        :param bool verify_ssl: Verify TLS certificates
+        :param int pool_connections: Number of per-host connection pools to
+            keep
+        :param int pool_maxsize: Maximum number of connections kept open to
+            a single host
+        :param bool keep_alive: Re-use connections between requests. When
+            False, every request asks the server to close the connection
+        :param max_retries: Retries for failed connections, passed to the
+            transport adapter. Either an int or a urllib3 Retry object
+        :param RetryPolicy retry: When to retry failed requests, see retry.py.
+            Defaults to retrying GETs; pass False to never retry
+        :param circuit_breaker: CircuitBreakers, possibly shared with other
+            clients, or True for one with default settings. Off by default
+        :param bool coalesce: Have concurrent identical GETs share one
+            request, see singleflight.py
+        :param list hooks: Instrumentation hooks, called with an event for
+            each request, see instrumentation.py
+        """
         self.request_args = {
             'timeout': timeout,
             'verify': verify_ssl
         }
         self.get_headers = {'Content-Type': 'application/json'}
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+        self.keep_alive = keep_alive
+        self.max_retries = max_retries
+        self.retry = RetryPolicy() if retry is None else retry or None
+        if circuit_breaker is True:
+            circuit_breaker = CircuitBreakers()
+        self.circuit_breakers = circuit_breaker or None
+        self.singleflight = SingleFlight() if coalesce else None
+        self.hooks = list(hooks or [])
+
+        self._session = None
+        self._session_lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    @property
+    def session(self):
+        """
+        The pooled requests Session, created on first use
 
-    def _get(self, *args, **kwargs):
+        A Session is safe to share between threads as long as its
+        configuration is not changed, so one is kept per client.
+        """
+        if self._session is None:
+            with self._session_lock:
+                if self._session is None:
+                    self._session = self._new_session()
+        return self._session
+
+    def _new_session(self):
+        session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=self.pool_connections,
+            pool_maxsize=self.pool_maxsize,
+            max_retries=self.max_retries,
+        )
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        if not self.keep_alive:
+            session.headers['Connection'] = 'close'
+        return session
+
+    def close(self):
+        """
+        Release pooled connections
+
+        The client can still be used afterwards, a new pool is created on the
+        next request.
+        """
+        with self._session_lock:
+            session, self._session = self._session, None
+        if session is not None:
+            session.close()
+
+    def _request(self, method, url, **kwargs):
+        """
+        Make a request, retrying and circuit breaking as configured
+
+        Raises the requests exception of the last attempt. Hooks are called
+        with a RequestEvent once the request has succeeded or failed.
+        """
+        breaker = None
+        if self.circuit_breakers is not None:
+            breaker = self.circuit_breakers.get(url)
+        hooks = self.hooks
+        start = default_timer() if hooks else None
+        attempt = 0
+        try:
+            while True:
+                if breaker is not None and not breaker.allow():
+                    raise CircuitOpenError(
+                        "Not connecting to Orlo server at {}, too many recent "
+                        "requests failed".format(url))
+                error = response = None
+                try:
+                    response = self.session.request(method, url, **kwargs)
+                except requests.exceptions.RequestException as e:
+                    error = e
+                if breaker is not None:
+                    breaker.record(
+                        error is None and response.status_code < 500)
+
+                delay = None
+                if self.retry is not None:
+                    delay = self.retry.next_delay(
+                        method, attempt, error=error, response=response)
+                if delay is None:
+                    if error is not None:
+                        raise error
+                    if hooks:
+                        # A streamed body has not been read yet
+                        emit(hooks, RequestEvent(
+                            method, endpoint_name(url), response.status_code,
+                            default_timer() - start,
+                            response.elapsed.total_seconds(),
+                            body_size(getattr(response.request, 'body', None)),
+                            None if kwargs.get('stream') else
+                            len(response.content), attempt, None))
+                    return response
+
+                logger.debug("%s %s failed (%s), retrying in %.2fs",
+                             method, url, error or response.status_code, delay)
+                if response is not None:
+                    # Return the connection to the pool, a streamed body
+                    # has not been read
+                    response.close()
+                self.retry.sleep(delay)
+                attempt += 1
+        except Exception as e:
+            if hooks:
+                emit(hooks, RequestEvent(
+                    method, endpoint_name(url), None, default_timer() - start,
+                    None, None, None, attempt, e.__class__.__name__))
+            raise
+
+    def _get(self, url, **kwargs):
         """
         Wraps a GET request with standard parameters
+
+        Identical GETs made while one is in flight wait for it and share its
+        response, or its exception.
+        """
+        if self.singleflight is None:
+            return self._single_get(url, **kwargs)
+        key = flight_key(url, kwargs.get('params'), kwargs.get('headers'))
+        return self.singleflight.do(key, self._single_get, url, **kwargs)
+
+    def _single_get(self, *args, **kwargs):
+        """
+        Make a GET request, translating requests exceptions
         """
         try:
             req_kw_args = self.request_args.copy()
             req_kw_args.update(kwargs)
-            logger.debug("Get args: {}, kwargs: {}".format(args, req_kw_args))
-            return requests.get(
+            headers = self.get_headers
+            if 'headers' in req_kw_args:
+                headers = dict(headers, **req_kw_args.pop('headers'))
+            logger.debug("Get args: %s, kwargs: %s", args, req_kw_args)
+            return self._request(
+                'GET',
                 *args,
-                headers=self.get_headers,
+                headers=headers,
                 **req_kw_args
             )
         except (requests.exceptions.ConnectionError,
                 requests.exceptions.ConnectTimeout) as e:
-            logger.debug('Requests exception: {}\n{}'.format(
-                e.__class__.__name__, e.message
-            ))
+            logger.debug('Requests exception: %s\n%s',
+                         e.__class__.__name__, e)
             raise ConnectionError(
                 "{} while connecting to Orlo server at {}.".format(
                     e.__class__.__name__, args[0])
             )
         except requests.exceptions.RequestException as e:
-            logger.debug(e.message)
+            logger.debug(e)
             raise ServerError(
                 "Could not read from Orlo server, requests raised {}: {}".format(
-                    e.__class__.__name__, e.message
+                    e.__class__.__name__, e
                 ))
 
 
@@ -62,8 +224,9 @@ class BaseClient(object):
         try:
             req_kw_args = self.request_args.copy()
             req_kw_args.update(kwargs)
-            logger.debug("Post args: {}, kwargs: {}".format(args, req_kw_args))
-            return requests.post(
+            logger.debug("Post args: %s, kwargs: %s", args, req_kw_args)
+            return self._request(
+                'POST',
                 *args,
                 **req_kw_args
             )
@@ -73,8 +236,8 @@ class BaseClient(object):
                 "Could not connect to Orlo server at {}".format(args[0])
             )
         except requests.exceptions.RequestException as e:
-            logger.debug(e.message)
+            logger.debug(e)
             raise ServerError(
                 "Could not read from Orlo server at {u}; requests raised {e}: {m}".format(
-                    u=args[0], e=e.__class__.__name__, m=e.message
+                    u=args[0], e=e.__class__.__name__, m=e
                 ))
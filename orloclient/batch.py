@@ -0,0 +1,290 @@
+from __future__ import print_function
+import json
+import logging
+import re
+import shlex
+import threading
+from collections import deque
+from six import string_types
+from .capture import Captured
+from .exceptions import ClientError
+
+__author__ = 'alforbes'
+
+logger = logging.getLogger(__name__)
+
+"""
+Batch mode for the command line client
+
+"orloclient batch" reads one command per line and runs them all in one
+process, with one client. A line is either the arguments to a subcommand, as
+on the command line:
+
+    create-package 2cbd2ed4-0b8a-4c7e-8fc1-5b7a7c6a9a40 my-package 1.0.2
+
+or a JSON object naming the subcommand and its arguments, keyed by argparse
+destination (as shown by --debug):
+
+    {"command": "create-package", "release": "2cbd2ed4-...", "name": "my-package", "version": "1.0.2"}
+
+An argument of "$N" is replaced with the id of the release or package created
+by line N, so that a whole rollout can be written up front:
+
+    create-release -u alex -p web
+    create-package $1 my-package 1.0.2
+    start $2
+    stop $2
+
+Blank lines and lines starting with "#" are skipped. One JSON result is
+written per command, in input order.
+
+With more than one job, commands run concurrently, except that a command
+waits for earlier ones operating on the same release or package id, and for
+the lines it refers to.
+"""
+
+REFERENCE = re.compile(r'^\$(\d+)$')
+
+
+def object_argv(obj, subparsers):
+    """
+    Turn a command given as a JSON object into command line arguments
+
+    :param dict obj: The command, with the subcommand name under "command"
+    :param dict subparsers: Subcommand name to its ArgumentParser
+    :return: List of arguments, starting with the subcommand
+    """
+    obj = dict((k.replace('-', '_'), v) for k, v in obj.items())
+    name = obj.pop('command', None)
+    if name not in subparsers:
+        raise ClientError("Unknown command {!r}".format(name))
+
+    argv = [name]
+    positionals = []
+    for action in subparsers[name]._actions:
+        if action.dest not in obj:
+            continue
+        value = obj.pop(action.dest)
+        values = value if isinstance(value, list) else [value]
+        values = [v if isinstance(v, string_types) else json.dumps(v)
+                  for v in values]
+        if not action.option_strings:
+            positionals.extend(values)
+        elif action.nargs == 0:  # A flag, e.g. --packages
+            if value:
+                argv.append(action.option_strings[-1])
+        elif value is not None:
+            argv.append(action.option_strings[-1])
+            argv.extend(values)
+    if obj:
+        raise ClientError("Unknown arguments for {}: {}".format(
+            name, ', '.join(sorted(obj))))
+    if positionals:
+        # After "--", in case a value starts with a hyphen
+        argv += ['--'] + positionals
+    return argv
+
+
+def parse_line(line, subparsers):
+    """
+    Return the command line arguments for a line, or None if there are none
+    """
+    line = line.strip()
+    if not line or line.startswith('#'):
+        return None
+    if line.startswith('{'):
+        try:
+            obj = json.loads(line)
+        except ValueError as e:
+            raise ClientError("Invalid JSON: {}".format(e))
+        return object_argv(obj, subparsers)
+    return shlex.split(line)
+
+
+class _Command(object):
+    def __init__(self, line, argv):
+        self.line = line
+        self.argv = argv
+        self.args = None
+        self.refs = []
+        self.deps = []
+        self.result = None
+        self.done = threading.Event()
+
+    @property
+    def id(self):
+        """
+        The id of the release or package this command created, if any
+        """
+        value = self.result.value if self.result else None
+        return getattr(value, 'id', None)
+
+    def to_dict(self):
+        return {
+            'line': self.line,
+            'command': self.argv,
+            'status': self.result.status,
+            'id': self.id,
+            'stdout': self.result.stdout,
+            'stderr': self.result.stderr,
+        }
+
+
+class Batch(object):
+    """
+    Run commands from lines of input and write a JSON result for each
+    """
+    # Arguments identifying what a command operates on
+    KEYS = ('release', 'package')
+
+    def __init__(self, parse, execute, capture, subparsers, jobs=1,
+                 executor=None):
+        """
+        :param parse: Function parse(argv) returning an argparse Namespace
+        :param execute: Function execute(args) running a parsed command
+        :param OutputCapture capture: Installed output capture
+        :param dict subparsers: Subcommand name to its ArgumentParser, for
+            JSON commands
+        :param int jobs: Number of commands to run at once
+        :param executor: concurrent.futures Executor with at least jobs
+            workers, required when jobs is more than 1
+        """
+        self.parse = parse
+        self.execute = execute
+        self.capture = capture
+        self.subparsers = subparsers
+        self.jobs = jobs
+        self.executor = executor
+
+        self.failed = 0
+        self._commands = {}
+        self._last = {}
+
+    def _prepare(self, line, text):
+        """
+        Parse a line, returning a _Command, or None if there is nothing to run
+        """
+        state = {}
+
+        def parse():
+            argv = parse_line(text, self.subparsers)
+            if argv is None:
+                return None
+            state['argv'] = argv
+            if argv[0].startswith('-'):
+                raise ClientError(
+                    "Options before the command are taken from the batch "
+                    "command line")
+            return self.parse(argv)
+
+        captured = self.capture.run(parse)
+        if captured.status == 0 and captured.value is None:
+            return None
+
+        command = self._commands[line] = _Command(
+            line, state.get('argv', text.strip()))
+        if captured.status != 0:
+            command.result = captured
+            command.done.set()
+            return command
+
+        command.args = captured.value
+        for arg in command.argv:
+            match = REFERENCE.match(arg)
+            if not match:
+                continue
+            number = int(match.group(1))
+            ref = self._commands.get(number) if number < line else None
+            if ref is None:
+                command.result = Captured(
+                    2, '', 'Line {} refers to {}, which is not an earlier '
+                           'command\n'.format(line, arg), None)
+                command.done.set()
+                return command
+            command.refs.append(ref)
+
+        command.deps = list(command.refs)
+        for key in self.KEYS:
+            value = getattr(command.args, key, None)
+            if value is None:
+                continue
+            previous = self._last.get((key, value))
+            if previous is not None:
+                command.deps.append(previous)
+            self._last[(key, value)] = command
+        return command
+
+    def _resolve(self, value):
+        """
+        Replace references in an argument value
+        """
+        if isinstance(value, list):
+            return [self._resolve(v) for v in value]
+        match = (REFERENCE.match(value) if isinstance(value, string_types)
+                 else None)
+        if not match:
+            return value
+        ref = self._commands[int(match.group(1))]
+        if ref.id is None:
+            raise ClientError(
+                "Line {} did not create a release or package".format(
+                    ref.line))
+        return ref.id
+
+    def _run(self, command):
+        try:
+            for dep in command.deps:
+                dep.done.wait()
+            failed = [r.line for r in command.refs if r.result.status != 0]
+            if failed:
+                command.result = Captured(
+                    1, '', 'Skipped, line {} failed\n'.format(failed[0]), None)
+                return
+
+            def execute():
+                args = command.args
+                for name, value in vars(args).items():
+                    setattr(args, name, self._resolve(value))
+                return self.execute(args)
+            command.result = self.capture.run(execute)
+        finally:
+            command.done.set()
+
+    def _emit(self, command, output):
+        if command.result.status != 0:
+            self.failed += 1
+        output.write(json.dumps(command.to_dict()) + '\n')
+        output.flush()
+        # Later commands only need the result, to resolve references
+        command.args = command.deps = command.refs = None
+
+    def run(self, lines, output):
+        """
+        Run every command, writing results to output as they complete
+
+        :param lines: Iterable of input lines
+        :param output: File-like object to write results to
+        :return: Number of commands that failed
+        """
+        pending = deque()
+        for line, text in enumerate(lines, 1):
+            command = self._prepare(line, text)
+            if command is None:
+                continue
+            if not command.done.is_set():
+                if self.jobs > 1:
+                    self.executor.submit(self._run, command)
+                else:
+                    self._run(command)
+            pending.append(command)
+
+            # Write results in order, without reading too far ahead
+            while pending and (pending[0].done.is_set() or
+                               len(pending) > self.jobs * 4):
+                pending[0].done.wait()
+                self._emit(pending.popleft(), output)
+
+        while pending:
+            pending[0].done.wait()
+            self._emit(pending.popleft(), output)
+        return self.failed
@@ -0,0 +1,73 @@
+from __future__ import print_function
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from .exceptions import ClientError
+
+__author__ = 'alforbes'
+
+"""
+Helpers for issuing many requests at once
+"""
+
+
+class BulkResult(namedtuple('BulkResult', ['item', 'result', 'error'])):
+    """
+    The outcome of one operation in a bulk call
+
+    :ivar item: The input the operation was called with
+    :ivar result: The return value of the operation, None if it failed
+    :ivar error: The exception raised by the operation, None if it succeeded.
+        Usually an OrloError
+    """
+    __slots__ = ()
+
+    @property
+    def ok(self):
+        return self.error is None
+
+
+def run_bulk(func, items, max_workers):
+    """
+    Call func on each item concurrently
+
+    Errors are collected per item, so that one failure does not stop or hide
+    the others. This includes unexpected exceptions, which would otherwise
+    lose the results of every other item.
+
+    :param func: Function taking a single item
+    :param items: Iterable of items
+    :param int max_workers: Maximum number of concurrent calls
+    :return list: BulkResult for each item, in the order given
+    """
+    def call(item):
+        try:
+            return BulkResult(item, func(item), None)
+        except Exception as e:
+            return BulkResult(item, None, e)
+
+    items = list(items)
+    if not items:
+        return []
+
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(items))) as pool:
+        return list(pool.map(call, items))
+
+
+def success_by_package(packages, success):
+    """
+    The success value of each package, for packages_stop
+
+    Package ids are UUIDs or strings depending on where the Package came
+    from, so both sides are compared as strings.
+
+    :param list packages: Package objects
+    :param dict success: Package id to boolean
+    :return dict: String package id to boolean
+    """
+    success = dict((str(k), v) for k, v in success.items())
+    missing = [str(p.id) for p in packages if str(p.id) not in success]
+    if missing:
+        raise ClientError(
+            "No success value given for packages: {}".format(
+                ', '.join(missing)))
+    return success
@@ -0,0 +1,397 @@
+from __future__ import print_function
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+__author__ = 'alforbes'
+
+"""
+Client-side caching of GET responses
+
+The cache stores decoded JSON documents keyed by URL and query. Each endpoint
+has its own TTL; endpoints without one are never cached. Once an entry
+expires it is kept until evicted, so that it can be revalidated with
+If-None-Match / If-Modified-Since when the server sent an ETag or
+Last-Modified header.
+
+Documents returned from the cache are shared between callers, do not modify
+them.
+
+Finished releases (all with an ftime) do not change, so release documents
+are cached without expiry once finished. Writes through the client still
+invalidate them.
+"""
+
+
+def _finished(document):
+    """
+    Whether a release document only contains finished releases
+    """
+    try:
+        releases = document['releases']
+    except (KeyError, TypeError):
+        return False
+    return bool(releases) and all(r.get('ftime') for r in releases)
+
+
+class CacheEntry(object):
+    __slots__ = ('value', 'endpoint', 'expires', 'etag', 'last_modified')
+
+    def __init__(self, value, endpoint, expires, etag=None,
+                 last_modified=None):
+        self.value = value
+        self.endpoint = endpoint
+        self.expires = expires
+        self.etag = etag
+        self.last_modified = last_modified
+
+    @property
+    def fresh(self):
+        return self.expires is None or self.expires > time.time()
+
+    @property
+    def validators(self):
+        """
+        Headers for a conditional request revalidating this entry
+        """
+        headers = {}
+        if self.etag:
+            headers['If-None-Match'] = self.etag
+        if self.last_modified:
+            headers['If-Modified-Since'] = self.last_modified
+        return headers
+
+
+class ResponseCache(object):
+    """
+    Thread-safe in-memory cache with per-endpoint TTL and LRU eviction
+
+    Endpoints are named after the OrloClient method that reads them:
+    release, releases, package, packages, info, stats and versions.
+    """
+    DEFAULT_TTL = {
+        'info': 5,
+        'stats': 5,
+        'versions': 5,
+    }
+    # Keys whose invalidations are counted, before starting again
+    MAX_KEY_GENERATIONS = 10000
+
+    def __init__(self, maxsize=1024, ttl=None):
+        """
+        :param int maxsize: Maximum number of entries
+        :param dict ttl: Endpoint name to TTL in seconds. Endpoints not listed
+            are not cached, a TTL of None caches until evicted
+        """
+        self.maxsize = maxsize
+        self.ttl = dict(self.DEFAULT_TTL if ttl is None else ttl)
+
+        self.hits = 0
+        self.misses = 0
+        self.revalidations = 0
+        self.evictions = 0
+
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        # Invalidations so far, see generation()
+        self._epoch = 0
+        self._endpoint_generations = {}
+        self._key_generations = {}
+
+    @staticmethod
+    def key(url, params=None):
+        """
+        Build the cache key for a request
+
+        Parameters with a value of None are not sent, so are ignored.
+        """
+        if not params:
+            return url
+        query = '&'.join('{}={}'.format(k, v) for k, v in sorted(params.items())
+                         if v is not None)
+        return '{}?{}'.format(url, query) if query else url
+
+    def caches(self, endpoint):
+        return endpoint in self.ttl
+
+    def expiry(self, endpoint, value=None):
+        """
+        When an entry stored now for endpoint expires, None for never
+
+        :param string endpoint: Endpoint name
+        :param value: The document being stored
+        """
+        if endpoint == 'release' and _finished(value):
+            return None
+        ttl = self.ttl[endpoint]
+        return None if ttl is None else time.time() + ttl
+
+    def generation(self, key, endpoint):
+        """
+        A token for set(), read before requesting the document to store
+
+        Invalidating the key or endpoint changes the token, so that a document
+        fetched before a write is not stored after it.
+        """
+        with self._lock:
+            return self._generation(key, endpoint)
+
+    def _generation(self, key, endpoint):
+        """
+        generation(), called with the lock held
+        """
+        return (self._epoch, self._endpoint_generations.get(endpoint, 0),
+                self._key_generations.get(key, 0))
+
+    def _invalidated(self, endpoints=(), keys=()):
+        """
+        Count an invalidation, called with the lock held
+        """
+        for endpoint in endpoints:
+            self._endpoint_generations[endpoint] = \
+                self._endpoint_generations.get(endpoint, 0) + 1
+        for key in keys:
+            self._key_generations[key] = self._key_generations.get(key, 0) + 1
+        if len(self._key_generations) > self.MAX_KEY_GENERATIONS:
+            # Changes every token handed out so far
+            self._key_generations.clear()
+            self._epoch += 1
+
+    def _current(self, key, endpoint, generation):
+        """
+        Whether nothing was invalidated since generation was read
+        """
+        return generation is None or \
+            generation == self.generation(key, endpoint)
+
+    def get(self, key):
+        """
+        Return the entry for key, fresh or not, or None
+        """
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                # Re-insert to mark as most recently used
+                self._entries[key] = entry
+            return entry
+
+    def set(self, key, endpoint, value, etag=None, last_modified=None,
+            generation=None):
+        """
+        Store a document
+
+        :param generation: The generation() read before fetching it, the
+            document is not stored if the entry was invalidated since
+        """
+        entry = CacheEntry(value, endpoint, self.expiry(endpoint, value),
+                           etag=etag, last_modified=last_modified)
+        with self._lock:
+            if generation is not None and \
+                    generation != self._generation(key, endpoint):
+                return
+            self._entries.pop(key, None)
+            self._entries[key] = entry
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def touch(self, key):
+        """
+        Extend the life of an entry that the server confirmed is unchanged
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                entry.expires = self.expiry(entry.endpoint, entry.value)
+            self.revalidations += 1
+
+    def invalidate(self, endpoints=(), keys=()):
+        """
+        Drop entries
+
+        :param endpoints: Drop every entry for these endpoint names
+        :param keys: Drop these keys
+        """
+        with self._lock:
+            self._invalidated(endpoints, keys)
+            for key in keys:
+                self._entries.pop(key, None)
+            if endpoints:
+                for key in [k for k, e in self._entries.items()
+                            if e.endpoint in endpoints]:
+                    del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._epoch += 1
+            self._entries.clear()
+
+    def record(self, hit):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def stats(self):
+        """
+        Counters, for monitoring the hit rate
+        """
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'revalidations': self.revalidations,
+                'evictions': self.evictions,
+                'size': len(self._entries),
+            }
+
+    def __len__(self):
+        return len(self._entries)
+
+
+def default_cache_path():
+    """
+    ~/.cache/orloclient/responses.sqlite, honouring XDG_CACHE_HOME
+    """
+    base = os.environ.get('XDG_CACHE_HOME') or os.path.join(
+        os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'orloclient', 'responses.sqlite')
+
+
+class SQLiteResponseCache(ResponseCache):
+    """
+    Persistent cache in an SQLite file, shared between processes
+
+    Used by the command line client, so that repeated invocations don't fetch
+    the same documents again. SQLite's locking makes it safe for concurrent
+    processes; each thread uses its own connection. Entries are keyed by URL
+    and query, which includes the server URI. The hit/miss counters only count
+    this process.
+    """
+    DEFAULT_TTL = {
+        'info': 30,
+        'package': 30,
+        'release': 30,
+        'stats': 30,
+        'versions': 30,
+    }
+
+    def __init__(self, path=None, maxsize=4096, ttl=None, timeout=30):
+        """
+        :param string path: Database file, defaults to default_cache_path()
+        :param int maxsize: Maximum number of entries
+        :param dict ttl: Endpoint name to TTL in seconds, see ResponseCache
+        :param float timeout: Seconds to wait for another process's lock
+        """
+        super(SQLiteResponseCache, self).__init__(maxsize=maxsize, ttl=ttl)
+        self.path = path or default_cache_path()
+        self.timeout = timeout
+        self._local = threading.local()
+
+        directory = os.path.dirname(self.path)
+        if directory and not os.path.isdir(directory):
+            try:
+                os.makedirs(directory)
+            except OSError:  # Created by another process meanwhile
+                if not os.path.isdir(directory):
+                    raise
+        with self._db as db:
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                "key TEXT PRIMARY KEY, endpoint TEXT NOT NULL, "
+                "value TEXT NOT NULL, expires REAL, etag TEXT, "
+                "last_modified TEXT, accessed REAL NOT NULL)")
+            db.execute("CREATE INDEX IF NOT EXISTS entries_accessed "
+                       "ON entries (accessed)")
+            db.execute("CREATE INDEX IF NOT EXISTS entries_endpoint "
+                       "ON entries (endpoint)")
+
+    @property
+    def _db(self):
+        db = getattr(self._local, 'db', None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=self.timeout)
+            # WAL lets readers carry on while another process writes
+            db.execute("PRAGMA journal_mode=WAL")
+            self._local.db = db
+        return db
+
+    def get(self, key):
+        with self._db as db:
+            row = db.execute(
+                "SELECT value, endpoint, expires, etag, last_modified "
+                "FROM entries WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            db.execute("UPDATE entries SET accessed = ? WHERE key = ?",
+                       (time.time(), key))
+        value, endpoint, expires, etag, last_modified = row
+        return CacheEntry(json.loads(value), endpoint, expires,
+                          etag=etag, last_modified=last_modified)
+
+    def set(self, key, endpoint, value, etag=None, last_modified=None,
+            generation=None):
+        # Only invalidations made by this process are seen
+        if not self._current(key, endpoint, generation):
+            return
+        with self._db as db:
+            db.execute(
+                "INSERT OR REPLACE INTO entries "
+                "(key, endpoint, value, expires, etag, last_modified, accessed)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, endpoint, json.dumps(value),
+                 self.expiry(endpoint, value), etag, last_modified,
+                 time.time()))
+            excess = db.execute(
+                "SELECT COUNT(*) FROM entries").fetchone()[0] - self.maxsize
+            if excess > 0:
+                db.execute(
+                    "DELETE FROM entries WHERE key IN (SELECT key FROM entries "
+                    "ORDER BY accessed LIMIT ?)", (excess,))
+                with self._lock:
+                    self.evictions += excess
+
+    def touch(self, key):
+        entry = self.get(key)
+        if entry is not None:
+            with self._db as db:
+                db.execute("UPDATE entries SET expires = ? WHERE key = ?",
+                           (self.expiry(entry.endpoint, entry.value), key))
+        with self._lock:
+            self.revalidations += 1
+
+    def invalidate(self, endpoints=(), keys=()):
+        with self._lock:
+            self._invalidated(endpoints, keys)
+        with self._db as db:
+            for key in keys:
+                db.execute("DELETE FROM entries WHERE key = ?", (key,))
+            for endpoint in endpoints:
+                db.execute("DELETE FROM entries WHERE endpoint = ?",
+                           (endpoint,))
+
+    def clear(self):
+        with self._lock:
+            self._epoch += 1
+        with self._db as db:
+            db.execute("DELETE FROM entries")
+
+    def purge(self):
+        """
+        Delete expired entries that cannot be revalidated
+        """
+        with self._db as db:
+            db.execute("DELETE FROM entries WHERE expires < ? AND etag IS NULL "
+                       "AND last_modified IS NULL", (time.time(),))
+
+    def stats(self):
+        stats = super(SQLiteResponseCache, self).stats()
+        stats['size'] = len(self)
+        return stats
+
+    def __len__(self):
+        return self._db.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
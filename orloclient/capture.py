@@ -0,0 +1,143 @@
+from __future__ import print_function
+import logging
+import sys
+import threading
+from collections import namedtuple
+from six import StringIO
+from .exceptions import OrloError
+
+__author__ = 'alforbes'
+
+logger = logging.getLogger(__name__)
+
+"""
+Per-thread capture of command line output
+
+The command line actions print their results and log to the orloclient
+logger. The daemon and batch mode run several actions at once in threads, and
+need each one's output separately. While an OutputCapture is installed,
+sys.stdout, sys.stderr and the orloclient logger write to buffers belonging to
+the thread running the action, or to the original streams outside of run().
+"""
+
+Captured = namedtuple('Captured', ['status', 'stdout', 'stderr', 'value'])
+
+
+class _ThreadLocalStream(object):
+    """
+    File-like object writing to the current thread's stream, if it has one
+    """
+
+    def __init__(self, local, name, default):
+        self._local = local
+        self._name = name
+        self._default = default
+
+    @property
+    def stream(self):
+        return getattr(self._local, self._name, None) or self._default
+
+    def write(self, s):
+        return self.stream.write(s)
+
+    def flush(self):
+        return self.stream.flush()
+
+    def __getattr__(self, item):
+        return getattr(self.stream, item)
+
+
+class _DebugFilter(logging.Filter):
+    """
+    Drop debug records unless the action that logged them asked for them
+    """
+
+    def __init__(self, local, debug):
+        super(_DebugFilter, self).__init__()
+        self._local = local
+        self._debug = debug
+
+    def filter(self, record):
+        return (record.levelno > logging.DEBUG or
+                getattr(self._local, 'debug', self._debug))
+
+
+class OutputCapture(object):
+    """
+    Install with a "with" block, then call run() from any thread
+    """
+
+    def __init__(self, debug=False):
+        """
+        :param bool debug: Pass debug log records written outside of run()
+        """
+        self.debug = debug
+        self._local = threading.local()
+        self._saved = None
+        self._handler = None
+
+    def __enter__(self):
+        self.install()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.uninstall()
+
+    def install(self):
+        orlo_logger = logging.getLogger('orloclient')
+        self._saved = (sys.stdout, sys.stderr, orlo_logger.propagate,
+                       orlo_logger.level)
+        sys.stdout = _ThreadLocalStream(self._local, 'stdout', sys.stdout)
+        sys.stderr = _ThreadLocalStream(self._local, 'stderr', sys.stderr)
+
+        # Records logged by an action go to its own stderr only
+        self._handler = logging.StreamHandler(sys.stderr)
+        self._handler.setFormatter(logging.Formatter('%(message)s'))
+        self._handler.addFilter(_DebugFilter(self._local, self.debug))
+        orlo_logger.addHandler(self._handler)
+        orlo_logger.propagate = False
+        orlo_logger.setLevel(logging.DEBUG)
+
+    def uninstall(self):
+        orlo_logger = logging.getLogger('orloclient')
+        orlo_logger.removeHandler(self._handler)
+        sys.stdout, sys.stderr, orlo_logger.propagate, level = self._saved
+        orlo_logger.setLevel(level)
+
+    def run(self, func, debug=None):
+        """
+        Call func() with its output captured
+
+        Exceptions are turned into an exit status the same way the
+        interpreter would, except that OrloErrors are reported on one line
+        rather than with a traceback.
+
+        :param func: Function taking no arguments
+        :param bool debug: Capture debug log records, defaults to the
+            OutputCapture's setting
+        :return: Captured tuple of exit status, stdout, stderr and the value
+            func returned
+        """
+        stdout, stderr = StringIO(), StringIO()
+        self._local.stdout = stdout
+        self._local.stderr = stderr
+        self._local.debug = self.debug if debug is None else debug
+        status, value = 0, None
+        try:
+            value = func()
+        except SystemExit as e:
+            if e.code is None or isinstance(e.code, int):
+                status = e.code or 0
+            else:
+                stderr.write('{}\n'.format(e.code))
+                status = 1
+        except OrloError as e:
+            stderr.write('{}: {}\n'.format(e.__class__.__name__, e))
+            status = 1
+        except Exception:
+            logger.exception("Unexpected error")
+            status = 1
+        finally:
+            self._local.stdout = self._local.stderr = None
+            del self._local.debug
+        return Captured(status, stdout.getvalue(), stderr.getvalue(), value)
@@ -1,10 +1,20 @@
 from __future__ import print_function
 import logging
-import json
+import requests
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from timeit import default_timer
+from . import columnar, jsoncodec
 from .base_client import BaseClient
+from .bulk import run_bulk, success_by_package
 
 from .exceptions import ClientError, ServerError, ConnectionError
+from .instrumentation import CacheEvent, DecodeEvent, emit, endpoint_name
 from .objects import Release, Package
+from .records import ReleaseRecord, PackageRecord
+from .spool import WriteBehindQueue, default_spool_path
+from .streaming import ArrayItemParser
+from .watch import watch as watch_releases
 
 __author__ = 'alforbes'
 logger = logging.getLogger(__name__)
@@ -23,12 +33,113 @@ class OrloClient(BaseClient):
     use the mock.
     """
 
-    def __init__(self, uri, timeout=10, verify_ssl=True):
+    def __init__(self, uri, timeout=10, verify_ssl=True, pool_connections=10,
+                 pool_maxsize=10, keep_alive=True, max_retries=0, cache=None,
+                 write_behind=False, spool_path=None, spool_fsync=False,
+                 retry=None, circuit_breaker=None, coalesce=True, hooks=None):
+        """
+        :param string uri: Address of the Orlo server
+        :param int timeout: Timeout for each request, in seconds
+        :param bool verify_ssl: Verify TLS certificates
+        :param int pool_connections: Number of per-host connection pools
+        :param int pool_maxsize: Maximum connections kept open per host, set
+            this to at least the number of threads sharing the client
+        :param bool keep_alive: Re-use connections between requests
+        :param max_retries: Connection retries, int or urllib3 Retry object
+        :param ResponseCache cache: Cache for GET responses, see cache.py.
+            Writes made through this client invalidate the affected entries
+        :param bool write_behind: Queue package_start, package_stop and
+            package_add_results, and send them from a background thread. See
+            spool.py
+        :param string spool_path: File keeping queued events across crashes,
+            only used with write_behind. Defaults to default_spool_path(), or
+            memory when another process holds that. False to only queue in
+            memory, in which case events still queued when the process dies
+            are lost
+        :param bool spool_fsync: Sync the spool to disk for every event
+        :param RetryPolicy retry: When to retry failed requests, defaults to
+            retrying GETs with backoff. False to never retry. See retry.py
+        :param circuit_breaker: CircuitBreakers to fail fast while the server
+            is failing, or True for the default settings
+        :param bool coalesce: Have concurrent identical GETs, e.g. many threads
+            calling get_release_json for the same release, share one request.
+            See singleflight.py
+        :param list hooks: Instrumentation hooks, called with an event for
+            each request, JSON decode and cache lookup. See instrumentation.py
+
+        The client holds pooled connections, use it as a context manager or
+        call close() to release them. With write_behind, close() waits for
+        queued events to be sent.
+        """
         super(OrloClient, self).__init__(
             timeout=timeout,
             verify_ssl=verify_ssl,
+            pool_connections=pool_connections,
+            pool_maxsize=pool_maxsize,
+            keep_alive=keep_alive,
+            max_retries=max_retries,
+            retry=retry,
+            circuit_breaker=circuit_breaker,
+            coalesce=coalesce,
+            hooks=hooks,
         )
         self.uri = uri
+        self.cache = cache
+        self.write_behind = None
+        if write_behind:
+            self.write_behind = self._write_behind_queue(spool_path,
+                                                         spool_fsync)
+
+    def _write_behind_queue(self, spool_path, spool_fsync):
+        """
+        The WriteBehindQueue for write_behind, see __init__ for the arguments
+        """
+        if spool_path is False:
+            logger.warning("Package events are only queued in memory, those "
+                           "not sent when the process dies are lost")
+            return WriteBehindQueue(self._send_event)
+        if spool_path is not None:
+            return WriteBehindQueue(self._send_event, path=spool_path,
+                                    fsync=spool_fsync)
+        try:
+            return WriteBehindQueue(self._send_event,
+                                    path=default_spool_path(),
+                                    fsync=spool_fsync)
+        except ClientError as e:
+            # Another process sharing the default spool, e.g. a parallel
+            # deploy step
+            logger.warning("%s, queueing package events in memory", e)
+            return WriteBehindQueue(self._send_event)
+
+    def flush(self, timeout=None):
+        """
+        Wait for queued package events to be sent, see write_behind
+
+        :param float timeout: Seconds to wait, None to wait indefinitely
+        :return bool: Whether every event was sent
+        """
+        if self.write_behind is None:
+            return True
+        return self.write_behind.flush(timeout)
+
+    def close(self, timeout=None):
+        """
+        Send queued package events, then release pooled connections
+
+        :param float timeout: Seconds to wait for queued events, None to wait
+            indefinitely. Events not sent in time stay in the spool
+        """
+        if self.write_behind is not None:
+            self.write_behind.close(timeout)
+            self.write_behind = None
+        super(OrloClient, self).close()
+
+    def _send_event(self, event):
+        """
+        Send a package event taken from the write-behind queue
+        """
+        send = getattr(self, '_package_' + event.action)
+        return send(event.release_id, event.package_id, **event.kwargs)
 
     def _expect_200_json_response(self, response, status_code=200):
         """
@@ -38,14 +149,25 @@ class OrloClient(BaseClient):
         :param int status_code: The expected status_code
         :return dict:
         """
-        logger.debug("Response {}:\n{}".format(
-            response.status_code, response.text))
+        if logger.isEnabledFor(logging.DEBUG):
+            # Decoding the text of a large response costs more than parsing it
+            logger.debug("Response %s:\n%s", response.status_code,
+                         response.text)
 
         if response.status_code == 204:
             return True
         elif response.status_code == status_code:
             try:
-                return response.json()
+                # Straight from the bytes, response.json() decodes the whole
+                # body to text first
+                if not self.hooks:
+                    return jsoncodec.loads(response.content)
+                start = default_timer()
+                value = jsoncodec.loads(response.content)
+                emit(self.hooks, DecodeEvent(
+                    endpoint_name(response.url), default_timer() - start,
+                    len(response.content)))
+                return value
             except ValueError:
                 raise ClientError(
                     "Could not decode json from Orlo response:\n{}".format(
@@ -64,6 +186,68 @@ class OrloClient(BaseClient):
             else:
                 raise ClientError(msg)
 
+    def _get_json(self, url, endpoint, params=None):
+        """
+        GET a JSON document, through the cache if one is configured
+
+        :param string url: URL to fetch
+        :param string endpoint: Endpoint name, for the cache TTL
+        :param dict params: Query parameters
+        :return dict:
+        """
+        cache = self.cache
+        if cache is None or not cache.caches(endpoint):
+            return self._expect_200_json_response(
+                self._get(url, params=params))
+
+        key = cache.key(url, params)
+        entry = cache.get(key)
+        if entry is not None and entry.fresh:
+            cache.record(hit=True)
+            if self.hooks:
+                emit(self.hooks, CacheEvent(endpoint_name(url), 'hit'))
+            return entry.value
+        cache.record(hit=False)
+
+        # Read before the request, so that a write made while it is in
+        # flight keeps its response out of the cache
+        generation = cache.generation(key, endpoint)
+        headers = entry.validators if entry is not None else {}
+        response = self._get(url, params=params, headers=headers)
+        if response.status_code == 304 and entry is not None:
+            cache.touch(key)
+            if self.hooks:
+                emit(self.hooks, CacheEvent(endpoint_name(url), 'revalidated'))
+            return entry.value
+        if self.hooks:
+            emit(self.hooks, CacheEvent(endpoint_name(url), 'miss'))
+
+        value = self._expect_200_json_response(response)
+        cache.set(key, endpoint, value,
+                  etag=response.headers.get('ETag'),
+                  last_modified=response.headers.get('Last-Modified'),
+                  generation=generation)
+        return value
+
+    def _invalidate(self, endpoints, release_id=None, package_id=None):
+        """
+        Drop cache entries affected by a write
+
+        :param endpoints: Endpoint names to drop entirely
+        :param release_id: Release that was written to
+        :param package_id: Package that was written to
+        """
+        if self.cache is None:
+            return
+        keys = []
+        if release_id is not None:
+            keys.append("{url}/releases/{rid}".format(
+                url=self.uri, rid=release_id))
+        if package_id is not None:
+            keys.append("{url}/packages/{pid}".format(
+                url=self.uri, pid=package_id))
+        self.cache.invalidate(endpoints=endpoints, keys=keys)
+
     def ping(self):
         response = self._get(self.uri + '/ping')
 
@@ -81,23 +265,78 @@ class OrloClient(BaseClient):
         """
 
         response_dict = self.get_release_json(release_id)
-        logger.debug(response_dict)
+        logger.debug("Response dict: %s", response_dict)
 
-        releases_list = [
-            Release(self, r['id']) for r in response_dict['releases']
-        ]
-        if len(releases_list) > 1:
+        if len(response_dict['releases']) > 1:
             raise ServerError("Got list of length > 1")
 
-        return releases_list[0]
+        # Pass on the document, so the Release doesn't fetch it again
+        return Release(self, response_dict['releases'][0]['id'],
+                       data=response_dict)
+
+    def get_releases_by_id(self, release_ids, max_workers=None):
+        """
+        Fetch many releases concurrently
+
+        Orlo has no filter for several release ids, so each release is fetched
+        on its own, up to max_workers at a time, and through the cache if one
+        is configured. An id given more than once is fetched once. The
+        Releases are pre-hydrated.
+
+        :param release_ids: Release ids
+        :param int max_workers: Maximum concurrent requests, defaults to the
+            connection pool size
+        :return list: BulkResult for each id, in the order given, holding the
+            Release or the error; a ClientError when the release doesn't exist
+        """
+        def fetch(release_id):
+            releases = self.get_release_json(release_id)['releases']
+            if not releases:
+                raise ClientError("Release {} not found".format(release_id))
+            return Release.from_dict(self, releases[0])
+        return self._get_by_id(fetch, release_ids, max_workers)
+
+    def get_packages_by_id(self, package_ids, max_workers=None):
+        """
+        Fetch many packages concurrently
+
+        See get_releases_by_id.
+
+        :param package_ids: Package ids
+        :param int max_workers: Maximum concurrent requests, defaults to the
+            connection pool size
+        :return list: BulkResult for each id, in the order given, holding the
+            Package or the error
+        """
+        def fetch(package_id):
+            packages = self.get_package_json(package_id)['packages']
+            if not packages:
+                raise ClientError("Package {} not found".format(package_id))
+            return Package.from_dict(packages[0])
+        return self._get_by_id(fetch, package_ids, max_workers)
+
+    def _get_by_id(self, fetch, ids, max_workers):
+        """
+        Call fetch once for each distinct id, concurrently
+
+        :return list: BulkResult for each id, in the order given
+        """
+        ids = list(ids)
+        results = dict(
+            (r.item, r) for r in run_bulk(
+                fetch, OrderedDict.fromkeys(ids),
+                max_workers or self.pool_maxsize))
+        return [results[i] for i in ids]
 
-    def get_releases(self, raw=False, **kwargs):
+    def get_releases(self, raw=False, compact=False, **kwargs):
         """
         Fetch releases from the orlo API with filters
 
         See http://orlo.readthedocs.org/en/latest/rest.html#get--releases
 
         :param bool raw: Return the raw dictionary rather than Release objects
+        :param bool compact: Return read-only ReleaseRecord objects, which use
+            a fraction of the memory of Release objects
         :param kwargs: Filters to apply
         """
         logger.debug("Entering get_releases")
@@ -107,23 +346,71 @@ class OrloClient(BaseClient):
         filters = []
 
         for key in kwargs:
-            f = "{}={}".format(key, kwargs[key])
-            logger.debug("Append filter {}".format(f))
-            filters.append(f)
+            filters.append("{}={}".format(key, kwargs[key]))
 
         if filters:
+            logger.debug("Filters: %s", filters)
             url = "{url}?{filters}".format(url=url, filters='&'.join(filters))
 
-        response = self._get(url)
-        logger.debug(response)
-
-        response_dict = self._expect_200_json_response(response)
+        response_dict = self._get_json(url, 'releases')
 
         if raw:
             return response_dict['releases']
+        elif compact:
+            return [ReleaseRecord(r) for r in response_dict['releases']]
         else:
-            return [Release(self, r['id']) for r in response_dict['releases']]
+            return Release.from_dicts(self, response_dict['releases'])
+
 
+    def iter_releases(self, raw=False, compact=False, page_size=100,
+                      **kwargs):
+        """
+        Iterate over releases matching the filters, one page at a time
+
+        At most two pages are held in memory: the next page is fetched in the
+        background while the current one is consumed. Pages are requested
+        with the limit and offset filters; a limit given in kwargs caps the
+        total number of releases returned, an offset is where to start.
+        Releases created while iterating can shift the pages, so one may be
+        returned twice.
+
+        :param bool raw: Yield the raw dictionaries rather than Release objects
+        :param bool compact: Yield ReleaseRecord objects
+        :param int page_size: Number of releases per request
+        :param kwargs: Filters to apply
+        """
+        for r in self._iter_pages('releases', page_size, kwargs):
+            if raw:
+                yield r
+            elif compact:
+                yield ReleaseRecord(r)
+            else:
+                yield Release.from_dict(self, r)
+
+    def watch(self, release_ids, interval=1.0, max_interval=30.0,
+              backoff=1.5, timeout=None, batch=True):
+        """
+        Yield an event for each change to the releases, until all are finished
+
+        Polls every release in one loop: together in one /releases request
+        where possible, conditionally where the server sends validators, and
+        less often while nothing changes. A release is dropped once finished.
+        See watch.py.
+
+        :param release_ids: Releases to watch
+        :param float interval: Seconds between polls while releases change
+        :param float max_interval: Longest wait between polls
+        :param float backoff: Factor the wait grows by after a poll without
+            changes
+        :param float timeout: Stop after this many seconds, None to wait for
+            every release to finish
+        :param bool batch: Poll several releases with a single request
+        :return: Generator of ChangeEvent, with kind PACKAGE_STARTED,
+            PACKAGE_STOPPED (with the package status) or RELEASE_FINISHED
+        """
+        return watch_releases(
+            self, release_ids, interval=interval, max_interval=max_interval,
+            backoff=backoff, timeout=timeout, batch=batch)
 
     def get_release_json(self, release_id):
         """
@@ -134,10 +421,7 @@ class OrloClient(BaseClient):
         """
         logger.debug("Entering get_release_json")
         url = "{url}/releases/{rid}".format(url=self.uri, rid=release_id)
-
-        response = self._get(url)
-        logger.debug(response)
-        return self._expect_200_json_response(response)
+        return self._get_json(url, 'release')
 
     def get_package_json(self, package_id):
         """
@@ -148,10 +432,7 @@ class OrloClient(BaseClient):
         """
         logger.debug("Entering get_package_json")
         url = "{url}/packages/{pid}".format(url=self.uri, pid=package_id)
-
-        response = self._get(url)
-        logger.debug(response)
-        return self._expect_200_json_response(response)
+        return self._get_json(url, 'package')
 
     def create_release(self, user, platforms,
                        team=None, references=None, note=None, metadata=None):
@@ -180,16 +461,15 @@ class OrloClient(BaseClient):
             data['metadata'] = metadata
 
         req_url = '{}/releases'.format(self.uri)
-        logger.debug("Posting to {}:\n{}".format(req_url, data))
+        logger.debug("Posting to %s:\n%s", req_url, data)
         response = self._post(
             req_url,
             json=data,
             allow_redirects=False,
         )
 
-        self._expect_200_json_response(response)
-
-        release_id = response.json()['id']
+        release_id = self._expect_200_json_response(response)['id']
+        self._invalidate(('releases', 'stats', 'info'))
         return Release(self, release_id)
 
     def create_package(self, release, name, version):
@@ -211,11 +491,26 @@ class OrloClient(BaseClient):
             allow_redirects=False,
         )
 
-        self._expect_200_json_response(response)
-
-        pkg = response.json()
+        pkg = self._expect_200_json_response(response)
+        self._invalidate(('releases', 'packages', 'info'),
+                         release_id=release.release_id)
         return Package(release.id, pkg['id'], name, version)
 
+    def create_packages(self, release, packages, max_workers=None):
+        """
+        Create several packages concurrently
+
+        :param Release release: release to create the packages for
+        :param list packages: List of (name, version) tuples
+        :param int max_workers: Maximum concurrent requests, defaults to the
+            connection pool size
+        :return list: BulkResult for each (name, version), in the order given
+        """
+        return run_bulk(
+            lambda p: self.create_package(release, p[0], p[1]),
+            packages, max_workers or self.pool_maxsize,
+        )
+
     @staticmethod
     def release_start():
         """
@@ -236,7 +531,9 @@ class OrloClient(BaseClient):
             allow_redirects=False,
         )
 
-        return self._expect_200_json_response(response, status_code=204)
+        result = self._expect_200_json_response(response, status_code=204)
+        self._invalidate(('releases', 'stats', 'info'), release_id=release_id)
+        return result
 
     def get_package(self, package_id):
         """
@@ -246,23 +543,25 @@ class OrloClient(BaseClient):
         """
 
         response_dict = self.get_package_json(package_id)
-        logger.debug('Response Dict:\n{}'.format(
-            json.dumps(response_dict, indent=2)))
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug('Response Dict:\n%s',
+                         jsoncodec.dumps(response_dict, indent=2))
 
         packages_list = [
-            Package(p['release_id'], p['id'], p['name'], p['version'])
-            for p in response_dict['packages']
-            ]
+            Package.from_dict(p) for p in response_dict['packages']
+        ]
         if len(packages_list) > 1:
             raise ServerError("Got list of length > 1")
 
         return packages_list[0]
 
-    def get_packages(self, raw=False, **kwargs):
+    def get_packages(self, raw=False, compact=False, **kwargs):
         """
         Fetch packages from the orlo API with filters
 
         http://orlo.readthedocs.org/en/latest/rest.html#get--packages
+        :param bool raw: Return the raw dictionary rather than Package objects
+        :param bool compact: Return read-only PackageRecord objects
         :param kwargs: Filters to apply
         """
         logger.debug("Entering get_packages")
@@ -272,47 +571,226 @@ class OrloClient(BaseClient):
         filters = []
 
         for key in kwargs:
-            f = "{}={}".format(key, kwargs[key])
-            logger.debug("Append filter {}".format(f))
-            filters.append(f)
+            filters.append("{}={}".format(key, kwargs[key]))
 
         if filters:
+            logger.debug("Filters: %s", filters)
             url = "{url}?{filters}".format(url=url, filters='&'.join(filters))
 
-        response = self._get(url)
-        logger.debug(response)
-
-        response_dict = self._expect_200_json_response(response)
+        response_dict = self._get_json(url, 'packages')
 
         if raw:
             return response_dict['packages']
+        elif compact:
+            return [PackageRecord(p) for p in response_dict['packages']]
         else:
-            return [
-                Package(None, p['id'], p['name'], p['version'])
-                for p in response_dict['packages']
-            ]
+            return Package.from_dicts(response_dict['packages'])
+
+
+    def iter_packages(self, raw=False, compact=False, page_size=100,
+                      **kwargs):
+        """
+        Iterate over packages matching the filters, one page at a time
+
+        See iter_releases.
+
+        :param bool raw: Yield the raw dictionaries rather than Package objects
+        :param bool compact: Yield PackageRecord objects
+        :param int page_size: Number of packages per request
+        :param kwargs: Filters to apply
+        """
+        for p in self._iter_pages('packages', page_size, kwargs):
+            if raw:
+                yield p
+            elif compact:
+                yield PackageRecord(p)
+            else:
+                yield Package.from_dict(p)
+
+    def stream_releases(self, raw=False, compact=False, chunk_size=65536,
+                        **kwargs):
+        """
+        Iterate over releases matching the filters, in a single request whose
+        response is parsed as it arrives
+
+        For servers that return every release in one response. Each release
+        is yielded as soon as it has been received, and only one is held in
+        memory at a time, however large the response. See streaming.py.
+
+        :param bool raw: Yield the raw dictionaries rather than Release objects
+        :param bool compact: Yield ReleaseRecord objects
+        :param int chunk_size: Bytes to read from the response at a time
+        :param kwargs: Filters to apply
+        """
+        for r in self._stream_collection('releases', chunk_size, kwargs):
+            if raw:
+                yield r
+            elif compact:
+                yield ReleaseRecord(r)
+            else:
+                yield Release.from_dict(self, r)
+
+    def stream_packages(self, raw=False, compact=False, chunk_size=65536,
+                        **kwargs):
+        """
+        Iterate over packages matching the filters, parsing the response as it
+        arrives
+
+        See stream_releases.
+
+        :param bool raw: Yield the raw dictionaries rather than Package objects
+        :param bool compact: Yield PackageRecord objects
+        :param int chunk_size: Bytes to read from the response at a time
+        :param kwargs: Filters to apply
+        """
+        for p in self._stream_collection('packages', chunk_size, kwargs):
+            if raw:
+                yield p
+            elif compact:
+                yield PackageRecord(p)
+            else:
+                yield Package.from_dict(p)
 
+    def export_releases(self, format=None, **kwargs):
+        """
+        Fetch releases matching the filters as columns, for analytics
+
+        See columnar.py for the columns and their types.
+
+        :param string format: "columns", "numpy", "pandas" or "arrow". Defaults
+            to "numpy" when installed, "columns" otherwise
+        :param kwargs: Filters to apply
+        """
+        return columnar.release_columns(
+            self.stream_releases(raw=True, **kwargs), format=format)
+
+    def export_packages(self, format=None, **kwargs):
+        """
+        Fetch packages matching the filters as columns, for analytics
+
+        :param string format: See export_releases
+        :param kwargs: Filters to apply
+        """
+        return columnar.package_columns(
+            self.stream_packages(raw=True, **kwargs), format=format)
+
+    def _stream_collection(self, collection, chunk_size, filters):
+        """
+        Yield the items of a collection as they are parsed from the response
+
+        :param string collection: "releases" or "packages"
+        :param int chunk_size: Bytes to read from the response at a time
+        :param dict filters: Filters to apply
+        """
+        url = "{url}/{collection}".format(url=self.uri, collection=collection)
+        # Not coalesced, the body can only be read once
+        response = self._single_get(url, params=filters, stream=True)
+        try:
+            if response.status_code != 200:
+                # Read as usual, error responses are small
+                if response.status_code == 404:
+                    # Orlo answers 404 with an empty list when nothing matches
+                    try:
+                        if jsoncodec.loads(response.content).get(
+                                collection) == []:
+                            return
+                    except ValueError:
+                        pass
+                self._expect_200_json_response(response)
+                return
+
+            parser = ArrayItemParser(collection)
+            try:
+                for chunk in response.iter_content(chunk_size):
+                    for item in parser.feed(chunk):
+                        yield item
+                    if parser.done:
+                        break
+                for item in parser.close():
+                    yield item
+            except requests.exceptions.RequestException as e:
+                raise ServerError(
+                    "Could not read from Orlo server, requests raised "
+                    "{}: {}".format(e.__class__.__name__, e))
+        finally:
+            response.close()
+
+    def _iter_pages(self, collection, page_size, filters):
+        """
+        Yield the items of a collection, prefetching the next page
+
+        The current page and the next one are held in memory.
+
+        :param string collection: "releases" or "packages"
+        :param int page_size: Number of items per request
+        :param dict filters: Filters to apply, including limit and offset
+        """
+        filters = dict(filters)
+        limit = filters.pop('limit', None)
+        remaining = int(limit) if limit is not None else None
+        offset = int(filters.pop('offset', 0))
+        url = "{url}/{collection}".format(url=self.uri, collection=collection)
+
+        def fetch(offset, count):
+            params = dict(filters, limit=count, offset=offset)
+            response = self._get(url, params=params)
+            if response.status_code == 404:
+                # Orlo answers 404 with an empty list when nothing matches
+                try:
+                    if jsoncodec.loads(response.content).get(
+                            collection) == []:
+                        return []
+                except ValueError:
+                    pass
+            return self._expect_200_json_response(response)[collection]
+
+        def next_count():
+            if remaining is None:
+                return page_size
+            return min(page_size, remaining)
+
+        with ThreadPoolExecutor(max_workers=1) as pool:
+            count = next_count()
+            future = pool.submit(fetch, offset, count) if count else None
+            while future is not None:
+                page = future.result()
+                offset += len(page)
+                if remaining is not None:
+                    remaining -= len(page)
+
+                future = None
+                if len(page) == count:
+                    count = next_count()
+                    if count:
+                        future = pool.submit(fetch, offset, count)
+
+                for item in page:
+                    yield item
 
     def package_start(self, package):
         """
         Start a package using the REST API
 
         :param Package package: Package object
-        :return boolean: Whether or not the package was successfully started
+        :return boolean: Whether or not the package was successfully started,
+            or queued with write_behind
         """
+        if self.write_behind is not None:
+            return self.write_behind.put('start', package.release_id,
+                                         package.id)
+        return self._package_start(package.release_id, package.id)
 
+    def _package_start(self, release_id, package_id):
         response = self._post(
             '{}/releases/{}/packages/{}/start'.format(
-                self.uri, package.release_id, package.id),
+                self.uri, release_id, package_id),
             allow_redirects=False,
         )
 
-        if response.status_code != 204:
-            logger.debug(response)
-            raise ServerError(
-                "Orlo server returned non-204 status code: {}".format(response.json()))
-
-        return self._expect_200_json_response(response, status_code=204)
+        result = self._expect_200_json_response(response, status_code=204)
+        self._invalidate(('releases', 'packages'),
+                         release_id=release_id, package_id=package_id)
+        return result
 
     def package_stop(self, package, success=True):
         """
@@ -320,11 +798,15 @@ class OrloClient(BaseClient):
 
         :param Package package: Package object
         :param boolean success: Whether or not the package was successfully stopped
-        :return boolean: Whether or not the package was successfully stopped
+        :return boolean: Whether or not the package was successfully stopped,
+            or queued with write_behind
         """
-        release_id = package.release_id
-        package_id = package.id
+        if self.write_behind is not None:
+            return self.write_behind.put('stop', package.release_id,
+                                         package.id, success=success)
+        return self._package_stop(package.release_id, package.id, success)
 
+    def _package_stop(self, release_id, package_id, success=True):
         response = self._post(
             '{}/releases/{}/packages/{}/stop'.format(
                 self.uri, release_id, package_id),
@@ -334,20 +816,67 @@ class OrloClient(BaseClient):
             allow_redirects=False,
         )
 
-        return self._expect_200_json_response(response, status_code=204)
+        result = self._expect_200_json_response(response, status_code=204)
+        self._invalidate(('releases', 'packages', 'stats', 'info', 'versions'),
+                         release_id=release_id, package_id=package_id)
+        return result
 
 
+    def packages_start(self, packages, max_workers=None):
+        """
+        Start several packages concurrently
+
+        :param list packages: Package objects
+        :param int max_workers: Maximum concurrent requests, defaults to the
+            connection pool size
+        :return list: BulkResult for each package, in the order given
+        """
+        return run_bulk(
+            self.package_start, packages, max_workers or self.pool_maxsize)
+
+    def packages_stop(self, packages, success=True, max_workers=None):
+        """
+        Stop several packages concurrently
+
+        :param list packages: Package objects
+        :param success: Boolean applied to all packages, or a dictionary of
+            package id to boolean, covering every package. Ids may be UUIDs
+            or strings
+        :raises ClientError: If a package is missing from the dictionary,
+            before any package is stopped
+        :param int max_workers: Maximum concurrent requests, defaults to the
+            connection pool size
+        :return list: BulkResult for each package, in the order given
+        """
+        if isinstance(success, dict):
+            packages = list(packages)
+            success = success_by_package(packages, success)
+
+            def stop(package):
+                return self.package_stop(
+                    package, success=success[str(package.id)])
+        else:
+            def stop(package):
+                return self.package_stop(package, success=success)
+
+        return run_bulk(stop, packages, max_workers or self.pool_maxsize)
+
     def package_add_results(self, package, results):
         """
         Add results to a package
 
         :param Package package: Package object
         :param String results: The results string that you want to add to the package
-        :return boolean: Whether or not the package was successfully updated
+        :return boolean: Whether or not the package was successfully updated,
+            or queued with write_behind
         """
-        release_id = package.release_id
-        package_id = package.id
+        if self.write_behind is not None:
+            return self.write_behind.put('add_results', package.release_id,
+                                         package.id, results=results)
+        return self._package_add_results(
+            package.release_id, package.id, results)
 
+    def _package_add_results(self, release_id, package_id, results):
         response = self._post(
             '{}/releases/{}/packages/{}/results'.format(
                 self.uri, release_id, package_id),
@@ -357,7 +886,9 @@ class OrloClient(BaseClient):
             allow_redirects=False,
         )
 
-        return self._expect_200_json_response(response, status_code=204)
+        result = self._expect_200_json_response(response, status_code=204)
+        self._invalidate((), release_id=release_id, package_id=package_id)
+        return result
 
     def get_info(self, field, name=None, platform=None):
         """
@@ -379,10 +910,10 @@ class OrloClient(BaseClient):
 
         url_query = {'platform': platform} if platform else {}
 
-        response = self._get(
-            '{uri}/info/{field}{name}'.format(**url_path), params=url_query
+        return self._get_json(
+            '{uri}/info/{field}{name}'.format(**url_path), 'info',
+            params=url_query,
         )
-        return self._expect_200_json_response(response)
 
     def get_stats(self, field=None, name=None, platform=None,
                   stime=None, ftime=None):
@@ -409,10 +940,10 @@ class OrloClient(BaseClient):
         for var in ['platform', 'stime', 'ftime']:
             url_query[var] = eval(var)
 
-        response = self._get(
-            '{uri}/stats{field}{name}'.format(**url_path), params=url_query
+        return self._get_json(
+            '{uri}/stats{field}{name}'.format(**url_path), 'stats',
+            params=url_query,
         )
-        return self._expect_200_json_response(response)
 
     def get_versions(self, platform=None):
         """
@@ -425,8 +956,5 @@ class OrloClient(BaseClient):
             platform=platform if platform else ''
         )
 
-        response = self._get(url)
-        logger.debug(response)
-
-        return self._expect_200_json_response(response)
+        return self._get_json(url, 'versions')
 
@@ -0,0 +1,217 @@
+from __future__ import print_function
+import re
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from .exceptions import ClientError
+from .objects import _parse_time
+
+__author__ = 'alforbes'
+
+"""
+Columnar export of releases and packages, for analytics
+
+Turns lists of release or package dictionaries, as returned with raw=True,
+into one column per field: NumPy arrays, or a pandas DataFrame or Arrow table,
+when installed, and plain lists otherwise. Aggregations (durations, failure
+rates, counts per team) then run over arrays instead of nested dictionaries.
+
+With NumPy, ids are fixed-width bytes (dtype S36, empty when missing), times
+are UTC datetime64[us] (NaT when missing) and durations floats (NaN when
+missing). Plain lists hold ids as strings and times as naive UTC datetimes.
+
+    columns = release_columns(client.get_releases(raw=True), format='numpy')
+    (columns['ftime'] - columns['stime']).mean()
+"""
+
+FORMATS = ('columns', 'numpy', 'pandas', 'arrow')
+
+# Columns and how each is built from the raw values
+RELEASE_COLUMNS = OrderedDict([
+    ('id', 'id'),
+    ('user', 'string'),
+    ('team', 'string'),
+    ('platforms', 'sequence'),
+    ('stime', 'time'),
+    ('ftime', 'time'),
+    ('duration', 'number'),
+    ('package_count', 'count'),
+])
+
+PACKAGE_COLUMNS = OrderedDict([
+    ('id', 'id'),
+    ('release_id', 'id'),
+    ('name', 'string'),
+    ('version', 'string'),
+    ('status', 'string'),
+    ('rollback', 'flag'),
+    ('diff_url', 'string'),
+    ('stime', 'time'),
+    ('ftime', 'time'),
+    ('duration', 'number'),
+])
+
+_OFFSET = re.compile(r'[+-]\d\d:?\d\d$')
+
+
+def parse_time(value):
+    """
+    Parse an ISO 8601 time as a naive UTC datetime
+
+    Handles the format Orlo returns without going through arrow, which is much
+    slower per value, and falls back to arrow for anything else.
+
+    :param string value: Time, as returned by Orlo
+    :return datetime:
+    """
+    parsed = _parse_time(value)
+    if parsed is None:
+        import arrow
+        return arrow.get(value).to('UTC').naive
+    fields, offset = parsed
+    return datetime(*fields) - timedelta(seconds=offset or 0)
+
+
+def release_columns(releases, format=None):
+    """
+    Turn releases into columns
+
+    :param releases: Release dictionaries, as returned by
+        get_releases(raw=True), or ReleaseRecord objects
+    :param string format: "columns", "numpy", "pandas" or "arrow". Defaults
+        to "numpy" when installed, "columns" otherwise
+    :return: OrderedDict of column name to list or array, a pandas
+        DataFrame or a pyarrow Table
+    """
+    return _columns([_as_dict(r) for r in releases], RELEASE_COLUMNS, format)
+
+
+def package_columns(items, format=None):
+    """
+    Turn packages into columns
+
+    Releases are replaced by their packages, with release_id filled in from
+    the release when the package doesn't have it.
+
+    :param items: Package dictionaries, as returned by
+        get_packages(raw=True), release dictionaries, or records of either
+    :param string format: See release_columns
+    """
+    packages = []
+    for item in items:
+        item = _as_dict(item)
+        if 'packages' in item:
+            for package in item['packages'] or ():
+                if package.get('release_id') is None:
+                    package = dict(package, release_id=item.get('id'))
+                packages.append(package)
+        else:
+            packages.append(item)
+    return _columns(packages, PACKAGE_COLUMNS, format)
+
+
+def _as_dict(item):
+    return item if isinstance(item, dict) else item.to_dict()
+
+
+def _import(module):
+    try:
+        return __import__(module)
+    except ImportError:
+        raise ClientError(
+            "{} is not installed, pip install orloclient[analytics]".format(
+                module))
+
+
+def _columns(rows, schema, format):
+    if format is None:
+        try:
+            import numpy  # nopep8
+            format = 'numpy'
+        except ImportError:
+            format = 'columns'
+    if format not in FORMATS:
+        raise ClientError("Unknown format {}, choose one of {}".format(
+            format, ', '.join(FORMATS)))
+
+    if format == 'columns':
+        columns = OrderedDict()
+        for name, kind in schema.items():
+            if kind == 'count':
+                columns[name] = [len(row.get('packages') or ()) for row in rows]
+            else:
+                columns[name] = _list_column(
+                    kind, [row.get(name) for row in rows])
+        return columns
+
+    numpy = _import('numpy')
+    columns = OrderedDict()
+    for name, kind in schema.items():
+        if kind == 'count':
+            columns[name] = numpy.fromiter(
+                (len(row.get('packages') or ()) for row in rows),
+                dtype='int64', count=len(rows))
+        else:
+            columns[name] = _array_column(
+                numpy, kind, [row.get(name) for row in rows])
+
+    if format == 'pandas':
+        pandas = _import('pandas')
+        return pandas.DataFrame(columns)
+    if format == 'arrow':
+        pyarrow = _import('pyarrow')
+        return pyarrow.Table.from_arrays(
+            [pyarrow.array(list(column)) if schema[name] == 'sequence'
+             else pyarrow.array(column) for name, column in columns.items()],
+            names=list(columns))
+    return columns
+
+
+def _list_column(kind, values):
+    if kind == 'time':
+        return [None if v is None else parse_time(v) for v in values]
+    if kind == 'sequence':
+        return [None if v is None else list(v) for v in values]
+    return values
+
+
+def _array_column(numpy, kind, values):
+    if kind == 'id':
+        return numpy.array([v or '' for v in values], dtype='S36')
+    if kind == 'time':
+        return _datetime64(numpy, values)
+    if kind == 'number':
+        return numpy.array([numpy.nan if v is None else v for v in values],
+                           dtype='float64')
+    if kind == 'flag':
+        return numpy.array([bool(v) for v in values], dtype='bool')
+    # Strings and sequences are held as objects. A sequence column is filled
+    # in place, numpy.array() would make a 2-D array of equal length lists
+    column = numpy.empty(len(values), dtype=object)
+    if kind == 'sequence':
+        for i, v in enumerate(values):
+            column[i] = None if v is None else tuple(v)
+    else:
+        column[:] = values
+    return column
+
+
+def _datetime64(numpy, values):
+    """
+    Parse times with numpy, which does it in C, once offsets are removed
+
+    numpy warns about times with an offset, and would apply it; UTC offsets
+    are stripped here, others parsed one by one.
+    """
+    naive = []
+    for v in values:
+        if v is None:
+            naive.append('NaT')
+        elif v.endswith('Z'):
+            naive.append(v[:-1])
+        elif v.endswith('+00:00'):
+            naive.append(v[:-6])
+        elif _OFFSET.search(v, 19):
+            naive.append(parse_time(v).isoformat())
+        else:
+            naive.append(v)
+    return numpy.array(naive, dtype='datetime64[us]')
@@ -0,0 +1,268 @@
+from __future__ import print_function
+import json
+import logging
+import os
+import socket
+import threading
+from six.moves import socketserver
+from ._version import __version__
+from .capture import OutputCapture
+from .exceptions import ConnectionError, OrloError
+from .singleflight import SingleFlight
+
+__author__ = 'alforbes'
+
+logger = logging.getLogger(__name__)
+
+"""
+Long-running daemon for the command line client
+
+Running "orloclient daemon" keeps warm clients, with pooled connections and a
+response cache, behind a Unix socket. Command line invocations forward their
+parsed arguments to it rather than connecting to Orlo themselves, and run the
+command directly when no daemon is listening.
+
+The protocol is one line of JSON each way per connection:
+
+    -> {"version": "0.4.5", "command": {"object": "info", ...}}
+    <- {"status": 0, "stdout": "...", "stderr": "..."}
+
+A reply with an "error" instead of a status tells the caller to run the
+command itself, e.g. when the daemon is running a different version.
+
+This module is imported on every forwarded invocation, so must stay cheap to
+import; the client is only imported by the daemon.
+"""
+
+
+def default_socket_path():
+    """
+    $XDG_RUNTIME_DIR/orloclient.sock, or ~/.cache/orloclient/daemon.sock
+    """
+    runtime_dir = os.environ.get('XDG_RUNTIME_DIR')
+    if runtime_dir:
+        return os.path.join(runtime_dir, 'orloclient.sock')
+    base = os.environ.get('XDG_CACHE_HOME') or os.path.join(
+        os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'orloclient', 'daemon.sock')
+
+
+def _connect(path):
+    """
+    Return a socket connected to path, or None if nothing is listening
+    """
+    if not hasattr(socket, 'AF_UNIX'):
+        return None
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(path)
+    except socket.error:
+        sock.close()
+        return None
+    return sock
+
+
+def forward(command, socket_path=None):
+    """
+    Run a command in the daemon
+
+    :param dict command: The parsed command line arguments, JSON serialisable
+    :param string socket_path: Daemon socket, defaults to default_socket_path()
+    :return: The reply dictionary with status, stdout and stderr, or None when
+        the command should be run directly instead
+    """
+    path = socket_path or default_socket_path()
+    sock = _connect(path)
+    if sock is None:
+        return None
+
+    try:
+        sock.sendall(json.dumps({
+            'version': __version__,
+            'command': command,
+        }).encode('utf-8') + b'\n')
+        line = sock.makefile('rb').readline()
+    except socket.error as e:
+        # The command may or may not have run, it is not safe to repeat it
+        raise ConnectionError(
+            "Lost connection to orloclient daemon at {}: {}".format(path, e))
+    finally:
+        sock.close()
+
+    if not line:
+        raise ConnectionError(
+            "orloclient daemon at {} closed the connection".format(path))
+    reply = json.loads(line.decode('utf-8'))
+    if 'error' in reply:
+        logger.debug("Daemon declined command: {}".format(reply['error']))
+        return None
+    return reply
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        try:
+            request = json.loads(self.rfile.readline().decode('utf-8'))
+            command = request['command']
+        except (ValueError, KeyError, TypeError) as e:
+            reply = {'error': 'Invalid request: {}'.format(e)}
+        else:
+            if request.get('version') != __version__:
+                reply = {'error': 'Version mismatch, daemon is {}'.format(
+                    __version__)}
+            else:
+                reply = self.server.daemon.execute(command)
+        self.wfile.write(json.dumps(reply).encode('utf-8') + b'\n')
+
+
+class _Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def _default_client(uri, verify_ssl):
+    from .cache import ResponseCache
+    from .client import OrloClient
+    return OrloClient(uri=uri, verify_ssl=verify_ssl, cache=ResponseCache())
+
+
+class Daemon(object):
+    """
+    Serve forwarded commands on a Unix socket
+
+    Each connection is handled in its own thread. Commands for which
+    coalesce(command) is true (reads) and that are identical to one already
+    running wait for it and share its reply, so a burst of shell hooks asking
+    the same thing costs one request to Orlo.
+    """
+
+    def __init__(self, run, socket_path=None, coalesce=None,
+                 client_factory=None, debug=False):
+        """
+        :param run: Function run(daemon, command) executing a command. Output
+            written to sys.stdout, sys.stderr and the orloclient logger is
+            returned to the caller
+        :param string socket_path: Socket to listen on, defaults to
+            default_socket_path()
+        :param coalesce: Function coalesce(command) returning whether identical
+            concurrent commands can share one reply
+        :param client_factory: Function client_factory(uri, verify_ssl)
+            creating the clients returned by client()
+        :param bool debug: Log debug messages for the daemon itself
+        """
+        self.run = run
+        self.socket_path = socket_path or default_socket_path()
+        self.coalesce = coalesce or (lambda command: False)
+        self.client_factory = client_factory or _default_client
+        self.debug = debug
+
+        self.commands = 0
+
+        self.server = None
+        self._clients = {}
+        self._flights = SingleFlight()
+        self._lock = threading.Lock()
+        self._capture = OutputCapture(debug)
+        self._ready = threading.Event()
+
+    def client(self, uri, verify_ssl=True):
+        """
+        The warm client for a server, created on first use
+        """
+        key = (uri, verify_ssl)
+        with self._lock:
+            client = self._clients.get(key)
+            if client is None:
+                client = self._clients[key] = self.client_factory(
+                    uri, verify_ssl)
+        return client
+
+    def execute(self, command):
+        """
+        Run a command, or wait for an identical one already running
+        """
+        if not self.coalesce(command):
+            return self._execute(command)
+
+        key = json.dumps(command, sort_keys=True)
+        with self._lock:
+            self.commands += 1
+        return self._flights.do(key, self._execute, command, count=False)
+
+    @property
+    def coalesced(self):
+        """
+        Number of commands that shared the reply of an identical one
+        """
+        return self._flights.shared
+
+    def _execute(self, command, count=True):
+        if count:
+            with self._lock:
+                self.commands += 1
+
+        captured = self._capture.run(lambda: self.run(self, command),
+                                     debug=bool(command.get('debug')))
+        return {
+            'status': captured.status,
+            'stdout': captured.stdout,
+            'stderr': captured.stderr,
+        }
+
+    def _bind(self):
+        if _connect(self.socket_path) is not None:
+            raise OrloError("A daemon is already listening on {}".format(
+                self.socket_path))
+        if os.path.exists(self.socket_path):
+            # Left behind by a daemon that didn't shut down cleanly
+            os.unlink(self.socket_path)
+
+        directory = os.path.dirname(self.socket_path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+        # Only the owner may connect
+        umask = os.umask(0o077)
+        try:
+            return _Server(self.socket_path, _Handler)
+        finally:
+            os.umask(umask)
+
+    def wait_ready(self, timeout=None):
+        """
+        Wait until the socket is listening
+        """
+        return self._ready.wait(timeout)
+
+    def serve_forever(self):
+        """
+        Listen until shutdown() is called, or the thread is interrupted
+        """
+        self.server = self._bind()
+        self.server.daemon = self
+
+        self._capture.install()
+        logger.info("Listening on {}".format(self.socket_path))
+        self._ready.set()
+        try:
+            self.server.serve_forever()
+        finally:
+            self._ready.clear()
+            self.server.server_close()
+            try:
+                os.unlink(self.socket_path)
+            except OSError:
+                pass
+            self._capture.uninstall()
+            self.close()
+
+    def shutdown(self):
+        """
+        Stop serve_forever(), from another thread
+        """
+        if self.server is not None:
+            self.server.shutdown()
+
+    def close(self):
+        with self._lock:
+            clients, self._clients = list(self._clients.values()), {}
+        for client in clients:
+            client.close()
@@ -19,6 +19,10 @@ class ConnectionError(OrloError):
     """ Connection Error """
 
 
+class CircuitOpenError(ConnectionError):
+    """ Not connecting, the server has been failing """
+
+
 # Legacy exceptions for backwards compatibility
 OrloClientError = ClientError
 OrloServerError = ServerError
\ No newline at end of file
@@ -0,0 +1,409 @@
+from __future__ import print_function
+import json
+import logging
+import os
+import random
+import re
+import socket
+import threading
+from bisect import bisect_left
+from collections import namedtuple
+from six.moves.urllib.parse import urlparse
+
+__author__ = 'alforbes'
+
+logger = logging.getLogger(__name__)
+
+"""
+Instrumentation of client requests
+
+Hooks are callables given to OrloClient(hooks=[...]), or appended to
+client.hooks, and are called with an event for each:
+
+- request made to the server, after any retries (RequestEvent)
+- JSON document decoded (DecodeEvent)
+- lookup in the response cache (CacheEvent)
+
+With no hooks registered, nothing is timed and no events are created.
+
+Endpoints are URL paths with ids replaced by ":id", e.g.
+/releases/:id/packages/:id/start, so that metrics are not split by release.
+Requests is not able to report DNS and connect times, ttfb is the time until
+the response headers were parsed.
+
+Three hooks are provided. Metrics aggregates events into histograms and
+counters, exported in the Prometheus text format. StatsdExporter sends each
+event as StatsD lines over UDP, which does not need anything listening.
+SampledTrace logs a sample of the events as one line of JSON each, a cheaper
+alternative to debug logging, which includes whole response bodies.
+
+    metrics = Metrics()
+    client = OrloClient(uri, hooks=[metrics])
+    ...
+    print(metrics.prometheus())
+"""
+
+# A request to the server. status is None and error the exception class name
+# when no response was received. seconds covers every attempt and the waits in
+# between
+RequestEvent = namedtuple('RequestEvent', [
+    'method', 'endpoint', 'status', 'seconds', 'ttfb', 'request_bytes',
+    'response_bytes', 'retries', 'error'])
+
+# A JSON response body decoded
+DecodeEvent = namedtuple('DecodeEvent', ['endpoint', 'seconds', 'bytes'])
+
+# A lookup in the response cache. result is "hit", "miss" or "revalidated",
+# when a 304 response confirmed the cached document
+CacheEvent = namedtuple('CacheEvent', ['endpoint', 'result'])
+
+_ID_SEGMENT = re.compile(
+    r'^([0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-'
+    r'[0-9a-fA-F]{12}|[0-9]+)$')
+
+
+def endpoint_name(url):
+    """
+    The path of a URL, with ids replaced by :id
+    """
+    if not url:
+        return None
+    path = urlparse(url).path or '/'
+    return '/'.join(':id' if _ID_SEGMENT.match(s) else s
+                    for s in path.split('/'))
+
+
+def body_size(body):
+    if body is None:
+        return 0
+    if hasattr(body, 'read'):
+        # Streamed upload, size unknown
+        return None
+    return len(body)
+
+
+def emit(hooks, event):
+    """
+    Call each hook with an event, logging rather than raising hook errors
+    """
+    for hook in hooks:
+        try:
+            hook(event)
+        except Exception:
+            logger.exception("Instrumentation hook {!r} failed".format(hook))
+
+
+class Histogram(object):
+    """
+    Counts of observations falling into fixed buckets
+    """
+    # Prometheus client defaults, in seconds
+    DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.075, 0.1, 0.25, 0.5, 0.75,
+                       1.0, 2.5, 5.0, 7.5, 10.0)
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        # One more for observations above the last bucket
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q):
+        """
+        Upper bound of the bucket holding the q quantile, None when above
+        the last bucket or nothing was observed
+        """
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return None
+
+
+class Metrics(object):
+    """
+    Thread-safe aggregation of events into histograms and counters
+
+    Metric names and labels:
+
+    - orloclient_request_seconds{method,endpoint} histogram
+    - orloclient_request_ttfb_seconds{method,endpoint} histogram
+    - orloclient_requests_total{method,endpoint,status} counter, status is
+      the exception class name for failed requests
+    - orloclient_request_bytes_total{method,endpoint} counter
+    - orloclient_response_bytes_total{method,endpoint} counter
+    - orloclient_retries_total{method,endpoint} counter
+    - orloclient_json_decode_seconds{endpoint} histogram
+    - orloclient_json_decode_bytes_total{endpoint} counter
+    - orloclient_cache_total{endpoint,result} counter
+    """
+    HELP = {
+        'orloclient_request_seconds': 'Time taken by requests, including '
+                                      'retries',
+        'orloclient_request_ttfb_seconds': 'Time until response headers were '
+                                           'received',
+        'orloclient_requests_total': 'Requests by response status',
+        'orloclient_request_bytes_total': 'Request body bytes sent',
+        'orloclient_response_bytes_total': 'Response body bytes received',
+        'orloclient_retries_total': 'Requests retried',
+        'orloclient_json_decode_seconds': 'Time taken decoding JSON responses',
+        'orloclient_json_decode_bytes_total': 'JSON response bytes decoded',
+        'orloclient_cache_total': 'Response cache lookups by result',
+    }
+
+    def __init__(self, buckets=Histogram.DEFAULT_BUCKETS):
+        """
+        :param buckets: Upper bounds of the histogram buckets, in seconds
+        """
+        self.buckets = buckets
+        self._histograms = {}  # (name, labels) -> Histogram
+        self._counters = {}  # (name, labels) -> number
+        self._lock = threading.Lock()
+
+    def __call__(self, event):
+        with self._lock:
+            if isinstance(event, RequestEvent):
+                # Labels in name order, as looked up by counter()
+                labels = (('endpoint', event.endpoint),
+                          ('method', event.method))
+                status = event.error if event.status is None else \
+                    str(event.status)
+                self._observe('orloclient_request_seconds', labels,
+                              event.seconds)
+                if event.ttfb is not None:
+                    self._observe('orloclient_request_ttfb_seconds', labels,
+                                  event.ttfb)
+                self._add('orloclient_requests_total',
+                          labels + (('status', status),))
+                self._add('orloclient_request_bytes_total', labels,
+                          event.request_bytes or 0)
+                self._add('orloclient_response_bytes_total', labels,
+                          event.response_bytes or 0)
+                if event.retries:
+                    self._add('orloclient_retries_total', labels,
+                              event.retries)
+            elif isinstance(event, DecodeEvent):
+                labels = (('endpoint', event.endpoint),)
+                self._observe('orloclient_json_decode_seconds', labels,
+                              event.seconds)
+                self._add('orloclient_json_decode_bytes_total', labels,
+                          event.bytes)
+            elif isinstance(event, CacheEvent):
+                self._add('orloclient_cache_total',
+                          (('endpoint', event.endpoint),
+                           ('result', event.result)))
+
+    def _observe(self, name, labels, value):
+        histogram = self._histograms.get((name, labels))
+        if histogram is None:
+            histogram = self._histograms[(name, labels)] = Histogram(
+                self.buckets)
+        histogram.observe(value)
+
+    def _add(self, name, labels, value=1):
+        key = (name, labels)
+        self._counters[key] = self._counters.get(key, 0) + value
+
+    def counter(self, name, **labels):
+        """
+        Current value of a counter, 0 if it was never incremented
+        """
+        with self._lock:
+            return self._counters.get((name, tuple(sorted(labels.items()))),
+                                      0)
+
+    def histogram(self, name, **labels):
+        """
+        The Histogram for a metric and labels, or None
+        """
+        with self._lock:
+            return self._histograms.get(
+                (name, tuple(sorted(labels.items()))))
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+            self._counters.clear()
+
+    def prometheus(self):
+        """
+        Metrics in the Prometheus text exposition format
+        """
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted(
+                (key, list(h.counts), h.count, h.sum)
+                for key, h in self._histograms.items())
+
+        lines = []
+        declared = set()
+
+        def declare(name, kind):
+            if name not in declared:
+                declared.add(name)
+                lines.append('# HELP {} {}'.format(name, self.HELP[name]))
+                lines.append('# TYPE {} {}'.format(name, kind))
+
+        for (name, labels), value in counters:
+            declare(name, 'counter')
+            lines.append('{}{} {}'.format(name, _labels(labels), value))
+        for (name, labels), counts, count, total in histograms:
+            declare(name, 'histogram')
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                lines.append('{}_bucket{} {}'.format(
+                    name, _labels(labels + (('le', repr(float(bound))),)),
+                    cumulative))
+            lines.append('{}_bucket{} {}'.format(
+                name, _labels(labels + (('le', '+Inf'),)), count))
+            lines.append('{}_sum{} {!r}'.format(name, _labels(labels), total))
+            lines.append('{}_count{} {}'.format(name, _labels(labels), count))
+        return '\n'.join(lines) + '\n'
+
+    def write_textfile(self, path):
+        """
+        Write the metrics to a file, replacing it atomically, e.g. for the
+        node_exporter textfile collector
+        """
+        tmp = '{}.{}.tmp'.format(path, os.getpid())
+        with open(tmp, 'w') as f:
+            f.write(self.prometheus())
+        # os.replace overwrites on Windows too, but is not in Python 2
+        getattr(os, 'replace', os.rename)(tmp, path)
+
+
+def _labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(
+        '{}="{}"'.format(k, str(v).replace('\\', r'\\').replace('"', r'\"'))
+        for k, v in labels) + '}'
+
+
+class StatsdExporter(object):
+    """
+    Hook sending each event as StatsD lines
+
+    For a GET of /releases/:id answered with a 200, with prefix "orloclient":
+
+        orloclient.request.GET.releases_id:12.5|ms
+        orloclient.request.GET.releases_id.status.200:1|c
+        orloclient.request.GET.releases_id.response_bytes:1024|c
+    """
+
+    def __init__(self, host='127.0.0.1', port=8125, prefix='orloclient',
+                 send=None):
+        """
+        :param string host: StatsD server
+        :param int port: StatsD port
+        :param string prefix: Prepended to every metric name
+        :param send: Function send(line) to use instead of UDP, e.g. to write
+            the lines to a file
+        """
+        self.address = (host, port)
+        self.prefix = prefix
+        self._send = send
+        self._socket = None
+
+    def __call__(self, event):
+        for line in self.lines(event):
+            self.send(line)
+
+    def lines(self, event):
+        """
+        StatsD lines for an event
+        """
+        if isinstance(event, RequestEvent):
+            name = '{}.request.{}.{}'.format(
+                self.prefix, event.method, _statsd_name(event.endpoint))
+            status = event.error if event.status is None else event.status
+            lines = [
+                '{}:{:.3f}|ms'.format(name, event.seconds * 1000),
+                '{}.status.{}:1|c'.format(name, status),
+            ]
+            if event.ttfb is not None:
+                lines.append('{}.ttfb:{:.3f}|ms'.format(
+                    name, event.ttfb * 1000))
+            if event.request_bytes:
+                lines.append('{}.request_bytes:{}|c'.format(
+                    name, event.request_bytes))
+            if event.response_bytes:
+                lines.append('{}.response_bytes:{}|c'.format(
+                    name, event.response_bytes))
+            if event.retries:
+                lines.append('{}.retries:{}|c'.format(name, event.retries))
+            return lines
+        if isinstance(event, DecodeEvent):
+            return ['{}.decode.{}:{:.3f}|ms'.format(
+                self.prefix, _statsd_name(event.endpoint),
+                event.seconds * 1000)]
+        if isinstance(event, CacheEvent):
+            return ['{}.cache.{}.{}:1|c'.format(
+                self.prefix, _statsd_name(event.endpoint), event.result)]
+        return []
+
+    def send(self, line):
+        if self._send is not None:
+            self._send(line)
+            return
+        if self._socket is None:
+            self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        try:
+            self._socket.sendto(line.encode('utf-8'), self.address)
+        except (IOError, OSError) as e:
+            # Metrics are not worth failing a request for
+            logger.debug("Could not send to StatsD at {}: {}".format(
+                self.address, e))
+
+    def close(self):
+        if self._socket is not None:
+            self._socket.close()
+            self._socket = None
+
+
+class SampledTrace(object):
+    """
+    Hook logging a random sample of events as single-line JSON
+
+    Records are logged at DEBUG level on the orloclient.trace logger, which
+    can be enabled without enabling debug logging for the rest of orloclient:
+
+        logging.getLogger('orloclient.trace').setLevel(logging.DEBUG)
+
+    Each event is sampled independently, so a request may be traced without
+    its decode event.
+    """
+
+    def __init__(self, rate=0.01, logger_name='orloclient.trace'):
+        """
+        :param float rate: Fraction of events to log, 1 for all of them
+        :param string logger_name: Logger to log to
+        """
+        self.rate = rate
+        self.logger = logging.getLogger(logger_name)
+
+    def __call__(self, event):
+        if not self.logger.isEnabledFor(logging.DEBUG):
+            return
+        if self.rate < 1 and random.random() >= self.rate:
+            return
+        record = dict(event._asdict(), event=type(event).__name__)
+        self.logger.debug('%s', json.dumps(record, sort_keys=True))
+
+
+def _statsd_name(endpoint):
+    """
+    /releases/:id/stop -> releases_id_stop
+    """
+    name = re.sub(r'[^A-Za-z0-9_-]+', '_', endpoint or 'unknown')
+    return name.strip('_') or 'root'
@@ -0,0 +1,153 @@
+from __future__ import print_function
+import json
+import os
+import sys
+from collections import OrderedDict
+from .exceptions import ClientError
+
+__author__ = 'alforbes'
+
+"""
+JSON encoding and decoding with the fastest library installed
+
+orjson is used when it is installed, then ujson, then the json module. Set
+the ORLOCLIENT_JSON environment variable to orjson, ujson or json, or call
+set_codec(), to choose one.
+
+Responses are decoded straight from their bytes. Going through requests'
+response.json() or response.text first decodes the whole body into a str.
+
+The codecs differ slightly in their output: orjson leaves out the spaces after
+separators in compact output and writes non-ASCII characters as they are.
+Documents that only the json module can handle (integers wider than 64 bits,
+types it is extended to encode) are passed on to it.
+"""
+
+
+class JsonCodec(object):
+    """
+    The json module from the standard library
+    """
+    name = 'json'
+
+    def loads(self, data):
+        """
+        :param data: Document as bytes or text
+        """
+        if isinstance(data, bytes) and sys.version_info[:2] == (3, 5):
+            # json.loads takes bytes from Python 3.6
+            data = data.decode('utf-8')
+        return json.loads(data)
+
+    def dumps(self, obj, indent=None):
+        """
+        :param obj: Object to encode
+        :param int indent: Indent nested structures by this many spaces
+        :return string:
+        """
+        return json.dumps(obj, indent=indent)
+
+
+class OrjsonCodec(JsonCodec):
+    name = 'orjson'
+
+    def __init__(self):
+        import orjson
+        self.orjson = orjson
+
+    def loads(self, data):
+        try:
+            return self.orjson.loads(data)
+        except ValueError:
+            # Also raises for integers wider than 64 bits
+            return JsonCodec.loads(self, data)
+
+    def dumps(self, obj, indent=None):
+        if indent not in (None, 2):
+            # orjson can only indent by two spaces
+            return JsonCodec.dumps(self, obj, indent)
+        option = self.orjson.OPT_INDENT_2 if indent else 0
+        try:
+            return self.orjson.dumps(obj, option=option).decode('utf-8')
+        except TypeError:
+            return JsonCodec.dumps(self, obj, indent)
+
+
+class UjsonCodec(JsonCodec):
+    name = 'ujson'
+
+    def __init__(self):
+        import ujson
+        self.ujson = ujson
+
+    def loads(self, data):
+        try:
+            return self.ujson.loads(data)
+        except ValueError:
+            return JsonCodec.loads(self, data)
+
+    def dumps(self, obj, indent=None):
+        try:
+            return self.ujson.dumps(obj, indent=indent or 0,
+                                    escape_forward_slashes=False)
+        except (TypeError, OverflowError):
+            return JsonCodec.dumps(self, obj, indent)
+
+
+# In order of preference
+CODECS = OrderedDict([
+    ('orjson', OrjsonCodec),
+    ('ujson', UjsonCodec),
+    ('json', JsonCodec),
+])
+
+_codec = None
+
+
+def set_codec(name=None):
+    """
+    Choose the codec used by loads() and dumps()
+
+    :param string name: orjson, ujson or json. None for the fastest one
+        installed, or the one named by ORLOCLIENT_JSON
+    :return: The codec chosen
+    """
+    global _codec
+    name = name or os.environ.get('ORLOCLIENT_JSON')
+    if name:
+        try:
+            _codec = CODECS[name]()
+        except KeyError:
+            raise ClientError("Unknown JSON codec {}, choose one of {}".format(
+                name, ', '.join(CODECS)))
+        except ImportError:
+            raise ClientError("JSON codec {} is not installed".format(name))
+        return _codec
+
+    for codec_class in CODECS.values():
+        try:
+            _codec = codec_class()
+            return _codec
+        except ImportError:
+            pass
+
+
+def get_codec():
+    """
+    The codec in use, chosen on first use
+    """
+    return _codec or set_codec()
+
+
+def loads(data):
+    """
+    Decode a JSON document from bytes or text
+    """
+    return (_codec or set_codec()).loads(data)
+
+
+def dumps(obj, indent=None):
+    """
+    Encode an object as JSON text
+    """
+    return (_codec or set_codec()).dumps(obj, indent)
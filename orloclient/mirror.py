@@ -0,0 +1,390 @@
+from __future__ import print_function
+import logging
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime, timedelta
+from . import jsoncodec
+from .bulk import run_bulk
+from .columnar import parse_time
+from .exceptions import ClientError
+from .objects import Release, Package
+from .records import ReleaseRecord, PackageRecord
+
+__author__ = 'alforbes'
+
+logger = logging.getLogger(__name__)
+
+"""
+A local, indexed copy of the releases on an Orlo server
+
+Questions like "which versions of package X are on platform Y" or "failed
+packages in the last day" each scan releases over HTTP. A LocalMirror keeps
+the releases in an SQLite database, indexed on package name, platform, team,
+user, status and stime, and answers the same filters as get_releases and
+get_packages from it.
+
+sync() brings it up to date incrementally: it fetches the releases started
+since the newest one already held, and fetches again the releases that had not
+finished at the last sync. The first sync streams every release.
+
+    mirror = LocalMirror(client, '/var/tmp/orlo-mirror.sqlite')
+    mirror.sync()
+    mirror.get_packages(name='web-app', platform='prod', status='SUCCESSFUL')
+
+Times are held as UTC, in a format that sorts as text.
+"""
+
+_TIME_FORMAT = '%Y-%m-%dT%H:%M:%S.%f'
+
+_SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS releases ("
+    "id TEXT PRIMARY KEY, user TEXT, team TEXT, stime TEXT, ftime TEXT, "
+    "duration REAL, document TEXT NOT NULL)",
+    "CREATE TABLE IF NOT EXISTS platforms ("
+    "release_id TEXT NOT NULL, platform TEXT NOT NULL)",
+    "CREATE TABLE IF NOT EXISTS packages ("
+    "id TEXT PRIMARY KEY, release_id TEXT NOT NULL, name TEXT, version TEXT, "
+    "status TEXT, rollback INTEGER, stime TEXT, ftime TEXT, duration REAL, "
+    "document TEXT NOT NULL)",
+    "CREATE TABLE IF NOT EXISTS state (key TEXT PRIMARY KEY, value TEXT)",
+    "CREATE INDEX IF NOT EXISTS releases_stime ON releases (stime)",
+    "CREATE INDEX IF NOT EXISTS releases_user ON releases (user, stime)",
+    "CREATE INDEX IF NOT EXISTS releases_team ON releases (team, stime)",
+    "CREATE INDEX IF NOT EXISTS releases_unfinished ON releases (ftime) "
+    "WHERE ftime IS NULL",
+    "CREATE INDEX IF NOT EXISTS platforms_platform ON platforms (platform)",
+    "CREATE INDEX IF NOT EXISTS platforms_release ON platforms (release_id)",
+    "CREATE INDEX IF NOT EXISTS packages_name ON packages (name, version)",
+    "CREATE INDEX IF NOT EXISTS packages_status ON packages (status, stime)",
+    "CREATE INDEX IF NOT EXISTS packages_stime ON packages (stime)",
+    "CREATE INDEX IF NOT EXISTS packages_release ON packages (release_id)",
+)
+
+# Filter -> SQL condition, for releases (r) joined to nothing, and packages
+# (p) joined to their release (r)
+_RELEASE_FILTERS = {
+    'user': "r.user = ?",
+    'team': "r.team = ?",
+    'platform': "r.id IN (SELECT release_id FROM platforms WHERE platform = ?)",
+    'package_id': "r.id IN (SELECT release_id FROM packages WHERE id = ?)",
+    'package_name': "r.id IN (SELECT release_id FROM packages WHERE name = ?)",
+    'package_version':
+        "r.id IN (SELECT release_id FROM packages WHERE version = ?)",
+    'package_status':
+        "r.id IN (SELECT release_id FROM packages WHERE status = ?)",
+    'package_rollback':
+        "r.id IN (SELECT release_id FROM packages WHERE rollback = ?)",
+    'stime_before': "r.stime < ?",
+    'stime_after': "r.stime > ?",
+    'ftime_before': "r.ftime < ?",
+    'ftime_after': "r.ftime > ?",
+    'duration_lt': "r.duration < ?",
+    'duration_gt': "r.duration > ?",
+}
+
+_PACKAGE_FILTERS = {
+    'release_id': "p.release_id = ?",
+    'name': "p.name = ?",
+    'version': "p.version = ?",
+    'status': "p.status = ?",
+    'rollback': "p.rollback = ?",
+    'user': "r.user = ?",
+    'team': "r.team = ?",
+    'platform':
+        "p.release_id IN (SELECT release_id FROM platforms WHERE platform = ?)",
+    'stime_before': "p.stime < ?",
+    'stime_after': "p.stime > ?",
+    'ftime_before': "p.ftime < ?",
+    'ftime_after': "p.ftime > ?",
+    'duration_lt': "p.duration < ?",
+    'duration_gt': "p.duration > ?",
+}
+
+
+def default_mirror_path():
+    """
+    ~/.cache/orloclient/mirror.sqlite, honouring XDG_CACHE_HOME
+    """
+    base = os.environ.get('XDG_CACHE_HOME') or os.path.join(
+        os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'orloclient', 'mirror.sqlite')
+
+
+def _time(value):
+    """
+    A time given as an Orlo string, datetime or Arrow object, as stored
+
+    Naive datetimes are taken to be UTC.
+    """
+    if value is None:
+        return None
+    if hasattr(value, 'naive') and hasattr(value, 'to'):  # Arrow
+        value = value.to('UTC').naive
+    elif isinstance(value, datetime):
+        if value.utcoffset() is not None:
+            value = value.replace(tzinfo=None) - value.utcoffset()
+    else:
+        value = parse_time(value)
+    return value.strftime(_TIME_FORMAT)
+
+
+def _flag(value):
+    if isinstance(value, bool) or value is None:
+        return value
+    return str(value).lower() in ('1', 'true', 'yes')
+
+
+class LocalMirror(object):
+    """
+    SQLite copy of the releases of one Orlo server
+    """
+
+    def __init__(self, client, path=None, overlap=60, max_workers=10,
+                 timeout=30):
+        """
+        :param OrloClient() client: Client to the server being mirrored
+        :param string path: Database file, defaults to default_mirror_path()
+        :param float overlap: Seconds before the newest release held to
+            fetch again on sync, for releases created meanwhile with an
+            earlier stime
+        :param int max_workers: Concurrent requests when refreshing
+            unfinished releases
+        :param float timeout: Seconds to wait for another process's lock
+        """
+        self.client = client
+        self.path = path or default_mirror_path()
+        self.overlap = overlap
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self._local = threading.local()
+        self._sync_lock = threading.Lock()
+
+        directory = os.path.dirname(self.path)
+        if directory and not os.path.isdir(directory):
+            try:
+                os.makedirs(directory)
+            except OSError:  # Created by another process meanwhile
+                if not os.path.isdir(directory):
+                    raise
+        with self._db as db:
+            for statement in _SCHEMA:
+                db.execute(statement)
+            uri = self._state(db, 'uri')
+            if uri is None:
+                self._set_state(db, 'uri', client.uri)
+            elif uri != client.uri:
+                raise ClientError(
+                    "{} mirrors {}, not {}".format(self.path, uri, client.uri))
+
+    @property
+    def _db(self):
+        db = getattr(self._local, 'db', None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=self.timeout)
+            # WAL lets readers carry on while a sync writes
+            db.execute("PRAGMA journal_mode=WAL")
+            self._local.db = db
+        return db
+
+    def close(self):
+        """
+        Close this thread's connection to the database
+        """
+        db = getattr(self._local, 'db', None)
+        if db is not None:
+            db.close()
+            self._local.db = None
+
+    @staticmethod
+    def _state(db, key):
+        row = db.execute(
+            "SELECT value FROM state WHERE key = ?", (key,)).fetchone()
+        return None if row is None else row[0]
+
+    @staticmethod
+    def _set_state(db, key, value):
+        db.execute("INSERT OR REPLACE INTO state (key, value) VALUES (?, ?)",
+                   (key, value))
+
+    @property
+    def synced_at(self):
+        """
+        When the last sync finished, as a Unix timestamp, None if never
+        """
+        value = self._state(self._db, 'synced_at')
+        return None if value is None else float(value)
+
+    def sync(self, batch_size=1000):
+        """
+        Fetch the releases started or changed since the last sync
+
+        :param int batch_size: Releases written per transaction
+        :return dict: Number of releases fetched, and of unfinished releases
+            fetched again
+        """
+        with self._sync_lock:
+            db = self._db
+            newest = db.execute("SELECT MAX(stime) FROM releases").fetchone()[0]
+            filters = {}
+            if newest is not None:
+                since = datetime.strptime(newest, _TIME_FORMAT) - timedelta(
+                    seconds=self.overlap)
+                filters['stime_after'] = since.strftime('%Y-%m-%dT%H:%M:%SZ')
+                unfinished = [row[0] for row in db.execute(
+                    "SELECT id FROM releases WHERE ftime IS NULL "
+                    "AND stime <= ?", (since.strftime(_TIME_FORMAT),))]
+            else:
+                unfinished = []
+
+            fetched = 0
+            batch = []
+            for release in self.client.stream_releases(raw=True, **filters):
+                batch.append(release)
+                if len(batch) >= batch_size:
+                    fetched += self._store(batch)
+                    batch = []
+            fetched += self._store(batch)
+
+            refreshed = []
+            for result in run_bulk(self.client.get_release_json, unfinished,
+                                   self.max_workers):
+                if result.ok:
+                    refreshed.extend(result.result['releases'])
+                else:
+                    logger.warning("Could not refresh release %s: %s",
+                                   result.item, result.error)
+            self._store(refreshed)
+
+            with db:
+                self._set_state(db, 'synced_at', repr(time.time()))
+            logger.debug("Synced %s releases, refreshed %s of %s unfinished",
+                         fetched, len(refreshed), len(unfinished))
+            return {'fetched': fetched, 'refreshed': len(refreshed)}
+
+    def _store(self, releases):
+        """
+        Insert or replace releases and their packages
+        """
+        if not releases:
+            return 0
+        with self._db as db:
+            for r in releases:
+                rid = r['id']
+                db.execute("DELETE FROM platforms WHERE release_id = ?", (rid,))
+                db.execute("DELETE FROM packages WHERE release_id = ?", (rid,))
+                db.execute(
+                    "INSERT OR REPLACE INTO releases "
+                    "(id, user, team, stime, ftime, duration, document) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (rid, r.get('user'), r.get('team'), _time(r.get('stime')),
+                     _time(r.get('ftime')), r.get('duration'),
+                     jsoncodec.dumps(r)))
+                db.executemany(
+                    "INSERT INTO platforms (release_id, platform) "
+                    "VALUES (?, ?)",
+                    [(rid, platform) for platform in r.get('platforms') or ()])
+                db.executemany(
+                    "INSERT OR REPLACE INTO packages "
+                    "(id, release_id, name, version, status, rollback, stime, "
+                    "ftime, duration, document) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    [(p['id'], rid, p.get('name'), p.get('version'),
+                      p.get('status'), p.get('rollback'),
+                      _time(p.get('stime')), _time(p.get('ftime')),
+                      p.get('duration'),
+                      jsoncodec.dumps(dict(p, release_id=rid)))
+                     for p in r.get('packages') or ()])
+        return len(releases)
+
+    def _query(self, table, alias, filter_sql, filters):
+        """
+        Documents of the rows matching the filters, oldest first
+
+        :param dict filters: As for get_releases or get_packages, plus limit,
+            offset and desc
+        """
+        filters = dict((k, v) for k, v in filters.items() if v is not None)
+        limit = filters.pop('limit', None)
+        offset = filters.pop('offset', None)
+        desc = _flag(filters.pop('desc', False))
+
+        conditions, params = [], []
+        for key, value in sorted(filters.items()):
+            try:
+                conditions.append(filter_sql[key])
+            except KeyError:
+                raise ClientError(
+                    "The local mirror can't filter on {}, choose from {}".format(
+                        key, ', '.join(sorted(filter_sql))))
+            if 'time_' in key:
+                value = _time(value)
+            elif 'rollback' in key:
+                value = _flag(value)
+            params.append(value)
+
+        sql = "SELECT {a}.document FROM {t} {a}".format(t=table, a=alias)
+        if alias == 'p':
+            sql += " JOIN releases r ON r.id = p.release_id"
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        sql += " ORDER BY {}.stime {}".format(alias, 'DESC' if desc else 'ASC')
+        if limit is not None or offset is not None:
+            sql += " LIMIT ? OFFSET ?"
+            params += [-1 if limit is None else int(limit), int(offset or 0)]
+        return [jsoncodec.loads(row[0])
+                for row in self._db.execute(sql, params)]
+
+    def get_releases(self, raw=False, compact=False, **kwargs):
+        """
+        Releases matching the filters, from the mirror
+
+        Takes the same filters as OrloClient.get_releases; a filter the
+        mirror doesn't know raises ClientError rather than being ignored.
+
+        :param bool raw: Return the raw dictionaries rather than Release objects
+        :param bool compact: Return ReleaseRecord objects
+        :param kwargs: Filters to apply
+        """
+        releases = self._query('releases', 'r', _RELEASE_FILTERS, kwargs)
+        if raw:
+            return releases
+        elif compact:
+            return [ReleaseRecord(r) for r in releases]
+        else:
+            return Release.from_dicts(self.client, releases)
+
+    def get_packages(self, raw=False, compact=False, **kwargs):
+        """
+        Packages matching the filters, from the mirror
+
+        Also filters packages on the user, team and platform of their release.
+
+        :param bool raw: Return the raw dictionaries rather than Package objects
+        :param bool compact: Return PackageRecord objects
+        :param kwargs: Filters to apply
+        """
+        packages = self._query('packages', 'p', _PACKAGE_FILTERS, kwargs)
+        if raw:
+            return packages
+        elif compact:
+            return [PackageRecord(p) for p in packages]
+        else:
+            return Package.from_dicts(packages)
+
+    def stats(self):
+        """
+        Number of releases and packages held, and when the last sync finished
+        """
+        db = self._db
+        return {
+            'releases': db.execute(
+                "SELECT COUNT(*) FROM releases").fetchone()[0],
+            'packages': db.execute(
+                "SELECT COUNT(*) FROM packages").fetchone()[0],
+            'unfinished': db.execute(
+                "SELECT COUNT(*) FROM releases WHERE ftime IS NULL"
+            ).fetchone()[0],
+            'synced_at': self.synced_at,
+        }
@@ -1,5 +1,8 @@
 from __future__ import print_function
 from orloclient import OrloClient, Release, Package
+from orloclient import columnar
+from orloclient.bulk import BulkResult
+from orloclient.watch import ReleaseTracker
 import json
 import uuid
 
@@ -64,7 +67,7 @@ class MockOrloClient(object):
         }
     }
 
-    def __init__(self, uri, timeout=10, verify_ssl=True):
+    def __init__(self, uri, timeout=10, verify_ssl=True, **kwargs):
         self.uri = uri
 
         self.example_package = Package(
@@ -81,6 +84,19 @@ class MockOrloClient(object):
 
         self.example_release.packages = [self.example_package]
 
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self, timeout=None):
+        pass
+
+    @staticmethod
+    def flush(timeout=None):
+        return True
+
     def ping(self):
         return True
 
@@ -92,12 +108,56 @@ class MockOrloClient(object):
             'releases': [self.example_release_dict]
         }
 
+    def get_releases_by_id(self, release_ids, max_workers=None):
+        return [BulkResult(r, self.example_release, None)
+                for r in release_ids]
+
+    def get_packages_by_id(self, package_ids, max_workers=None):
+        return [BulkResult(p, self.example_package, None)
+                for p in package_ids]
+
     def get_releases(self, *args, **kwargs):
         response = {
             'releases': [self.example_release_dict]
         }
         return json.dumps(response)
 
+    def iter_releases(self, raw=False, compact=False, page_size=100,
+                      **kwargs):
+        if raw:
+            yield self.example_release_dict
+        else:
+            yield self.example_release
+
+    def iter_packages(self, raw=False, compact=False, page_size=100,
+                      **kwargs):
+        if raw:
+            yield self.example_package_dict
+        else:
+            yield self.example_package
+
+    def stream_releases(self, raw=False, compact=False, chunk_size=65536,
+                        **kwargs):
+        return self.iter_releases(raw=raw, compact=compact)
+
+    def stream_packages(self, raw=False, compact=False, chunk_size=65536,
+                        **kwargs):
+        return self.iter_packages(raw=raw, compact=compact)
+
+    def export_releases(self, format=None, **kwargs):
+        return columnar.release_columns(
+            [self.example_release_dict], format=format)
+
+    def export_packages(self, format=None, **kwargs):
+        return columnar.package_columns(
+            [self.example_package_dict], format=format)
+
+    def watch(self, release_ids, **kwargs):
+        # The example release has finished
+        tracker = ReleaseTracker(
+            [r for r in release_ids if r == self.example_release_dict['id']])
+        return iter(tracker.update(self.example_release_dict))
+
     def get_package(self, *args, **kwargs):
         return self.example_package
 
@@ -115,6 +175,17 @@ class MockOrloClient(object):
     def create_package(self, *args, **kwargs):
         return self.example_package
 
+    def create_packages(self, release, packages, max_workers=None):
+        return [BulkResult(p, self.example_package, None) for p in packages]
+
+    @staticmethod
+    def packages_start(packages, max_workers=None):
+        return [BulkResult(p, True, None) for p in packages]
+
+    @staticmethod
+    def packages_stop(packages, success=True, max_workers=None):
+        return [BulkResult(p, True, None) for p in packages]
+
     @staticmethod
     def get_info(field, name=None, platform=None):
         return {'foo': {'bar': 1}}
@@ -143,5 +214,5 @@ class MockOrloClient(object):
         return True
 
     @staticmethod
-    def get_versions():
+    def get_versions(platform=None):
         return {'package_one': '1.2.3'}
@@ -1,47 +1,250 @@
 from __future__ import print_function
+from . import jsoncodec
 from .exceptions import ClientError
-import json
-import arrow
+import re
+import time
 import uuid
 
 __author__ = 'alforbes'
 
+_ISO_8601 = re.compile(
+    r'(\d{4})-(\d\d)-(\d\d)[T ](\d\d):(\d\d):(\d\d)(?:\.(\d{1,6})\d*)?'
+    r'(Z|[+-]\d\d:?\d\d)?$')
 
-def cast_type(item, value):
+# Time string -> (datetime fields, UTC offset in seconds), or None when only
+# arrow can parse it. Releases share their times with their packages, and
+# pages of results share dates, so most strings are seen many times
+_time_cache = {}
+_TIME_CACHE_SIZE = 4096
+
+
+def cast_time(value):
+    """
+    Parse an ISO 8601 time as arrow would, without going through arrow.get
+
+    arrow.get() is slow for every string, handle the format Orlo returns
+    here and remember what each string parsed to. A new Arrow object is
+    returned every time.
+
+    :param string value: Time, as returned by Orlo
+    :return arrow.Arrow:
+    """
+    # arrow is slow to import, only load it once a time is needed
+    import arrow
+    try:
+        parsed = _time_cache[value]
+    except KeyError:
+        parsed = _parse_time(value)
+        if len(_time_cache) >= _TIME_CACHE_SIZE:
+            _time_cache.clear()
+        _time_cache[value] = parsed
+
+    if parsed is None:
+        return arrow.get(value)
+    fields, offset = parsed
+    from dateutil import tz
+    tzinfo = tz.tzutc() if offset is None else tz.tzoffset(None, offset)
+    return arrow.Arrow(*fields, tzinfo=tzinfo)
+
+
+def _parse_time(value):
+    match = _ISO_8601.match(value)
+    if match is None:
+        return None
+    groups = match.groups()
+    fields = tuple(int(g) for g in groups[:6]) + (
+        int(groups[6].ljust(6, '0')) if groups[6] else 0,)
+    offset = groups[7]
+    if offset is None or offset == 'Z':
+        return fields, None
+    sign = -1 if offset[0] == '-' else 1
+    offset = offset[1:].replace(':', '')
+    return fields, sign * (int(offset[:2]) * 3600 + int(offset[2:]) * 60)
+
+
+# The items of releases and packages, and the function casting their values.
+# None where the value is the correct type as decoded from JSON, and for
+# items not listed here
+RELEASE_SCHEMA = {
+    'id': uuid.UUID,
+    'stime': cast_time,
+    'ftime': cast_time,
+    'user': None,
+    'team': None,
+    'duration': None,
+    'platforms': None,
+    'references': None,
+    'notes': None,
+    'metadata': None,
+    'packages': None,
+}
+
+PACKAGE_SCHEMA = {
+    'id': uuid.UUID,
+    'release_id': uuid.UUID,
+    'stime': cast_time,
+    'ftime': cast_time,
+    'name': None,
+    'version': None,
+    'status': None,
+    'rollback': None,
+    'duration': None,
+    'diff_url': None,
+}
+
+# Both, for cast_type which is not told which one an item belongs to
+_SCHEMA = dict(RELEASE_SCHEMA)
+_SCHEMA.update(PACKAGE_SCHEMA)
+
+
+def converter(item, schema=None):
+    """
+    The function casting the values of an item
+
+    :param item: The parameter/variable name
+    :param dict schema: RELEASE_SCHEMA or PACKAGE_SCHEMA, None for either
+    :return: A function of one value, or None when values are returned as
+        given
+    """
+    return (_SCHEMA if schema is None else schema).get(item)
+
+
+def cast_type(item, value, schema=None):
     """
     Cast the item as the correct type
 
     Some non-base objects (times and uuids) need to be cast manually.
-    Rest are already the correct type courtesy of being imported with json.loads.
+    Rest are already the correct type courtesy of being imported with json.loads,
+    as are items not in the release or package schema. Values that are None
+    stay None.
 
     :param item: The parameter/variable name
     :param value: The value to cast
+    :param dict schema: RELEASE_SCHEMA or PACKAGE_SCHEMA, None for either
     """
-    if item.endswith('_id') or item == 'id':
-        return uuid.UUID(value)
-    if 'time' in item:
-        return arrow.get(value)
+    cast = converter(item, schema)
+    if cast is None or value is None:
+        # If no matches, return as given
+        return value
+    return cast(value)
+
 
-    # If no matches, return as given
-    return value
+def cast_records(records, schema=None):
+    """
+    Cast the items of many releases or packages at once
+
+    Works a column at a time: each converter in the schema is applied to its
+    item in every record. Values that are None stay None.
+
+    :param list records: Release or package dictionaries, as returned by Orlo
+    :param dict schema: RELEASE_SCHEMA, PACKAGE_SCHEMA, or another mapping
+        of item to converter. None for the items cast_type casts
+    :return list: New dictionaries with the cast values, in the same order
+    """
+    schema = _SCHEMA if schema is None else schema
+    cast = [dict(record) for record in records]
+    for item, func in schema.items():
+        if func is None:
+            continue
+        for record in cast:
+            value = record.get(item)
+            if value is not None:
+                record[item] = func(value)
+    return cast
 
 
 class Release(object):
-    def __init__(self, client, release_id):
+    # Class level defaults, so that __getattr__ never recurses looking for them
+    _data = None
+    _fetched_at = None
+    _cache = None
+    max_age = None
+
+    def __init__(self, client, release_id, data=None, max_age=None):
         """
         A base class to handle fetching attributes from the Orlo server
 
+        A Release created with data is pre-hydrated and will not contact the
+        server until the data is stale. Data is only considered stale after
+        max_age seconds, or never if max_age is None; use refresh() to fetch
+        the current state explicitly, or invalidate() to fetch it on the next
+        attribute access.
+
         :param string release_id: Release ID
         :param OrloClient() client: OrloClient instance pointing to the server
+        :param dict data: Release document as returned by get_release_json
+        :param float max_age: Seconds after which the data is re-fetched
         """
         self.client = client
+        self.max_age = max_age
         # Don't access this directly before calling fetch(), or you get None
         # Recommend not using it at all, use "data" instead
         self._data = None
+        if data is not None:
+            self._set_data(data)
 
         self.id = self.release_id = release_id
         self.uuid = uuid.UUID(release_id)
 
+    @classmethod
+    def from_dict(cls, client, release_dict, max_age=None):
+        """
+        Create a pre-hydrated Release from one element of a "releases" list
+
+        :param OrloClient() client: OrloClient instance pointing to the server
+        :param dict release_dict: A single release, as returned by Orlo
+        :param float max_age: Seconds after which the data is re-fetched
+        """
+        return cls(client, release_dict['id'],
+                   data={'releases': [release_dict]}, max_age=max_age)
+
+    @classmethod
+    def from_dicts(cls, client, release_dicts, max_age=None):
+        """
+        Create pre-hydrated Releases from a "releases" list, cast in bulk
+
+        The attributes of every release are cast up front with cast_records,
+        except packages, which are still created on first access.
+
+        :param OrloClient() client: OrloClient instance pointing to the server
+        :param list release_dicts: Releases, as returned by Orlo
+        :param float max_age: Seconds after which the data is re-fetched
+        """
+        releases = []
+        for release_dict, cast in zip(
+                release_dicts, cast_records(release_dicts, RELEASE_SCHEMA)):
+            release = cls.from_dict(client, release_dict, max_age=max_age)
+            cast.pop('packages', None)
+            release._cache.update(cast)
+            releases.append(release)
+        return releases
+
+    @property
+    def stale(self):
+        """
+        Whether the data needs to be fetched before it is used
+        """
+        if self._data is None:
+            return True
+        if self.max_age is None:
+            return False
+        return time.time() - self._fetched_at > self.max_age
+
+    @property
+    def age(self):
+        """
+        Seconds since the data was fetched, None if it never was
+        """
+        if self._fetched_at is None:
+            return None
+        return time.time() - self._fetched_at
+
+    def _set_data(self, data):
+        self._data = data
+        self._fetched_at = time.time()
+        # Cast attribute values, only valid for this version of the data
+        self._cache = {}
+
     def __getattr__(self, item):
         """
         Fetch the attribute from Orlo
@@ -53,15 +256,21 @@ class Release(object):
         :param item:
         :return:
         """
-        if not object.__getattribute__(self, '_data'):
+        if self.stale:
             self.fetch()
 
         # For returning the raw data
         if item == 'data':
             return self._data
 
+        try:
+            return self._cache[item]
+        except KeyError:
+            pass
+
         if item == 'packages':
-            return self.list_packages()
+            value = self._cache[item] = self.list_packages()
+            return value
 
         try:
             # The data returned by Orlo is a JSON structure, containing a list
@@ -71,26 +280,29 @@ class Release(object):
             value = self._data['releases'][0][item]
         except KeyError:
             raise ClientError("This object does not have attribute '{}'\n{}".format(
-                item, json.dumps(self._data, indent=2)
+                item, jsoncodec.dumps(self._data, indent=2)
             ))
 
-        return cast_type(item, value)
+        value = self._cache[item] = cast_type(item, value, RELEASE_SCHEMA)
+        return value
 
     def list_packages(self):
         """
         Return a list of Package objects
 
+        A new list is built on every call, the "packages" attribute holds the
+        same list until the data is fetched again.
+
         :return list:
         """
         l = []
-        data = self.data
-        for p in self.data['releases'][0]['packages']:
+        packages = self.data['releases'][0]['packages']
+        for p, cast in zip(packages, cast_records(packages, PACKAGE_SCHEMA)):
             # Create Package
             pkg = Package(self.id, p['id'], p['name'], p['version'])
 
             # Set all attributes from the data
-            for item, value in p.items():
-                setattr(pkg, item, cast_type(item, value))
+            pkg.__dict__.update(cast)
             l.append(pkg)
         return l
 
@@ -98,7 +310,22 @@ class Release(object):
         """
         Fetch the data for a release
         """
-        self._data = self.client.get_release_json(self.release_id)
+        self._set_data(self.client.get_release_json(self.release_id))
+
+    def refresh(self):
+        """
+        Fetch the current state of the release, regardless of staleness
+        """
+        self.fetch()
+        return self
+
+    def invalidate(self):
+        """
+        Mark the data as stale, it is fetched again on the next access
+        """
+        self._data = None
+        self._fetched_at = None
+        self._cache = None
 
     def deploy(self):
         """
@@ -117,6 +344,17 @@ class Release(object):
         pkg = self.client.create_package(self, name, version)
         return pkg
 
+    def add_packages(self, packages, max_workers=None):
+        """
+        Create several packages concurrently and add them to this release
+
+        :param list packages: List of (name, version) tuples
+        :param int max_workers: Maximum concurrent requests
+        :return list: BulkResult for each (name, version), in the order given
+        """
+        return self.client.create_packages(
+            self, packages, max_workers=max_workers)
+
 
 class Package(object):
     def __init__(self, release_id, package_id, package_name, version):
@@ -136,6 +374,47 @@ class Package(object):
             'version': self.version,
         }
 
+    @classmethod
+    def from_dict(cls, package_dict, release_id=None):
+        """
+        Create a Package with every attribute of an Orlo package document
+
+        The required attributes are set as given, the rest are cast as in
+        Release.list_packages.
+
+        :param dict package_dict: A single package, as returned by Orlo
+        :param release_id: Release ID, if not present in package_dict
+        """
+        pkg = cls(
+            package_dict.get('release_id', release_id),
+            package_dict['id'], package_dict['name'], package_dict['version'],
+        )
+        for item, value in package_dict.items():
+            if item not in pkg.data:
+                setattr(pkg, item, cast_type(item, value, PACKAGE_SCHEMA))
+        return pkg
+
+    @classmethod
+    def from_dicts(cls, package_dicts, release_id=None):
+        """
+        Create Packages from a "packages" list, cast in bulk
+
+        Equivalent to calling from_dict on each, see cast_records.
+
+        :param list package_dicts: Packages, as returned by Orlo
+        :param release_id: Release ID, for packages without one
+        """
+        packages = []
+        for p, cast in zip(package_dicts,
+                           cast_records(package_dicts, PACKAGE_SCHEMA)):
+            pkg = cls(p.get('release_id', release_id),
+                      p['id'], p['name'], p['version'])
+            for item in pkg.data:
+                cast.pop(item, None)
+            pkg.__dict__.update(cast)
+            packages.append(pkg)
+        return packages
+
     def to_dict(self):
         return self.data
 
@@ -0,0 +1,212 @@
+from __future__ import print_function
+import uuid
+from .exceptions import ClientError
+from .objects import RELEASE_SCHEMA, PACKAGE_SCHEMA
+
+try:
+    from sys import intern
+except ImportError:  # Python 2
+    pass
+
+__author__ = 'alforbes'
+
+"""
+Memory-compact, read-only representations of releases and packages
+
+Release and Package objects keep the raw response around, and a Release
+holds a reference to the client so it can fetch itself. That is fine for a
+handful of objects, but adds up when holding tens of thousands of them.
+
+The records here use __slots__, keep only the fields Orlo returns, share one
+copy of repeated strings (platform, team, user, status, package names and
+versions), and never fetch anything. Attributes are cast the same way as on
+Release and Package, on every access rather than cached.
+"""
+
+
+def _intern(value):
+    """
+    Return a shared copy of a string, or the value as given
+
+    intern() only accepts str, which excludes Python 2 unicode strings.
+    """
+    try:
+        return intern(value)
+    except TypeError:
+        return value
+
+
+def _cast_property(name, schema):
+    """
+    A property casting the raw value held in slot "_<name>"
+
+    :param dict schema: RELEASE_SCHEMA or PACKAGE_SCHEMA
+    """
+    slot = '_' + name
+    cast = schema[name]
+
+    def getter(self):
+        value = getattr(self, slot)
+        if value is None:
+            return None
+        return cast(value)
+    return property(getter)
+
+
+class _Record(object):
+    __slots__ = ()
+    # Fields held in slots, everything else goes into _extra
+    _fields = ()
+    _interned = ()
+    # Fields held in "_<name>" slots and exposed through a property
+    _cast = ()
+    _schema = {}
+
+    def __getattr__(self, item):
+        """
+        Look up fields the server returned that we have no slot for
+        """
+        if item.startswith('__'):
+            raise AttributeError(item)
+        extra = object.__getattribute__(self, '_extra')
+        if extra is None or item not in extra:
+            raise ClientError(
+                "This object does not have attribute '{}'".format(item))
+        cast = self._schema.get(item)
+        value = extra[item]
+        return value if cast is None or value is None else cast(value)
+
+    def _load(self, d):
+        for field in self._fields:
+            value = d.get(field)
+            if field in self._interned:
+                value = _intern(value)
+            setattr(self, '_' + field if field in self._cast else field,
+                    value)
+        extra = dict((k, v) for k, v in d.items() if k not in self._fields)
+        self._extra = extra or None
+
+    def to_dict(self):
+        """
+        Rebuild the raw dictionary, as returned by Orlo
+
+        Known fields missing from the original are included as None.
+        """
+        d = {}
+        for field in self._fields:
+            d[field] = getattr(
+                self, '_' + field if field in self._cast else field)
+        if self._extra:
+            d.update(self._extra)
+        return d
+
+    def __repr__(self):
+        return '<{} {}>'.format(self.__class__.__name__, self.id)
+
+
+class PackageRecord(_Record):
+    """
+    Compact, read-only equivalent of Package
+    """
+    __slots__ = ('id', 'release_id', 'name', 'version', 'status', 'rollback',
+                 'duration', 'diff_url', '_stime', '_ftime', '_extra')
+    _fields = ('id', 'release_id', 'name', 'version', 'status', 'rollback',
+               'duration', 'diff_url', 'stime', 'ftime')
+    _interned = ('name', 'version', 'status')
+    _cast = ('stime', 'ftime')
+    _schema = PACKAGE_SCHEMA
+
+    stime = _cast_property('stime', PACKAGE_SCHEMA)
+    ftime = _cast_property('ftime', PACKAGE_SCHEMA)
+
+    def __init__(self, package_dict, release_id=None):
+        """
+        :param dict package_dict: A single package, as returned by Orlo
+        :param release_id: Release ID, if not present in package_dict
+        """
+        self._load(package_dict)
+        if self.release_id is None:
+            self.release_id = release_id
+
+    @property
+    def data(self):
+        return self.to_dict()
+
+
+class ReleaseRecord(_Record):
+    """
+    Compact, read-only equivalent of Release
+    """
+    __slots__ = ('id', 'user', 'team', 'duration', '_platforms',
+                 '_references', '_notes', '_metadata', '_packages',
+                 '_stime', '_ftime', '_extra')
+    _fields = ('id', 'user', 'team', 'duration', 'platforms', 'references',
+               'notes', 'metadata', 'packages', 'stime', 'ftime')
+    _interned = ('user', 'team')
+    _cast = ('platforms', 'references', 'notes', 'metadata', 'packages',
+             'stime', 'ftime')
+    _schema = RELEASE_SCHEMA
+
+    stime = _cast_property('stime', RELEASE_SCHEMA)
+    ftime = _cast_property('ftime', RELEASE_SCHEMA)
+
+    def __init__(self, release_dict):
+        """
+        :param dict release_dict: A single release, as returned by Orlo
+        """
+        self._load(release_dict)
+        # Sequences are held as tuples, which are smaller than lists
+        if self._platforms is not None:
+            self._platforms = tuple(_intern(p) for p in self._platforms)
+        if self._references is not None:
+            self._references = tuple(self._references)
+        if self._notes is not None:
+            self._notes = tuple(self._notes)
+        # Don't hold on to an empty dictionary for every release
+        self._metadata = self._metadata or None
+        self._packages = tuple(
+            PackageRecord(p, self.id) for p in self._packages or ())
+
+    @property
+    def release_id(self):
+        return self.id
+
+    @property
+    def uuid(self):
+        return uuid.UUID(self.id)
+
+    @property
+    def platforms(self):
+        return None if self._platforms is None else list(self._platforms)
+
+    @property
+    def references(self):
+        return None if self._references is None else list(self._references)
+
+    @property
+    def notes(self):
+        return None if self._notes is None else list(self._notes)
+
+    @property
+    def metadata(self):
+        return None if self._metadata is None else dict(self._metadata)
+
+    @property
+    def packages(self):
+        return list(self._packages)
+
+    @property
+    def data(self):
+        """
+        The raw document, in the same format as Release.data
+        """
+        return {'releases': [self.to_dict()]}
+
+    def to_dict(self):
+        d = super(ReleaseRecord, self).to_dict()
+        d['platforms'] = self.platforms
+        d['references'] = self.references
+        d['notes'] = self.notes
+        d['metadata'] = self.metadata
+        d['packages'] = [p.to_dict() for p in self._packages]
+        return d
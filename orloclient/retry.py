@@ -0,0 +1,285 @@
+from __future__ import print_function
+import logging
+import random
+import threading
+import time
+from collections import deque
+from email.utils import parsedate_tz, mktime_tz
+from six.moves.urllib.parse import urlparse
+
+__author__ = 'alforbes'
+
+logger = logging.getLogger(__name__)
+
+"""
+Retries and circuit breaking for BaseClient
+
+When Orlo restarts, every client sees errors at the same moment. Retrying
+straight away, or after the same fixed delay, has them all come back at the
+same moment too. RetryPolicy waits an exponentially growing, randomised
+("full jitter") delay, or as long as the server asks with Retry-After.
+
+A CircuitBreaker counts recent failures to a host. Once the failure rate
+crosses a threshold the circuit opens, and requests fail immediately with
+CircuitOpenError instead of adding to the load. After reset_timeout a single
+probe request is let through; its success closes the circuit again.
+"""
+
+
+class RetryPolicy(object):
+    """
+    Which failed requests to retry, and how long to wait in between
+    """
+    IDEMPOTENT_METHODS = frozenset(['GET', 'HEAD', 'OPTIONS'])
+
+    def __init__(self, total=3, backoff=0.5, max_backoff=30, retry_post=False,
+                 status_codes=(429, 502, 503, 504), max_retry_after=60):
+        """
+        :param int total: Retries after the first attempt
+        :param float backoff: Base delay in seconds, doubled for each retry.
+            The actual delay is picked at random between zero and this
+        :param float max_backoff: Longest delay between attempts
+        :param bool retry_post: Also retry POSTs. They are not idempotent, so
+            a request that reached the server before failing may be applied
+            twice
+        :param status_codes: Response status codes to retry
+        :param float max_retry_after: Give up rather than wait longer than
+            this when the server sends Retry-After
+        """
+        self.total = total
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.retry_post = retry_post
+        self.status_codes = frozenset(status_codes)
+        self.max_retry_after = max_retry_after
+
+        self.retries = 0
+        self.exhausted = 0
+        self._lock = threading.Lock()
+
+    # Replaced in tests
+    sleep = staticmethod(time.sleep)
+
+    def retries_method(self, method):
+        method = method.upper()
+        return method in self.IDEMPOTENT_METHODS or (
+            self.retry_post and method == 'POST')
+
+    def retryable(self, error=None, response=None):
+        """
+        Whether the outcome of an attempt is worth retrying
+
+        :param error: requests exception raised by the attempt, or None
+        :param response: requests Response, or None
+        """
+        if error is not None:
+            return True
+        return response is not None and \
+            response.status_code in self.status_codes
+
+    def delay(self, attempt, response=None):
+        """
+        Seconds to wait before retrying, or None to give up
+
+        :param int attempt: Number of retries so far
+        :param response: Response to the failed attempt, if there was one
+        """
+        retry_after = _retry_after(response)
+        if retry_after is not None:
+            if retry_after > self.max_retry_after:
+                return None
+            return retry_after
+        cap = min(self.max_backoff, self.backoff * 2 ** attempt)
+        return random.uniform(0, cap)
+
+    def next_delay(self, method, attempt, error=None, response=None):
+        """
+        Seconds to wait before retrying an attempt, or None to not retry
+
+        Updates the counters.
+        """
+        if not self.retries_method(method) or \
+                not self.retryable(error, response):
+            return None
+        delay = self.delay(attempt, response) if attempt < self.total \
+            else None
+        with self._lock:
+            if delay is None:
+                self.exhausted += 1
+            else:
+                self.retries += 1
+        return delay
+
+    def stats(self):
+        with self._lock:
+            return {'retries': self.retries, 'exhausted': self.exhausted}
+
+
+def _retry_after(response):
+    """
+    Seconds from a Retry-After header, given either as seconds or a date
+    """
+    if response is None:
+        return None
+    value = response.headers.get('Retry-After')
+    if not value:
+        return None
+    try:
+        return max(0, float(value))
+    except ValueError:
+        pass
+    parsed = parsedate_tz(value)
+    if parsed is None:
+        return None
+    return max(0, mktime_tz(parsed) - time.time())
+
+
+class CircuitBreaker(object):
+    """
+    Failure rate tracking for one host
+    """
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half-open'
+
+    def __init__(self, failure_rate=0.5, min_requests=20, window=30,
+                 reset_timeout=10):
+        """
+        :param float failure_rate: Fraction of failed requests that opens the
+            circuit
+        :param int min_requests: Requests in the window before the failure
+            rate is considered
+        :param float window: Seconds of history the failure rate covers
+        :param float reset_timeout: Seconds to wait while open before probing
+        """
+        self.failure_rate = failure_rate
+        self.min_requests = min_requests
+        self.window = window
+        self.reset_timeout = reset_timeout
+
+        self.state = self.CLOSED
+        self.requests = 0
+        self.failures = 0
+        self.rejected = 0
+        self.opened = 0
+
+        self._outcomes = deque()  # (time, ok)
+        self._window_failures = 0
+        self._changed_at = 0
+        self._probe_at = None
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """
+        Whether a request may be made now
+        """
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            now = time.time()
+            if self.state == self.OPEN:
+                if now < self._changed_at + self.reset_timeout:
+                    self.rejected += 1
+                    return False
+                self._set_state(self.HALF_OPEN, now)
+            # Half-open, let one probe through at a time. A probe that never
+            # reported back is replaced after reset_timeout
+            if self._probe_at is not None and \
+                    now < self._probe_at + self.reset_timeout:
+                self.rejected += 1
+                return False
+            self._probe_at = now
+            return True
+
+    def record(self, ok):
+        """
+        Record the outcome of a request allowed through
+        """
+        with self._lock:
+            now = time.time()
+            self.requests += 1
+            if not ok:
+                self.failures += 1
+
+            if self.state == self.HALF_OPEN:
+                self._probe_at = None
+                if ok:
+                    self._outcomes.clear()
+                    self._window_failures = 0
+                    self._set_state(self.CLOSED, now)
+                else:
+                    self._set_state(self.OPEN, now)
+                return
+            if self.state == self.OPEN:
+                # A request started before the circuit opened
+                return
+
+            self._outcomes.append((now, ok))
+            if not ok:
+                self._window_failures += 1
+            while self._outcomes and self._outcomes[0][0] < now - self.window:
+                _, old_ok = self._outcomes.popleft()
+                if not old_ok:
+                    self._window_failures -= 1
+            count = len(self._outcomes)
+            if count >= self.min_requests and \
+                    self._window_failures >= self.failure_rate * count:
+                self._set_state(self.OPEN, now)
+
+    def _set_state(self, state, now):
+        if state == self.OPEN:
+            self.opened += 1
+            logger.warning("Circuit opened after {} of the last {} requests "
+                           "failed".format(self._window_failures,
+                                           len(self._outcomes)))
+        elif state == self.CLOSED:
+            logger.info("Circuit closed")
+        self.state = state
+        self._changed_at = now
+
+    def stats(self):
+        with self._lock:
+            return {
+                'state': self.state,
+                'requests': self.requests,
+                'failures': self.failures,
+                'rejected': self.rejected,
+                'opened': self.opened,
+            }
+
+
+class CircuitBreakers(object):
+    """
+    One CircuitBreaker per host, created on first use
+
+    Can be shared between clients, so that they all stop calling a host that
+    is down.
+    """
+
+    def __init__(self, **kwargs):
+        """
+        :param kwargs: Settings for each CircuitBreaker
+        """
+        self.settings = kwargs
+        self._breakers = {}
+        self._lock = threading.Lock()
+
+    def get(self, url):
+        """
+        The breaker for the host a URL points to
+        """
+        host = urlparse(url).netloc
+        with self._lock:
+            breaker = self._breakers.get(host)
+            if breaker is None:
+                breaker = self._breakers[host] = CircuitBreaker(
+                    **self.settings)
+        return breaker
+
+    def stats(self):
+        """
+        Counters and state for each host
+        """
+        with self._lock:
+            breakers = list(self._breakers.items())
+        return dict((host, b.stats()) for host, b in breakers)
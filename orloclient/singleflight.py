@@ -0,0 +1,132 @@
+from __future__ import print_function
+import json
+import threading
+
+__author__ = 'alforbes'
+
+"""
+Coalescing of concurrent identical calls ("single-flight")
+
+When many threads ask for the same release at the same moment, only the first
+one makes the request. The others wait for it and are handed the same result,
+or the same exception. Nothing is kept once the call returns, so this is not a
+cache: a request made after the first one finished goes to the server again.
+
+The clients share the HTTP response rather than the decoded document, so each
+caller still decodes its own copy and can modify it freely.
+"""
+
+
+def flight_key(url, params=None, headers=None):
+    """
+    Key identifying a GET, equal for requests the server would answer the same
+    """
+    return json.dumps([url, params or {}, headers or {}], sort_keys=True,
+                      default=str)
+
+
+class _Call(object):
+    """
+    A call in progress, whose outcome is shared with identical calls
+    """
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class SingleFlight(object):
+    """
+    Runs at most one call per key at a time, for threads
+    """
+
+    def __init__(self):
+        self.calls = 0
+        self.shared = 0
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, func, *args, **kwargs):
+        """
+        Call func(*args, **kwargs), or wait for the call already running under
+        the same key and return its result
+
+        :param key: Hashable key, calls with equal keys must be
+            interchangeable
+        :param func: Function to call
+        :return: What func returned. If it raised, the same exception is
+            raised in every caller
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.calls += 1
+            else:
+                self.shared += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.value
+
+        try:
+            call.value = func(*args, **kwargs)
+        except BaseException as e:
+            # Including KeyboardInterrupt, so that waiting callers wake up
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.value
+
+    def stats(self):
+        with self._lock:
+            return {'calls': self.calls, 'shared': self.shared,
+                    'in_flight': len(self._calls)}
+
+
+class AsyncSingleFlight(object):
+    """
+    Runs at most one call per key at a time, for coroutines in one event loop
+    """
+
+    def __init__(self):
+        self.calls = 0
+        self.shared = 0
+        self._calls = {}
+
+    def do(self, key, func, *args, **kwargs):
+        """
+        Await func(*args, **kwargs), or the call already running under the same
+        key
+
+        The call runs as a task of its own, so a caller being cancelled does
+        not cancel it for the others.
+
+        :param key: Hashable key, calls with equal keys must be
+            interchangeable
+        :param func: Coroutine function to call
+        :return: Awaitable for the result
+        """
+        # Not imported at module level, Python 2 has no asyncio
+        import asyncio
+
+        task = self._calls.get(key)
+        if task is None:
+            task = asyncio.ensure_future(func(*args, **kwargs))
+            self._calls[key] = task
+            task.add_done_callback(lambda _: self._calls.pop(key, None))
+            self.calls += 1
+        else:
+            self.shared += 1
+        return asyncio.shield(task)
+
+    def stats(self):
+        return {'calls': self.calls, 'shared': self.shared,
+                'in_flight': len(self._calls)}
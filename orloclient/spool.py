@@ -0,0 +1,372 @@
+from __future__ import print_function
+import atexit
+import json
+import logging
+import os
+import random
+import threading
+import time
+import weakref
+from collections import deque, namedtuple, OrderedDict
+from .exceptions import ClientError, OrloError
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+__author__ = 'alforbes'
+
+logger = logging.getLogger(__name__)
+
+"""
+Write-behind queue for package events
+
+With write_behind enabled on OrloClient, package_start, package_stop and
+package_add_results return as soon as the event is queued, and a background
+thread sends it to Orlo. Events for the same package are sent in the order
+they were queued; a package whose events are failing waits, with exponential
+backoff, without holding up the others.
+
+Connection and server errors are retried. Client errors (4xx) will not succeed
+on a retry, so the event is dropped, logged and kept in WriteBehindQueue.failed.
+
+OrloClient spools to default_spool_path() unless told otherwise. When given a
+spool path, each event is appended to that file before put()
+returns, followed by an acknowledgement once it has been sent. Events not
+acknowledged when the process died are sent again by the next queue opening
+the file, so delivery is at-least-once. Writes are flushed to the operating
+system, which survives the process crashing; pass fsync=True to also survive
+the machine crashing, at the cost of a disk sync per event.
+
+The spool file holds one JSON object per line:
+
+    {"seq": 1, "action": "stop", "release_id": "...", "package_id": "...",
+     "kwargs": {"success": true}}
+    {"ack": 1}
+
+Without a spool, events only live in memory and the sending thread is a
+daemon, so the queue is flushed, for up to EXIT_TIMEOUT seconds, when the
+interpreter exits.
+"""
+
+def default_spool_path():
+    """
+    ~/.cache/orloclient/events.jsonl, honouring XDG_CACHE_HOME
+    """
+    base = os.environ.get('XDG_CACHE_HOME') or os.path.join(
+        os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'orloclient', 'events.jsonl')
+
+
+def _flush_at_exit(queue_ref):
+    queue = queue_ref()
+    if queue is None or not len(queue):
+        return
+    if not queue.flush(WriteBehindQueue.EXIT_TIMEOUT):
+        logger.warning("Exiting with {} package event(s) not sent".format(
+            len(queue)))
+
+
+QueuedEvent = namedtuple(
+    'QueuedEvent', ['seq', 'action', 'release_id', 'package_id', 'kwargs'])
+
+
+class _Spool(object):
+    """
+    Append-only file of events and acknowledgements
+    """
+    # Rewrite the file once it holds this many records, or this many when
+    # nothing is pending
+    COMPACT_RECORDS = 10000
+    COMPACT_EMPTY_RECORDS = 1000
+
+    def __init__(self, path, fsync=False):
+        self.path = path
+        self.fsync = fsync
+        self.records = 0
+
+        directory = os.path.dirname(path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+
+        # Held for as long as the spool is open, so that two processes don't
+        # send the same events
+        self._lock_file = open(path + '.lock', 'a')
+        if fcntl is not None:
+            try:
+                fcntl.flock(self._lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except (IOError, OSError):
+                self._lock_file.close()
+                raise ClientError(
+                    "Spool {} is in use by another process".format(path))
+        self._file = None
+
+    def load(self):
+        """
+        Return the events that were never acknowledged, oldest first
+        """
+        events = OrderedDict()
+        if os.path.exists(self.path):
+            with open(self.path) as f:
+                for number, line in enumerate(f, 1):
+                    try:
+                        record = json.loads(line)
+                        if 'ack' in record:
+                            events.pop(record['ack'], None)
+                        else:
+                            events[record['seq']] = QueuedEvent(**record)
+                    except (ValueError, TypeError, KeyError):
+                        # Most likely a partial write as the process died
+                        logger.warning("Ignoring invalid line {} in spool "
+                                       "{}".format(number, self.path))
+        pending = list(events.values())
+        self.compact(pending)
+        return pending
+
+    def _write(self, record):
+        self._file.write(json.dumps(record) + '\n')
+        self._file.flush()
+        if self.fsync:
+            os.fsync(self._file.fileno())
+        self.records += 1
+
+    def append(self, event):
+        self._write(event._asdict())
+
+    def ack(self, event):
+        self._write({'ack': event.seq})
+
+    def compact(self, pending):
+        """
+        Replace the file with one holding only the pending events
+        """
+        if self._file is not None:
+            self._file.close()
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w') as f:
+            for event in pending:
+                f.write(json.dumps(event._asdict()) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        # os.replace overwrites on Windows too, but is not in Python 2
+        getattr(os, 'replace', os.rename)(tmp, self.path)
+        self._file = open(self.path, 'a')
+        self.records = len(pending)
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        self._lock_file.close()
+
+
+class WriteBehindQueue(object):
+    """
+    Queue of package events, sent to Orlo by a background thread
+    """
+    # Seconds to wait at exit for events held only in memory
+    EXIT_TIMEOUT = 30
+
+    def __init__(self, send, path=None, fsync=False, backoff=0.5,
+                 max_backoff=60, max_attempts=10):
+        """
+        :param send: Function send(event) sending a QueuedEvent, raising
+            OrloError on failure
+        :param string path: Spool file, events are only held in memory if None,
+            and flushed when the interpreter exits
+        :param bool fsync: Sync the spool file to disk on every write
+        :param float backoff: Seconds to wait before the first retry, doubled
+            on each further attempt
+        :param float max_backoff: Longest wait between attempts
+        :param int max_attempts: Give up on an event after this many attempts,
+            three minutes at most with the default backoff. None to retry until
+            it succeeds, in which case flush() and close() may never return
+            without a timeout
+        """
+        self.send = send
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.max_attempts = max_attempts
+
+        self.sent = 0
+        self.retries = 0
+        # (event, error message) for events that were given up on
+        self.failed = deque(maxlen=1000)
+
+        self._spool = _Spool(path, fsync=fsync) if path else None
+        if self._spool is None:
+            atexit.register(_flush_at_exit, weakref.ref(self))
+        self._cond = threading.Condition()
+        self._lanes = OrderedDict()  # package id -> deque of events
+        self._attempts = {}
+        self._retry_at = {}
+        self._seq = 0
+        self._closed = False
+        self._stopping = False
+
+        if self._spool is not None:
+            for event in self._spool.load():
+                self._lanes.setdefault(event.package_id, deque()).append(event)
+                self._seq = max(self._seq, event.seq)
+            if self._lanes:
+                logger.info("Resending {} event(s) from spool {}".format(
+                    len(self), path))
+
+        self._thread = threading.Thread(target=self._run,
+                                        name='orloclient-write-behind')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def __len__(self):
+        """
+        Number of events not yet sent
+        """
+        with self._cond:
+            return sum(len(lane) for lane in self._lanes.values())
+
+    def put(self, action, release_id, package_id, **kwargs):
+        """
+        Queue an event
+
+        :param string action: "start", "stop" or "add_results"
+        :param release_id: Release the package belongs to
+        :param package_id: Package the event is for
+        :param kwargs: Arguments for the request, e.g. success=False
+        """
+        with self._cond:
+            if self._closed:
+                raise ClientError("Write-behind queue is closed")
+            self._seq += 1
+            event = QueuedEvent(self._seq, action, str(release_id),
+                                str(package_id), kwargs)
+            if self._spool is not None:
+                self._spool.append(event)
+            self._lanes.setdefault(event.package_id, deque()).append(event)
+            self._cond.notify_all()
+        return True
+
+    def flush(self, timeout=None):
+        """
+        Wait until every queued event has been sent, or given up on
+
+        :param float timeout: Seconds to wait, None to wait indefinitely
+        :return bool: Whether the queue is empty
+        """
+        deadline = None if timeout is None else time.time() + timeout
+        with self._cond:
+            while self._lanes:
+                remaining = None if deadline is None else deadline - time.time()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+    def close(self, timeout=None):
+        """
+        Stop accepting events, wait for the queue to drain and stop the thread
+
+        Events still queued after timeout remain in the spool, and are sent
+        when it is next opened.
+
+        :param float timeout: Seconds to wait, None to wait indefinitely
+        :return bool: Whether every event was sent
+        """
+        with self._cond:
+            if self._closed:
+                return not self._lanes
+            self._closed = True
+        drained = self.flush(timeout)
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+        self._thread.join()
+        if self._spool is not None:
+            if drained:
+                self._spool.compact([])
+            self._spool.close()
+        return drained
+
+    def stats(self):
+        with self._cond:
+            return {
+                'pending': sum(len(lane) for lane in self._lanes.values()),
+                'sent': self.sent,
+                'retries': self.retries,
+                'failed': len(self.failed),
+            }
+
+    def _next(self):
+        """
+        The oldest event whose package is not waiting to retry, and otherwise
+        how long until one is ready. Called with the lock held.
+        """
+        now = time.time()
+        event, wait = None, None
+        for package_id, lane in self._lanes.items():
+            retry_at = self._retry_at.get(package_id, 0)
+            if retry_at > now:
+                wait = retry_at - now if wait is None else min(
+                    wait, retry_at - now)
+            elif event is None or lane[0].seq < event.seq:
+                event = lane[0]
+        return event, wait
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while True:
+                    if self._stopping or (self._closed and not self._lanes):
+                        return
+                    event, wait = self._next()
+                    if event is not None:
+                        break
+                    self._cond.wait(wait)
+            self._deliver(event)
+
+    def _deliver(self, event):
+        error = None
+        try:
+            self.send(event)
+        except ClientError as e:
+            error = e
+        except OrloError as e:
+            with self._cond:
+                attempts = self._attempts.get(event.package_id, 0) + 1
+                if self.max_attempts is None or attempts < self.max_attempts:
+                    delay = min(self.backoff * 2 ** (attempts - 1),
+                                self.max_backoff)
+                    # Jitter, so that many agents don't retry in lockstep
+                    delay *= random.uniform(0.5, 1)
+                    logger.debug("{} {} failed, retrying in {:.1f}s: {}".format(
+                        event.action, event.package_id, delay, e))
+                    self._attempts[event.package_id] = attempts
+                    self._retry_at[event.package_id] = time.time() + delay
+                    self.retries += 1
+                    return
+            error = e
+        except Exception as e:
+            logger.exception("Unexpected error sending {}".format(event))
+            error = e
+
+        with self._cond:
+            if error is None:
+                self.sent += 1
+            else:
+                logger.error("Giving up on {} for package {}: {}".format(
+                    event.action, event.package_id, error))
+                self.failed.append((event, str(error)))
+            lane = self._lanes[event.package_id]
+            lane.popleft()
+            if not lane:
+                del self._lanes[event.package_id]
+            self._attempts.pop(event.package_id, None)
+            self._retry_at.pop(event.package_id, None)
+            if self._spool is not None:
+                self._spool.ack(event)
+                limit = (self._spool.COMPACT_RECORDS if self._lanes
+                         else self._spool.COMPACT_EMPTY_RECORDS)
+                if self._spool.records >= limit:
+                    self._spool.compact(
+                        [e for lane in self._lanes.values() for e in lane])
+            self._cond.notify_all()
@@ -0,0 +1,233 @@
+from __future__ import print_function
+import codecs
+import json
+import re
+from .exceptions import ClientError
+
+__author__ = 'alforbes'
+
+"""
+Incremental parsing of one array in a JSON document
+
+Used by stream_releases and stream_packages, so that a response listing every
+release is turned into releases as it arrives, rather than after the whole
+body has been read and parsed. Only the element being received is held in
+memory, along with the last chunk read.
+
+Until the array is found, the parser only follows the nesting of the
+document, looking for its key in the top-level object. The elements are then
+decoded one by one with the json module's raw_decode, which reports where each
+ends. Whatever follows the array is ignored.
+
+    parser = ArrayItemParser('releases')
+    for chunk in response.iter_content(65536):
+        for release in parser.feed(chunk):
+            ...
+    parser.close()
+"""
+
+# Characters that matter outside strings, and inside them
+_STRUCTURE = re.compile(b'["{}\\[\\],:]')
+_STRING_END = re.compile(b'["\\\\]')
+# Between elements of the array
+_SEPARATOR = re.compile(r'[\s,]*')
+
+_QUOTE, _BACKSLASH, _COLON, _COMMA = ord('"'), ord('\\'), ord(':'), ord(',')
+_OPEN = frozenset([ord('{'), ord('[')])
+_CLOSE = frozenset([ord('}'), ord(']')])
+_OPEN_BRACKET = ord('[')
+
+# Characters that can end a number or literal
+_SCALAR_END = frozenset(',] \t\r\n')
+# How far from the end of the data a decoding error can be, and still be due
+# to an element that has not been received in full
+_TRUNCATION_MARGIN = 32
+
+# Parser states
+_SEEK, _ARRAY, _DONE = 'seek', 'array', 'done'
+
+
+class ArrayItemParser(object):
+    """
+    Yields the elements of the array under a key of the top-level object
+    """
+
+    def __init__(self, key):
+        """
+        :param string key: Key of the array in the top-level object
+        """
+        self.key = '"{}"'.format(key).encode('utf-8')
+        self.count = 0
+
+        self._state = _SEEK
+        # Looking for the key: bytes not yet scanned, nesting depth, and the
+        # top-level string being read, the last one read and the key of the
+        # value being read
+        self._buf = bytearray()
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._string_start = None
+        self._last_string = None
+        self._current_key = None
+        # In the array: text not yet decoded
+        self._text = u''
+        self._utf8 = codecs.getincrementaldecoder('utf-8')()
+        self._decoder = json.JSONDecoder()
+
+    @property
+    def done(self):
+        """
+        Whether the end of the array has been reached
+        """
+        return self._state == _DONE
+
+    def feed(self, chunk):
+        """
+        Parse the next chunk of the document
+
+        :param bytes chunk: Next bytes of the document
+        :return list: Elements completed by this chunk, decoded
+        """
+        if self._state == _SEEK:
+            chunk = self._seek(chunk)
+        if self._state == _ARRAY and chunk:
+            self._text += self._utf8.decode(chunk)
+            return self._elements()
+        return []
+
+    def _seek(self, chunk):
+        """
+        Scan for the start of the array
+
+        :return bytes: What follows the opening bracket, once found
+        """
+        buf = self._buf
+        buf += chunk
+        pos = self._pos
+        end = len(buf)
+
+        while pos < end:
+            if self._in_string:
+                match = _STRING_END.search(buf, pos)
+                if match is None:
+                    pos = end
+                    break
+                i = match.start()
+                if buf[i] == _BACKSLASH:
+                    if i + 1 >= end:
+                        # The escaped character is in the next chunk
+                        pos = i
+                        break
+                    pos = i + 2
+                    continue
+                self._in_string = False
+                pos = i + 1
+                if self._string_start is not None:
+                    self._last_string = bytes(buf[self._string_start:pos])
+                    self._string_start = None
+                continue
+
+            match = _STRUCTURE.search(buf, pos)
+            if match is None:
+                pos = end
+                break
+            i = match.start()
+            c = buf[i]
+            pos = i + 1
+            if c == _QUOTE:
+                self._in_string = True
+                if self._depth == 1:
+                    self._string_start = i
+            elif c in _OPEN:
+                if self._depth == 1 and c == _OPEN_BRACKET and \
+                        self._current_key == self.key:
+                    self._state = _ARRAY
+                    rest = bytes(buf[pos:])
+                    del self._buf[:]
+                    return rest
+                self._depth += 1
+            elif c in _CLOSE:
+                self._depth -= 1
+            elif c == _COLON:
+                if self._depth == 1:
+                    self._current_key = self._last_string
+            elif c == _COMMA:
+                if self._depth == 1:
+                    self._current_key = None
+
+        # Only a top-level string being read is still needed
+        keep = pos if self._string_start is None else self._string_start
+        del buf[:keep]
+        self._pos = pos - keep
+        if self._string_start is not None:
+            self._string_start -= keep
+        return b''
+
+    def _elements(self, final=False):
+        """
+        Decode the elements received in full
+        """
+        text = self._text
+        end = len(text)
+        items = []
+        pos = 0
+        while True:
+            pos = _SEPARATOR.match(text, pos).end()
+            if pos == end:
+                break
+            if text[pos] == ']':
+                self._state = _DONE
+                pos = end
+                break
+            try:
+                item, item_end = self._decoder.raw_decode(text, pos)
+            except ValueError as e:
+                # Python 2 does not say where decoding failed
+                error_pos = getattr(e, 'pos', None)
+                if not final and (
+                        error_pos is None or
+                        error_pos >= end - _TRUNCATION_MARGIN or
+                        e.msg.startswith('Unterminated string')):
+                    # Wait for the rest of the element
+                    break
+                raise ClientError("Could not decode element {} of {}: {}".format(
+                    self.count, self.key.decode('utf-8'), e))
+            if text[pos] not in u'{["':
+                # A number or literal may carry on in the next chunk, "1" may
+                # be the start of "1.5"
+                tail = text[item_end:item_end + _TRUNCATION_MARGIN]
+                if not final and item_end + len(tail) == end and \
+                        not any(c in _SCALAR_END for c in tail):
+                    break
+                if item_end < end and text[item_end] not in _SCALAR_END:
+                    raise ClientError(
+                        "Could not decode element {} of {}: {!r}".format(
+                            self.count, self.key.decode('utf-8'),
+                            text[pos:item_end + 1]))
+            items.append(item)
+            self.count += 1
+            pos = item_end
+        self._text = text[pos:]
+        return items
+
+    def close(self):
+        """
+        Check that the whole array was read
+
+        :return list: Elements only complete at the end of the document
+        :raises ClientError: When the document ended before the array did, or
+            had no such array
+        """
+        items = []
+        if self._state == _ARRAY:
+            self._text += self._utf8.decode(b'', True)
+            items = self._elements(final=True)
+        if self._state == _SEEK:
+            raise ClientError("No {} array in the response".format(
+                self.key.decode('utf-8')))
+        if self._state == _ARRAY:
+            raise ClientError(
+                "Response ended after {} element(s) of {}, before the end of "
+                "the array".format(self.count, self.key.decode('utf-8')))
+        return items
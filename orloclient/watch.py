@@ -0,0 +1,239 @@
+from __future__ import print_function
+import logging
+import time
+from collections import namedtuple
+from datetime import timedelta
+from .columnar import parse_time
+
+__author__ = 'alforbes'
+
+logger = logging.getLogger(__name__)
+
+"""
+Watching releases for changes
+
+Instead of fetching each in-flight release every second and comparing the
+documents, watch() polls all of them in one loop and yields an event for each
+change:
+
+    for event in client.watch(release_ids):
+        if event.kind == PACKAGE_STOPPED:
+            print(event.package_id, event.status)
+
+The releases are polled together with a single /releases request, filtered on
+the earliest stime among them, falling back to one request per release when
+the server doesn't return one of them. Single releases are fetched with
+If-None-Match / If-Modified-Since when the server gives validators. The
+interval grows while nothing changes, up to max_interval, and goes back to
+the initial interval on a change. A release is no longer polled once its
+ftime is set, and watch() returns once every release has finished, or after
+timeout seconds.
+
+The first poll reports what already happened: a package that had started
+before watching began gives a PACKAGE_STARTED event.
+"""
+
+PACKAGE_STARTED = 'package_started'
+PACKAGE_STOPPED = 'package_stopped'
+RELEASE_FINISHED = 'release_finished'
+
+# kind: one of the constants above
+# release_id, package_id: package_id is None for RELEASE_FINISHED
+# status: the package status for PACKAGE_STOPPED, else None
+# time: the stime or ftime that changed, as given by Orlo
+# data: the package or release dictionary
+ChangeEvent = namedtuple('ChangeEvent', ['kind', 'release_id', 'package_id',
+                                         'status', 'time', 'data'])
+
+
+class ReleaseTracker(object):
+    """
+    Remembers what has been seen of each release, and turns new documents
+    into change events
+    """
+
+    def __init__(self, release_ids):
+        """
+        :param release_ids: Releases to track
+        """
+        self.active = list(release_ids)
+        # Package ids started and stopped
+        self._started = set()
+        self._stopped = set()
+        # Release id -> stime, once seen
+        self._stimes = {}
+
+    def update(self, release):
+        """
+        Compare a release document with what was seen before
+
+        :param dict release: One release, as returned by Orlo
+        :return list: ChangeEvents, in the order they happened
+        """
+        rid = release['id']
+        if rid not in self.active:
+            return []
+        if release.get('stime'):
+            self._stimes[rid] = release['stime']
+
+        events = []
+        for p in release.get('packages') or ():
+            pid = p['id']
+            if p.get('stime') and pid not in self._started:
+                self._started.add(pid)
+                events.append(ChangeEvent(PACKAGE_STARTED, rid, pid, None,
+                                          p['stime'], p))
+            if p.get('ftime') and pid not in self._stopped:
+                self._stopped.add(pid)
+                events.append(ChangeEvent(PACKAGE_STOPPED, rid, pid,
+                                          p.get('status'), p['ftime'], p))
+        events.sort(key=lambda e: e.time)
+
+        if release.get('ftime'):
+            self.active.remove(rid)
+            events.append(ChangeEvent(RELEASE_FINISHED, rid, None, None,
+                                      release['ftime'], release))
+        return events
+
+    def stime_after(self):
+        """
+        A stime_after filter matching every active release, None until all
+        of them have been seen
+        """
+        try:
+            earliest = min(parse_time(self._stimes[rid]) for rid in self.active)
+        except KeyError:
+            return None
+        return (earliest - timedelta(seconds=1)).strftime('%Y-%m-%dT%H:%M:%SZ')
+
+
+class Interval(object):
+    """
+    Seconds to wait between polls, growing while nothing changes
+    """
+
+    def __init__(self, initial=1.0, maximum=30.0, backoff=1.5):
+        self.initial = initial
+        self.maximum = maximum
+        self.backoff = backoff
+        self.current = initial
+
+    # Replaced in tests
+    sleep = staticmethod(time.sleep)
+    clock = staticmethod(time.time)
+
+    def next(self, changed):
+        """
+        :param bool changed: Whether the last poll found a change
+        :return float: Seconds to wait
+        """
+        if changed:
+            self.current = self.initial
+        else:
+            self.current = min(self.current * self.backoff, self.maximum)
+        return self.current
+
+
+def watch(client, release_ids, interval=1.0, max_interval=30.0, backoff=1.5,
+          timeout=None, batch=True):
+    """
+    Yield ChangeEvents for releases until they have finished
+
+    See OrloClient.watch.
+    """
+    tracker = ReleaseTracker(release_ids)
+    wait = Interval(interval, max_interval, backoff)
+    deadline = None if timeout is None else wait.clock() + timeout
+    # URL and query -> (validators, document) of the last response, for
+    # conditional requests
+    last = {}
+
+    while tracker.active:
+        releases = _poll(client, tracker, last, batch)
+        changed = False
+        for release in releases:
+            for event in tracker.update(release):
+                changed = True
+                yield event
+        if not tracker.active:
+            return
+
+        delay = wait.next(changed)
+        if deadline is not None:
+            remaining = deadline - wait.clock()
+            if remaining <= 0:
+                return
+            delay = min(delay, remaining)
+        logger.debug("Watching %s releases, next poll in %.1fs",
+                     len(tracker.active), delay)
+        wait.sleep(delay)
+
+
+def _poll(client, tracker, last, batch):
+    """
+    Fetch the active releases
+
+    :return list: Release dictionaries, unchanged ones included
+    """
+    releases = []
+    missing = list(tracker.active)
+    stime_after = tracker.stime_after()
+    if batch and len(missing) > 1 and stime_after is not None:
+        url = "{url}/releases".format(url=client.uri)
+        document = _get(client, url, {'stime_after': stime_after}, last)
+        if document is not None:
+            found = dict((r['id'], r) for r in document.get('releases', ()))
+            releases = [found[rid] for rid in missing if rid in found]
+            missing = [rid for rid in missing if rid not in found]
+
+    for rid in missing:
+        url = "{url}/releases/{rid}".format(url=client.uri, rid=rid)
+        document = _get(client, url, None, last)
+        releases.extend(document['releases'])
+    return releases
+
+
+def _get(client, url, params, last):
+    """
+    GET a document, conditionally when the last response had validators
+
+    :return dict: The document, None for a 404 on a query matching nothing
+    """
+    key, validators, previous = conditional(last, url, params)
+    response = client._get(url, params=params, headers=validators)
+    if response.status_code == 304 and previous is not None:
+        return previous
+    if response.status_code == 404 and params is not None:
+        return None
+    document = client._expect_200_json_response(response)
+    remember(last, key, response.headers, document)
+    return document
+
+
+def conditional(last, url, params):
+    """
+    The validators to send with a GET, from the last response to it
+
+    :param dict last: Responses seen so far, updated by remember()
+    :return tuple: (key for remember(), request headers, the last document
+        or None)
+    """
+    key = (url, tuple(sorted((params or {}).items())))
+    validators, previous = last.get(key, ({}, None))
+    return key, validators, previous
+
+
+def remember(last, key, headers, document):
+    """
+    Keep a document for conditional requests, if its response had validators
+
+    :param dict headers: Response headers
+    """
+    validators = {}
+    if headers.get('ETag'):
+        validators['If-None-Match'] = headers['ETag']
+    if headers.get('Last-Modified'):
+        validators['If-Modified-Since'] = headers['Last-Modified']
+    last.pop(key, None)
+    if validators:
+        last[key] = (validators, document)
@@ -8,7 +8,13 @@ __author__ = 'alforbes'
 from setuptools import setup, find_packages
 import multiprocessing  # nopep8
 
+version = {}
+with open(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                       'orloclient', '_version.py')) as f:
+    exec(f.read(), version)
+
 tests_require=[
+    'aiohttp',
     'Flask-Testing',
     'httpretty',
     'orlo >= 0.4.0',
@@ -17,13 +23,14 @@ tests_require=[
 ]
 install_requires = [
     'arrow',
+    'futures; python_version < "3"',
     'requests',
 ]
 
 
 setup(
     name='orloclient',
-    version='0.4.5',
+    version=version['__version__'],
     description='Client to the Orlo deployment _data capture API',
     author='Alex Forbes',
     author_email='alforbes@ebay.com',
@@ -34,7 +41,11 @@ setup(
     include_package_data=True,
     install_requires=install_requires,
     extras_require={'test': tests_require,
-                    'install': install_requires},
+                    'install': install_requires,
+                    'async': ['aiohttp >= 3.0'],
+                    'analytics': ['numpy', 'pandas', 'pyarrow'],
+                    'fast': ['orjson; python_version >= "3.6"',
+                             'ujson; python_version < "3.6"']},
     tests_require=tests_require,
     entry_points={
         'console_scripts': [
@@ -0,0 +1,297 @@
+from __future__ import print_function
+import asyncio
+import unittest
+
+from orloclient import ClientError, ServerError, ConnectionError, Package
+from orloclient.mock_orlo import MockOrloClient
+
+try:
+    from aiohttp import web
+    from aiohttp.test_utils import TestServer
+    from orloclient.aio import AsyncOrloClient, AsyncRelease
+except ImportError:
+    web = None
+
+__author__ = 'alforbes'
+
+'''
+test_aio.py
+
+Runs the asyncio client against a small aiohttp application serving the
+documents from the mock client
+'''
+
+mock = MockOrloClient('http://dummy.example.com')
+RELEASE_ID = mock.example_release_dict['id']
+PACKAGE_ID = mock.example_package_dict['id']
+UNSTARTED_ID = 'unstarted'
+MISSING_ID = 'missing'
+
+
+def build_app(requests_seen, bodies_seen):
+    async def record(request):
+        # The body can't be read once the handler has returned
+        requests_seen.append(request)
+        if request.can_read_body:
+            bodies_seen.append(await request.json())
+
+    async def release(request):
+        requests_seen.append(request)
+        return web.json_response({'releases': [mock.example_release_dict]})
+
+    async def releases(request):
+        requests_seen.append(request)
+        if int(request.query.get('offset', 0)) > 0:
+            return web.json_response({'releases': []}, status=404)
+        return web.json_response({'releases': [mock.example_release_dict]})
+
+    async def package(request):
+        requests_seen.append(request)
+        if request.match_info['pid'] == UNSTARTED_ID:
+            return web.json_response({'packages': [dict(
+                mock.example_package_dict, id=UNSTARTED_ID,
+                status='NOT_STARTED', stime=None, ftime=None, duration=None)]})
+        return web.json_response({'packages': [mock.example_package_dict]})
+
+    async def create_release(request):
+        await record(request)
+        return web.json_response({'id': RELEASE_ID})
+
+    async def create_package(request):
+        await record(request)
+        return web.json_response({'id': PACKAGE_ID})
+
+    async def no_content(request):
+        await record(request)
+        return web.Response(status=204)
+
+    async def start(request):
+        await record(request)
+        if request.match_info['pid'] == MISSING_ID:
+            return web.Response(status=404, text='not found')
+        return web.Response(status=204)
+
+    async def stats(request):
+        requests_seen.append(request)
+        return web.json_response(mock.example_stats_dict)
+
+    async def broken(request):
+        return web.Response(status=500, text='oops')
+
+    async def missing(request):
+        return web.Response(status=404, text='not found')
+
+    async def etag(request):
+        requests_seen.append(request)
+        if request.headers.get('If-None-Match') == '"v1"':
+            return web.Response(status=304)
+        return web.json_response({'releases': []}, headers={'ETag': '"v1"'})
+
+    app = web.Application()
+    app.router.add_get('/releases/{rid}', release)
+    app.router.add_get('/releases', releases)
+    app.router.add_get('/packages/{pid}', package)
+    app.router.add_post('/releases', create_release)
+    app.router.add_post('/releases/{rid}/packages', create_package)
+    app.router.add_post('/releases/{rid}/stop', no_content)
+    app.router.add_post('/releases/{rid}/packages/{pid}/start', start)
+    app.router.add_post('/releases/{rid}/packages/{pid}/stop', no_content)
+    app.router.add_get('/stats', stats)
+    app.router.add_get('/broken', broken)
+    app.router.add_get('/missing', missing)
+    app.router.add_get('/etag', etag)
+    return app
+
+
+@unittest.skipIf(web is None, "aiohttp is not installed")
+class TestAsyncOrloClient(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.requests_seen = []
+        self.bodies_seen = []
+        self.server = TestServer(
+            build_app(self.requests_seen, self.bodies_seen))
+        await self.server.start_server()
+        self.client = AsyncOrloClient(str(self.server.make_url('')))
+
+    async def asyncTearDown(self):
+        await self.client.close()
+        await self.server.close()
+
+    async def test_get_release_json(self):
+        doc = await self.client.get_release_json(RELEASE_ID)
+        self.assertEqual(doc['releases'][0]['id'], RELEASE_ID)
+
+    async def test_get_release(self):
+        release = await self.client.get_release(RELEASE_ID)
+        self.assertIsInstance(release, AsyncRelease)
+        self.assertEqual(release.id, RELEASE_ID)
+
+    async def test_release_attribute_requires_fetch(self):
+        release = AsyncRelease(self.client, RELEASE_ID)
+        with self.assertRaises(ClientError):
+            release.user
+
+    async def test_release_get(self):
+        release = AsyncRelease(self.client, RELEASE_ID)
+        self.assertEqual(await release.get('user'), 'testuser')
+        self.assertIsInstance(release.packages[0], Package)
+
+    async def test_get_releases_filter(self):
+        await self.client.get_releases(user='testuser')
+        self.assertEqual(self.requests_seen[-1].query['user'], 'testuser')
+
+    async def test_filter_values_formatted(self):
+        await self.client.get_releases(rollback=True, limit=5)
+        self.assertEqual(dict(self.requests_seen[-1].query),
+                         {'rollback': 'True', 'limit': '5'})
+        [r async for r in self.client.stream_releases(rollback=False)]
+        self.assertEqual(self.requests_seen[-1].query['rollback'], 'False')
+
+    async def test_iter_releases(self):
+        releases = [r async for r in self.client.iter_releases(page_size=1)]
+        self.assertEqual([r.id for r in releases], [RELEASE_ID])
+        self.assertEqual(self.requests_seen[-1].query['offset'], '1')
+
+    async def test_stream_releases(self):
+        releases = [r async for r in self.client.stream_releases(chunk_size=8)]
+        self.assertEqual([r.id for r in releases], [RELEASE_ID])
+
+    async def test_stream_releases_empty(self):
+        releases = [r async for r in self.client.stream_releases(offset=1)]
+        self.assertEqual(releases, [])
+
+    async def test_watch(self):
+        events = [e async for e in self.client.watch([RELEASE_ID])]
+        self.assertEqual([e.kind for e in events],
+                         ['package_started', 'package_stopped',
+                          'release_finished'])
+
+    async def test_watch_conditional(self):
+        """
+        Test that a release is revalidated rather than sent again
+        """
+        last = {}
+        url = self.client.uri + '/etag'
+        first = await self.client._watch_get(url, None, last)
+        second = await self.client._watch_get(url, None, last)
+        self.assertIs(second, first)
+        self.assertEqual(self.requests_seen[-1].headers['If-None-Match'],
+                         '"v1"')
+
+    async def test_get_releases_by_id(self):
+        results = await self.client.get_releases_by_id(
+            [RELEASE_ID, RELEASE_ID])
+        self.assertEqual([r.result.user for r in results],
+                         ['testuser', 'testuser'])
+        self.assertEqual(len(self.requests_seen), 1)
+
+    async def test_get_packages_by_id(self):
+        results = await self.client.get_packages_by_id([PACKAGE_ID])
+        self.assertEqual(results[0].result.release_id, RELEASE_ID)
+
+    async def test_get_packages_by_id_unstarted(self):
+        results = await self.client.get_packages_by_id([UNSTARTED_ID])
+        self.assertTrue(results[0].ok)
+        self.assertIsNone(results[0].result.stime)
+        self.assertEqual(results[0].result.status, 'NOT_STARTED')
+
+    async def test_get_package(self):
+        package = await self.client.get_package(PACKAGE_ID)
+        self.assertEqual(package.id, PACKAGE_ID)
+        self.assertEqual(package.release_id, RELEASE_ID)
+
+    async def test_create_release(self):
+        release = await self.client.create_release('user', ['platform'])
+        self.assertEqual(release.id, RELEASE_ID)
+        body = self.bodies_seen[-1]
+        self.assertEqual(body['platforms'], ['platform'])
+
+    async def test_create_package(self):
+        release = AsyncRelease(self.client, RELEASE_ID)
+        package = await release.add_package('name', '1.0')
+        self.assertEqual(package.id, PACKAGE_ID)
+
+    async def test_package_lifecycle(self):
+        package = Package(RELEASE_ID, PACKAGE_ID, 'name', '1.0')
+        self.assertIs(await self.client.package_start(package), True)
+        self.assertIs(
+            await self.client.package_stop(package, success=False), True)
+        body = self.bodies_seen[-1]
+        self.assertEqual(body, {'success': False})
+
+    async def test_package_start_client_error(self):
+        """
+        Test that a 4xx on start is a ClientError, as in OrloClient
+        """
+        package = Package(RELEASE_ID, MISSING_ID, 'name', '1.0')
+        with self.assertRaises(ClientError):
+            await self.client.package_start(package)
+
+    async def test_packages_bulk(self):
+        packages = [Package(RELEASE_ID, PACKAGE_ID, 'name', '1.0')] * 3
+        results = await self.client.packages_start(packages, max_workers=2)
+        self.assertTrue(all(r.ok for r in results))
+        results = await self.client.packages_stop(packages, success=False)
+        self.assertEqual(len(results), 3)
+        self.assertEqual(self.bodies_seen[-1], {'success': False})
+
+    async def test_add_packages(self):
+        release = AsyncRelease(self.client, RELEASE_ID)
+        results = await release.add_packages([('one', '1'), ('two', '2')])
+        self.assertEqual([r.result.name for r in results], ['one', 'two'])
+
+    async def test_release_stop(self):
+        release = AsyncRelease(self.client, RELEASE_ID)
+        self.assertIs(await self.client.release_stop(release), True)
+
+    async def test_get_stats_drops_none_params(self):
+        result = await self.client.get_stats(platform='web')
+        self.assertEqual(result, mock.example_stats_dict)
+        self.assertEqual(dict(self.requests_seen[-1].query), {'platform': 'web'})
+
+    async def test_server_error(self):
+        response = await self.client._get(self.client.uri + '/broken')
+        with self.assertRaises(ServerError):
+            await self.client._expect_200_json_response(response)
+
+    async def test_client_error(self):
+        response = await self.client._get(self.client.uri + '/missing')
+        with self.assertRaises(ClientError):
+            await self.client._expect_200_json_response(response)
+
+    async def test_connection_error(self):
+        client = AsyncOrloClient('http://localhost:1')
+        with self.assertRaises(ConnectionError):
+            await client.ping()
+        await client.close()
+
+    async def test_coalesced_gets(self):
+        docs = await asyncio.gather(
+            *[self.client.get_release_json(RELEASE_ID) for _ in range(10)])
+        self.assertEqual(len(self.requests_seen), 1)
+        self.assertEqual(docs[9]['releases'][0]['id'], RELEASE_ID)
+        # Each caller decodes its own copy
+        self.assertIsNot(docs[0], docs[1])
+        self.assertEqual(self.client.singleflight.stats()['shared'], 9)
+
+    async def test_coalesced_errors(self):
+        client = AsyncOrloClient('http://localhost:1')
+        results = await asyncio.gather(
+            *[client.ping() for _ in range(3)], return_exceptions=True)
+        self.assertIsInstance(results[0], ConnectionError)
+        self.assertIs(results[0], results[2])
+        await client.close()
+
+
+@unittest.skipIf(web is None, "aiohttp is not installed")
+class TestAsyncParity(unittest.TestCase):
+    def test_methods_mirror_orloclient(self):
+        """
+        Ensure every public OrloClient method has an async counterpart
+        """
+        from orloclient import OrloClient
+        for attribute in dir(OrloClient):
+            if attribute.startswith('_'):
+                continue
+            if callable(getattr(OrloClient, attribute)):
+                self.assertTrue(hasattr(AsyncOrloClient, attribute), attribute)
@@ -0,0 +1,155 @@
+from __future__ import print_function
+import json
+import threading
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from mock import patch
+from six import StringIO
+from orloclient import ClientError
+from orloclient import __main__ as cli
+from orloclient.batch import Batch, object_argv
+from orloclient.capture import OutputCapture
+from orloclient.mock_orlo import MockOrloClient
+
+__author__ = 'alforbes'
+
+'''
+test_batch.py
+
+Tests of "orloclient batch", using the mock client
+'''
+
+RELEASE_ID = MockOrloClient.example_release_dict['id']
+PACKAGE_ID = MockOrloClient.example_package_dict['id']
+
+
+@patch('orloclient.__main__.OrloClient', MockOrloClient)
+class TestBatchCommand(unittest.TestCase):
+    def run_batch(self, lines, *options):
+        """
+        Run lines through "orloclient batch", returning the exit status and
+        the results
+        """
+        stdout = StringIO()
+        status = 0
+        with patch('sys.stdin', StringIO('\n'.join(lines) + '\n')), \
+                patch('sys.stdout', stdout):
+            try:
+                cli.main(['--no-daemon', 'batch'] + list(options))
+            except SystemExit as e:
+                status = e.code
+        return status, [json.loads(l) for l in stdout.getvalue().splitlines()]
+
+    def test_argv(self):
+        status, results = self.run_batch([
+            'create-release -u alex -p web',
+            '# Comment',
+            '',
+            'create-package $1 my-package 1.0.0',
+            'start $4',
+            'stop $4',
+        ])
+        self.assertEqual(status, 0)
+        self.assertEqual([r['line'] for r in results], [1, 4, 5, 6])
+        self.assertEqual([r['status'] for r in results], [0] * 4)
+        self.assertEqual(results[0]['id'], RELEASE_ID)
+        self.assertEqual(results[1]['id'], PACKAGE_ID)
+        self.assertEqual(results[1]['command'],
+                         ['create-package', '$1', 'my-package', '1.0.0'])
+        self.assertEqual(results[1]['stderr'],
+                         'Created package with id {}\n'.format(PACKAGE_ID))
+
+    def test_json(self):
+        status, results = self.run_batch([
+            json.dumps({'command': 'versions'}),
+            json.dumps({'command': 'list', 'filter': ['user=bob'],
+                        'id-only': True, 'stream': True}),
+        ])
+        self.assertEqual(status, 0)
+        self.assertEqual(json.loads(results[0]['stdout']),
+                         {'package_one': '1.2.3'})
+        self.assertEqual(results[1]['command'],
+                         ['list', '--id-only', '--stream', '--', 'user=bob'])
+
+    def test_errors(self):
+        status, results = self.run_batch([
+            'frobnicate',
+            'create-package $1 my-package 1.0.0',
+            'start $3',
+            'daemon',
+            '{"command": "versions", "colour": "blue"}',
+            '--uri http://elsewhere versions',
+            'versions',
+        ])
+        self.assertEqual(status, 1)
+        self.assertEqual([r['status'] for r in results], [2, 1, 2, 2, 1, 1, 0])
+        self.assertIn('Skipped, line 1 failed', results[1]['stderr'])
+        self.assertIn('not an earlier command', results[2]['stderr'])
+        self.assertIn('colour', results[4]['stderr'])
+
+    def test_jobs(self):
+        status, results = self.run_batch(
+            ['versions'] * 20 + ['create-package {} p 1.0'.format(RELEASE_ID),
+                                 'start $21'], '--jobs', '4')
+        self.assertEqual(status, 0)
+        self.assertEqual([r['line'] for r in results], list(range(1, 23)))
+        self.assertEqual(results[-1]['command'], ['start', '$21'])
+
+
+class TestBatchOrdering(unittest.TestCase):
+    def test_same_package_in_order(self):
+        """
+        Test that commands on the same package run one after the other, in
+        input order, while others run alongside them
+        """
+        parser = cli.build_parser()
+        running = []
+        order = []
+        lock = threading.Lock()
+
+        def execute(args):
+            with lock:
+                running.append(args.package)
+                overlap = running.count(args.package) > 1
+            time.sleep(0.01)
+            with lock:
+                running.remove(args.package)
+                order.append((args.object, args.package, overlap))
+
+        lines = []
+        for n in range(5):
+            lines += ['start package-{}'.format(n), 'stop package-{}'.format(n)]
+
+        with ThreadPoolExecutor(4) as executor, OutputCapture() as capture:
+            failed = Batch(parser.parse_args, execute, capture,
+                           cli.subcommand_parsers(parser), jobs=4,
+                           executor=executor).run(lines, StringIO())
+        self.assertEqual(failed, 0)
+        self.assertFalse(any(overlap for _, _, overlap in order))
+        for n in range(5):
+            package = 'package-{}'.format(n)
+            self.assertEqual(
+                [o for o, p, _ in order if p == package], ['start', 'stop'])
+
+
+class TestObjectArgv(unittest.TestCase):
+    def setUp(self):
+        self.subparsers = cli.subcommand_parsers(cli.build_parser())
+
+    def test_positionals(self):
+        self.assertEqual(
+            object_argv({'command': 'start', 'package': '-1'},
+                        self.subparsers),
+            ['start', '--', '-1'])
+
+    def test_options(self):
+        self.assertEqual(
+            object_argv({'command': 'create-release', 'user': 'alex',
+                         'platforms': ['a', 'b'], 'team': None},
+                        self.subparsers),
+            ['create-release', '--platform', 'a', 'b', '--user', 'alex'])
+
+    def test_unknown_command(self):
+        with self.assertRaises(ClientError):
+            object_argv({'command': 'frobnicate'}, self.subparsers)
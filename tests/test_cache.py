@@ -0,0 +1,273 @@
+from __future__ import print_function
+import httpretty
+import json
+from orloclient import OrloClient, ResponseCache, Package
+from orloclient.cache import SQLiteResponseCache
+from tests import OrloClientTest
+import os
+import shutil
+import tempfile
+import threading
+import uuid
+
+__author__ = 'alforbes'
+
+'''
+test_cache.py
+
+Tests of the response cache, on its own and through OrloClient
+'''
+
+
+class TestResponseCache(OrloClientTest):
+    def setUp(self):
+        self.cache = ResponseCache(maxsize=2, ttl={'info': 60, 'stats': None})
+
+    def test_key_ignores_none(self):
+        self.assertEqual(
+            ResponseCache.key('http://x/stats', {'platform': None, 'b': 1}),
+            'http://x/stats?b=1')
+        self.assertEqual(
+            ResponseCache.key('http://x/stats', {'platform': None}),
+            'http://x/stats')
+
+    def test_caches(self):
+        self.assertTrue(self.cache.caches('info'))
+        self.assertFalse(self.cache.caches('release'))
+
+    def test_lru_eviction(self):
+        """
+        Test that the least recently used entry is evicted
+        """
+        self.cache.set('a', 'info', 1)
+        self.cache.set('b', 'info', 2)
+        self.cache.get('a')
+        self.cache.set('c', 'info', 3)
+        self.assertIsNotNone(self.cache.get('a'))
+        self.assertIsNone(self.cache.get('b'))
+        self.assertEqual(self.cache.stats()['evictions'], 1)
+
+    def test_ttl(self):
+        self.cache.set('a', 'info', 1)
+        entry = self.cache.get('a')
+        self.assertTrue(entry.fresh)
+        entry.expires -= 61
+        self.assertFalse(entry.fresh)
+
+    def test_no_ttl(self):
+        self.cache.set('a', 'stats', 1)
+        self.assertIsNone(self.cache.get('a').expires)
+        self.assertTrue(self.cache.get('a').fresh)
+
+    def test_invalidate_endpoint(self):
+        self.cache.set('a', 'info', 1)
+        self.cache.set('b', 'stats', 2)
+        self.cache.invalidate(endpoints=('info',))
+        self.assertIsNone(self.cache.get('a'))
+        self.assertIsNotNone(self.cache.get('b'))
+
+    def test_set_after_invalidate(self):
+        """
+        Test that a document fetched before an invalidation is not stored
+        """
+        generation = self.cache.generation('a', 'info')
+        self.cache.invalidate(keys=('a',))
+        self.cache.set('a', 'info', 1, generation=generation)
+        self.assertIsNone(self.cache.get('a'))
+
+        generation = self.cache.generation('a', 'info')
+        self.cache.invalidate(endpoints=('stats',))
+        self.cache.set('a', 'info', 1, generation=generation)
+        self.assertEqual(self.cache.get('a').value, 1)
+
+
+class TestClientCache(OrloClientTest):
+    DOC = {"user_one": {"releases": 100}}
+
+    def setUp(self):
+        self.cache = ResponseCache(ttl={'info': 60, 'release': 60})
+        self.orlo = OrloClient(self.URI, cache=self.cache)
+
+    def _register_info(self, **kwargs):
+        httpretty.register_uri(
+            httpretty.GET, '{}/info/users'.format(self.URI),
+            status=200,
+            content_type='application/json',
+            body=json.dumps(self.DOC),
+            **kwargs
+        )
+
+    @httpretty.activate
+    def test_hit(self):
+        """
+        Test that a second read is served from the cache
+        """
+        self._register_info()
+        self.assertEqual(self.orlo.get_info('users'), self.DOC)
+        self.assertEqual(self.orlo.get_info('users'), self.DOC)
+        self.assertEqual(len(httpretty.latest_requests()), 1)
+        self.assertEqual(self.cache.stats()['hits'], 1)
+        self.assertEqual(self.cache.stats()['misses'], 1)
+
+    @httpretty.activate
+    def test_uncached_endpoint(self):
+        """
+        Test that endpoints without a TTL always go to the server
+        """
+        httpretty.register_uri(
+            httpretty.GET, '{}/stats'.format(self.URI),
+            status=200,
+            body=json.dumps(self.DOC),
+        )
+        self.orlo.get_stats()
+        self.orlo.get_stats()
+        self.assertEqual(len(httpretty.latest_requests()), 2)
+
+    @httpretty.activate
+    def test_revalidation(self):
+        """
+        Test that an expired entry is revalidated with its ETag
+        """
+        self._register_info(adding_headers={'ETag': '"v1"'})
+        self.orlo.get_info('users')
+        key = ResponseCache.key('{}/info/users'.format(self.URI), {})
+        self.cache.get(key).expires = 0
+
+        httpretty.register_uri(
+            httpretty.GET, '{}/info/users'.format(self.URI),
+            status=304,
+            body='',
+        )
+        self.assertEqual(self.orlo.get_info('users'), self.DOC)
+        self.assertEqual(
+            httpretty.last_request().headers['If-None-Match'], '"v1"')
+        self.assertTrue(self.cache.get(key).fresh)
+        self.assertEqual(self.cache.stats()['revalidations'], 1)
+
+    @httpretty.activate
+    def test_write_invalidates(self):
+        """
+        Test that stopping a package drops the cached release
+        """
+        rid = str(uuid.uuid4())
+        package = Package(rid, str(uuid.uuid4()), 'name', '1.0')
+        httpretty.register_uri(
+            httpretty.GET, '{}/releases/{}'.format(self.URI, rid),
+            status=200,
+            body=json.dumps({'releases': [{'id': rid}]}),
+        )
+        httpretty.register_uri(
+            httpretty.POST, '{}/releases/{}/packages/{}/stop'.format(
+                self.URI, rid, package.id),
+            status=204,
+        )
+        self._register_info()
+
+        self.orlo.get_release_json(rid)
+        self.orlo.get_info('users')
+        self.orlo.package_stop(package)
+        self.assertEqual(len(self.cache), 0)
+
+        self.orlo.get_release_json(rid)
+        self.assertEqual(self.cache.stats()['misses'], 3)
+
+    @httpretty.activate
+    def test_write_during_read(self):
+        """
+        Test that a read overtaken by a write is not cached
+        """
+        def body(request, uri, headers):
+            # A write completing while the GET is in flight
+            self.orlo._invalidate(('info',))
+            return [200, headers, json.dumps(self.DOC)]
+
+        httpretty.register_uri(
+            httpretty.GET, '{}/info/users'.format(self.URI), body=body)
+        self.assertEqual(self.orlo.get_info('users'), self.DOC)
+        self.assertEqual(len(self.cache), 0)
+
+
+class TestSQLiteResponseCache(OrloClientTest):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, 'sub', 'cache.sqlite')
+        self.cache = SQLiteResponseCache(self.path, maxsize=2)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_round_trip(self):
+        self.cache.set('a', 'info', {'foo': [1, 2]}, etag='"x"')
+        entry = self.cache.get('a')
+        self.assertEqual(entry.value, {'foo': [1, 2]})
+        self.assertEqual(entry.etag, '"x"')
+        self.assertTrue(entry.fresh)
+
+    def test_set_after_invalidate(self):
+        generation = self.cache.generation('a', 'info')
+        self.cache.invalidate(endpoints=('info',))
+        self.cache.set('a', 'info', 1, generation=generation)
+        self.assertIsNone(self.cache.get('a'))
+
+    def test_shared_between_instances(self):
+        """
+        Test that another process (instance) sees the same entries
+        """
+        self.cache.set('a', 'info', 1)
+        other = SQLiteResponseCache(self.path)
+        self.assertEqual(other.get('a').value, 1)
+        other.invalidate(keys=('a',))
+        self.assertIsNone(self.cache.get('a'))
+
+    def test_threads(self):
+        """
+        Test that each thread can use the cache
+        """
+        def worker(n):
+            self.cache.set('k{}'.format(n), 'info', n)
+        threads = [threading.Thread(target=worker, args=(n,)) for n in range(2)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(len(self.cache), 2)
+
+    def test_max_size(self):
+        self.cache.set('a', 'info', 1)
+        self.cache.set('b', 'info', 2)
+        self.cache.get('a')
+        self.cache.set('c', 'info', 3)
+        self.assertIsNone(self.cache.get('b'))
+        self.assertIsNotNone(self.cache.get('a'))
+        self.assertEqual(self.cache.stats()['evictions'], 1)
+
+    def test_finished_release_kept(self):
+        """
+        Test that finished releases are cached without expiry
+        """
+        self.cache.set('a', 'release',
+                       {'releases': [{'ftime': '2016-01-01T00:00:00Z'}]})
+        self.cache.set('b', 'release', {'releases': [{'ftime': None}]})
+        self.assertIsNone(self.cache.get('a').expires)
+        self.assertIsNotNone(self.cache.get('b').expires)
+
+    def test_purge(self):
+        self.cache.set('a', 'info', 1)
+        self.cache.set('b', 'info', 2, etag='"x"')
+        self.cache._db.execute("UPDATE entries SET expires = 0")
+        self.cache.purge()
+        self.assertIsNone(self.cache.get('a'))
+        self.assertIsNotNone(self.cache.get('b'))
+
+    @httpretty.activate
+    def test_client(self):
+        httpretty.register_uri(
+            httpretty.GET, '{}/info/packages/versions'.format(self.URI),
+            status=200,
+            body=json.dumps({'package_one': '1.0'}),
+        )
+        OrloClient(self.URI, cache=self.cache).get_versions()
+        result = OrloClient(
+            self.URI, cache=SQLiteResponseCache(self.path)).get_versions()
+        self.assertEqual(result, {'package_one': '1.0'})
+        self.assertEqual(len(httpretty.latest_requests()), 1)
@@ -0,0 +1,154 @@
+from __future__ import print_function
+import httpretty
+import json
+import unittest
+from datetime import datetime
+from mock import patch
+from orloclient import ClientError, ReleaseRecord
+from orloclient.columnar import release_columns, package_columns, parse_time
+from tests import OrloClientTest
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+__author__ = 'alforbes'
+
+'''
+test_columnar.py
+
+Tests of the columnar export of releases and packages
+'''
+
+RELEASE_ID = '8a8ff038-e6bb-4c74-b27d-cf316521bd7a'
+RELEASES = [
+    {
+        'id': RELEASE_ID,
+        'user': 'alice',
+        'team': 'search',
+        'platforms': ['web', 'api'],
+        'stime': '2016-03-03T16:55:05Z',
+        'ftime': '2016-03-03T16:56:03.250000+00:00',
+        'duration': 57,
+        'packages': [
+            {'id': '401da376-c822-4bb2-9b28-a121f8b4d41f', 'name': 'one',
+             'version': '1.0.0', 'status': 'SUCCESSFUL', 'rollback': False,
+             'stime': '2016-03-03T17:55:52+01:00',
+             'ftime': '2016-03-03T16:55:56Z', 'duration': 4},
+            {'id': '7510ffc0-4f0e-4fc1-925f-96ecb84e6db8', 'name': 'two',
+             'version': '2.0.0', 'status': 'FAILED', 'rollback': True,
+             'stime': '2016-03-03T16:55:58Z', 'ftime': None,
+             'duration': None},
+        ],
+    },
+    {
+        'id': 'e42a478f-cc08-42e9-a9fb-c98ec65c414d',
+        'user': 'bob',
+        'team': None,
+        'platforms': ['web'],
+        'stime': '2016-03-04T09:00:00Z',
+        'ftime': None,
+        'duration': None,
+        'packages': [],
+    },
+]
+
+
+class TestParseTime(unittest.TestCase):
+    def test_utc(self):
+        self.assertEqual(parse_time('2016-03-03T16:55:05Z'),
+                         datetime(2016, 3, 3, 16, 55, 5))
+
+    def test_fraction_and_offset(self):
+        self.assertEqual(parse_time('2016-03-03T17:55:05.5+01:00'),
+                         datetime(2016, 3, 3, 16, 55, 5, 500000))
+        self.assertEqual(parse_time('2016-03-03T15:25:05-0130'),
+                         datetime(2016, 3, 3, 16, 55, 5))
+
+    def test_other_formats(self):
+        self.assertEqual(parse_time('2016-03-03'), datetime(2016, 3, 3))
+
+
+class TestColumns(unittest.TestCase):
+    def test_release_columns(self):
+        columns = release_columns(RELEASES, format='columns')
+        self.assertEqual(list(columns['id']), [r['id'] for r in RELEASES])
+        self.assertEqual(columns['ftime'],
+                         [datetime(2016, 3, 3, 16, 56, 3, 250000), None])
+        self.assertEqual(columns['package_count'], [2, 0])
+        self.assertEqual(columns['platforms'], [['web', 'api'], ['web']])
+
+    def test_package_columns_from_releases(self):
+        columns = package_columns(RELEASES, format='columns')
+        self.assertEqual(columns['name'], ['one', 'two'])
+        self.assertEqual(columns['release_id'], [RELEASE_ID, RELEASE_ID])
+        self.assertEqual(columns['stime'][0], datetime(2016, 3, 3, 16, 55, 52))
+
+    def test_records(self):
+        records = [ReleaseRecord(r) for r in RELEASES]
+        self.assertEqual(release_columns(records, format='columns'),
+                         release_columns(RELEASES, format='columns'))
+
+    def test_unknown_format(self):
+        with self.assertRaises(ClientError):
+            release_columns(RELEASES, format='csv')
+
+    def test_missing_library(self):
+        with patch.dict('sys.modules', {'pyarrow': None}):
+            with self.assertRaises(ClientError):
+                release_columns(RELEASES, format='arrow')
+
+
+@unittest.skipIf(numpy is None, "numpy is not installed")
+class TestNumpyColumns(unittest.TestCase):
+    def test_types(self):
+        columns = release_columns(RELEASES, format='numpy')
+        self.assertEqual(columns['id'].dtype, numpy.dtype('S36'))
+        self.assertEqual(columns['id'][0], RELEASE_ID.encode('ascii'))
+        self.assertEqual(columns['stime'].dtype,
+                         numpy.dtype('datetime64[us]'))
+        self.assertTrue(numpy.isnat(columns['ftime'][1]))
+        self.assertTrue(numpy.isnan(columns['duration'][1]))
+        self.assertEqual(columns['platforms'][0], ('web', 'api'))
+
+    def test_matches_plain_columns(self):
+        arrays = package_columns(RELEASES, format='numpy')
+        plain = package_columns(RELEASES, format='columns')
+        self.assertEqual(
+            arrays['stime'].astype(datetime).tolist(), plain['stime'])
+        self.assertEqual(arrays['rollback'].tolist(), [False, True])
+        self.assertEqual(
+            (arrays['status'] == 'FAILED').mean(), 0.5)
+
+    def test_default_format(self):
+        self.assertIsInstance(
+            release_columns(RELEASES)['id'], numpy.ndarray)
+
+    def test_empty(self):
+        columns = release_columns([], format='numpy')
+        self.assertEqual(len(columns['stime']), 0)
+
+
+class ExportTest(OrloClientTest):
+    @httpretty.activate
+    def test_export_releases(self):
+        httpretty.register_uri(
+            httpretty.GET, '{}/releases'.format(self.URI),
+            body=json.dumps({'releases': RELEASES}),
+        )
+        columns = self.orlo.export_releases(format='columns', team='search')
+        self.assertEqual(columns['user'], ['alice', 'bob'])
+        self.assertEqual(httpretty.last_request().querystring,
+                         {'team': ['search']})
+
+    @httpretty.activate
+    def test_export_packages(self):
+        httpretty.register_uri(
+            httpretty.GET, '{}/packages'.format(self.URI),
+            body=json.dumps({'packages': [
+                dict(p, release_id=RELEASE_ID)
+                for p in RELEASES[0]['packages']]}),
+        )
+        columns = self.orlo.export_packages(format='columns')
+        self.assertEqual(columns['status'], ['SUCCESSFUL', 'FAILED'])
@@ -53,3 +53,10 @@ class TestCommandLine(unittest.TestCase):
 
     def test_action_stop(self):
         orloclient.__main__.action_stop(self.client, self.args)
+
+    def test_action_list_stream(self):
+        self.args.filter = ['user=bob']
+        self.args.packages = False
+        self.args.id_only = True
+        self.args.stream = True
+        orloclient.__main__.action_list(self.client, self.args)
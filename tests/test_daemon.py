@@ -0,0 +1,203 @@
+from __future__ import print_function
+import json
+import logging
+import os
+import shutil
+import socket
+import tempfile
+import threading
+import time
+import unittest
+from orloclient import ClientError, OrloError
+from orloclient import __main__ as cli
+from orloclient.daemon import Daemon, forward
+from orloclient.mock_orlo import MockOrloClient
+
+__author__ = 'alforbes'
+
+'''
+test_daemon.py
+
+Tests of the command line daemon, over a real Unix socket
+'''
+
+logger = logging.getLogger('orloclient.test')
+
+
+@unittest.skipUnless(hasattr(socket, 'AF_UNIX'), 'Requires Unix sockets')
+class DaemonTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.socket_path = os.path.join(self.tmpdir, 'orloclient.sock')
+        self.daemons = []
+
+    def tearDown(self):
+        for daemon, thread in self.daemons:
+            daemon.shutdown()
+            thread.join()
+        shutil.rmtree(self.tmpdir)
+
+    def start(self, run, **kwargs):
+        daemon = Daemon(run, socket_path=self.socket_path, **kwargs)
+        thread = threading.Thread(target=daemon.serve_forever)
+        thread.start()
+        self.assertTrue(daemon.wait_ready(5))
+        self.daemons.append((daemon, thread))
+        return daemon
+
+
+class TestDaemon(DaemonTest):
+    def test_output(self):
+        """
+        Test that stdout and log output come back to the caller
+        """
+        def run(daemon, command):
+            print('out', command['object'])
+            logger.info('logged')
+            logger.debug('not logged')
+        self.start(run)
+
+        reply = forward({'object': 'info'}, socket_path=self.socket_path)
+        self.assertEqual(reply['status'], 0)
+        self.assertEqual(reply['stdout'], 'out info\n')
+        self.assertEqual(reply['stderr'], 'logged\n')
+
+    def test_debug(self):
+        def run(daemon, command):
+            logger.debug('debugging')
+        self.start(run)
+
+        reply = forward({'object': 'info', 'debug': True},
+                        socket_path=self.socket_path)
+        self.assertEqual(reply['stderr'], 'debugging\n')
+
+    def test_not_running(self):
+        self.assertIsNone(forward({'object': 'info'},
+                                  socket_path=self.socket_path))
+
+    def test_stale_socket(self):
+        """
+        Test that a socket left behind by a dead daemon is replaced
+        """
+        open(self.socket_path, 'w').close()
+        self.start(lambda daemon, command: None)
+        self.assertEqual(forward({}, socket_path=self.socket_path)['status'], 0)
+
+    def test_already_running(self):
+        self.start(lambda daemon, command: None)
+        with self.assertRaises(OrloError):
+            Daemon(None, socket_path=self.socket_path).serve_forever()
+
+    def test_version_mismatch(self):
+        """
+        Test that a daemon running another version declines the command
+        """
+        self.start(lambda daemon, command: None)
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.connect(self.socket_path)
+        sock.sendall(b'{"version": "0.0.1", "command": {}}\n')
+        reply = json.loads(sock.makefile('rb').readline().decode('utf-8'))
+        sock.close()
+        self.assertIn('error', reply)
+
+    def test_exit_status(self):
+        def run(daemon, command):
+            if command['object'] == 'exit':
+                raise SystemExit(2)
+            raise ClientError('Bad request')
+        self.start(run)
+
+        self.assertEqual(
+            forward({'object': 'exit'}, socket_path=self.socket_path)['status'],
+            2)
+        reply = forward({'object': 'error'}, socket_path=self.socket_path)
+        self.assertEqual(reply['status'], 1)
+        self.assertEqual(reply['stderr'], 'ClientError: Bad request\n')
+
+    def test_coalesce(self):
+        """
+        Test that identical concurrent reads are run once
+        """
+        calls = []
+        release = threading.Event()
+
+        def run(daemon, command):
+            calls.append(command)
+            release.wait(5)
+            print('result')
+
+        daemon = self.start(run, coalesce=lambda c: c['object'] == 'read')
+        replies = []
+
+        def worker(obj):
+            replies.append(forward({'object': obj},
+                                   socket_path=self.socket_path))
+        threads = [threading.Thread(target=worker, args=('read',))
+                   for _ in range(5)]
+        threads.append(threading.Thread(target=worker, args=('write',)))
+        for t in threads:
+            t.start()
+
+        deadline = time.time() + 5
+        while daemon.commands < 6 and time.time() < deadline:
+            time.sleep(0.01)
+        release.set()
+        for t in threads:
+            t.join()
+
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(daemon.coalesced, 4)
+        self.assertEqual([r['stdout'] for r in replies], ['result\n'] * 6)
+
+    def test_client(self):
+        """
+        Test that clients are created once per server
+        """
+        daemon = Daemon(None, socket_path=self.socket_path,
+                        client_factory=MockOrloClient)
+        client = daemon.client('http://example.com')
+        self.assertIs(daemon.client('http://example.com'), client)
+        self.assertIsNot(daemon.client('http://example.com', False), client)
+
+
+class TestForwardedCommand(DaemonTest):
+    def setUp(self):
+        super(TestForwardedCommand, self).setUp()
+        self.daemon = self.start(
+            cli.run_forwarded,
+            coalesce=lambda c: c['object'] in cli.READ_ONLY_COMMANDS,
+            client_factory=lambda uri, verify_ssl: MockOrloClient(uri),
+        )
+
+    def command(self, *argv):
+        args = cli.build_parser().parse_args(
+            ['--socket-path', self.socket_path] + list(argv))
+        return dict((k, v) for k, v in vars(args).items() if k != 'func')
+
+    def test_versions(self):
+        reply = forward(self.command('versions'), socket_path=self.socket_path)
+        self.assertEqual(reply['status'], 0)
+        self.assertEqual(json.loads(reply['stdout']), {'package_one': '1.2.3'})
+
+    def test_get_release(self):
+        release_id = MockOrloClient.example_release_dict['id']
+        reply = forward(self.command('get-release', release_id),
+                        socket_path=self.socket_path)
+        self.assertEqual(
+            json.loads(reply['stderr'])['releases'][0]['id'], release_id)
+
+    def test_warm_client(self):
+        forward(self.command('versions'), socket_path=self.socket_path)
+        forward(self.command('stats'), socket_path=self.socket_path)
+        self.assertEqual(len(self.daemon._clients), 1)
+
+    def test_stream_not_forwarded(self):
+        args = cli.build_parser().parse_args(
+            ['--socket-path', self.socket_path, 'list', '--stream'])
+        self.assertIsNone(cli.forward(args))
+
+    def test_no_daemon(self):
+        args = cli.build_parser().parse_args(
+            ['--socket-path', self.socket_path, '--no-daemon', 'versions'])
+        self.assertIsNone(cli.forward(args))
+        self.assertEqual(self.daemon.commands, 0)
@@ -0,0 +1,89 @@
+from __future__ import print_function
+import os
+import subprocess
+import sys
+import unittest
+
+__author__ = 'alforbes'
+
+'''
+test_import_time.py
+
+Guard against slow imports creeping back into the command line start-up path
+'''
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Modules that are only needed once a request is made
+HEAVY_MODULES = ('requests', 'arrow', 'pkg_resources', 'sqlite3')
+
+# Generous, this is to catch a heavy import, not measure small changes
+MAX_IMPORT_SECONDS = 0.15
+
+
+def run_python(code, *args):
+    return subprocess.check_output(
+        [sys.executable, '-c', code] + list(args),
+        cwd=ROOT, stderr=subprocess.STDOUT).decode('utf-8')
+
+
+CHECK_MODULES = '''
+import sys
+{statement}
+print(' '.join(m for m in {modules!r} if m in sys.modules))
+'''
+
+RUN_MAIN = '''
+import orloclient.__main__
+try:
+    orloclient.__main__.main()
+except SystemExit:
+    pass
+'''
+
+
+@unittest.skipIf(sys.version_info < (3, 7), 'Lazy imports require Python 3.7')
+class TestImportTime(unittest.TestCase):
+    def assertNotLoaded(self, statement, *args):
+        loaded = run_python(
+            CHECK_MODULES.format(statement=statement, modules=HEAVY_MODULES),
+            *args).split('\n')[-2]
+        self.assertEqual(loaded, '')
+
+    def test_import(self):
+        self.assertNotLoaded('import orloclient')
+
+    def test_help(self):
+        """
+        Test that building the argument parser imports nothing heavy
+        """
+        self.assertNotLoaded(RUN_MAIN, '--help')
+
+    def test_version(self):
+        self.assertNotLoaded(RUN_MAIN, '--version')
+
+    def test_daemon_forwarding(self):
+        """
+        Test that forwarding a command to the daemon imports nothing heavy
+        """
+        self.assertNotLoaded('import orloclient.daemon')
+
+    def test_lazy_attribute(self):
+        output = run_python(
+            'import orloclient, sys\n'
+            'orloclient.OrloClient\n'
+            'print("requests" in sys.modules)')
+        self.assertEqual(output.strip().split('\n')[-1], 'True')
+
+    def test_cumulative_time(self):
+        output = subprocess.check_output(
+            [sys.executable, '-X', 'importtime', '-c', 'import orloclient'],
+            cwd=ROOT, stderr=subprocess.STDOUT).decode('utf-8')
+        for line in output.splitlines():
+            # import time: self [us] | cumulative | imported package
+            fields = [f.strip() for f in line.split('|')]
+            if len(fields) == 3 and fields[2] == 'orloclient':
+                self.assertLess(int(fields[1]) / 1e6, MAX_IMPORT_SECONDS)
+                break
+        else:
+            self.fail('orloclient not found in -X importtime output')
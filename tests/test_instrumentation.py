@@ -0,0 +1,232 @@
+from __future__ import print_function
+import httpretty
+import json
+import logging
+import os
+import shutil
+import socket
+import tempfile
+import requests
+from mock import patch
+from orloclient import ConnectionError, Metrics, OrloClient, ResponseCache, \
+    SampledTrace, StatsdExporter
+from orloclient.instrumentation import CacheEvent, DecodeEvent, Histogram, \
+    RequestEvent, endpoint_name
+from tests import OrloClientTest
+
+__author__ = 'alforbes'
+
+'''
+test_instrumentation.py
+
+Tests of the instrumentation hooks, metrics and exporters
+'''
+
+
+class TestEndpointName(OrloClientTest):
+    def test_ids_replaced(self):
+        self.assertEqual(
+            endpoint_name('http://orlo/releases/{}/packages/{}/stop'.format(
+                self.RELEASE.id, self.PACKAGE.id)),
+            '/releases/:id/packages/:id/stop')
+        self.assertEqual(endpoint_name('http://orlo/releases/12?user=bob'),
+                         '/releases/:id')
+        self.assertEqual(endpoint_name('http://orlo/info/users'),
+                         '/info/users')
+        self.assertIsNone(endpoint_name(None))
+
+
+class TestHistogram(OrloClientTest):
+    def test_quantile(self):
+        histogram = Histogram(buckets=(0.1, 1, 10))
+        for value in (0.05, 0.05, 0.5, 5):
+            histogram.observe(value)
+        self.assertEqual(histogram.counts, [2, 1, 1, 0])
+        self.assertEqual(histogram.quantile(0.5), 0.1)
+        self.assertEqual(histogram.quantile(0.75), 1)
+        self.assertEqual(histogram.quantile(1), 10)
+        histogram.observe(50)
+        self.assertIsNone(histogram.quantile(1))
+
+
+class TestClientHooks(OrloClientTest):
+    def setUp(self):
+        self.events = []
+        self.metrics = Metrics()
+        self.orlo = OrloClient(self.URI, retry=False,
+                               hooks=[self.events.append, self.metrics])
+        self.url = '{}/releases/{}'.format(self.URI, self.RELEASE.id)
+
+    @httpretty.activate
+    def test_request_and_decode(self):
+        body = json.dumps({'releases': [{'id': self.RELEASE.id}]})
+        httpretty.register_uri(httpretty.GET, self.url, body=body, status=200)
+        self.orlo.get_release_json(self.RELEASE.id)
+
+        request, decode = self.events
+        self.assertIsInstance(request, RequestEvent)
+        self.assertEqual((request.method, request.endpoint, request.status,
+                          request.response_bytes, request.retries),
+                         ('GET', '/releases/:id', 200, len(body), 0))
+        self.assertIsInstance(decode, DecodeEvent)
+        self.assertEqual(decode.bytes, len(body))
+
+        self.assertEqual(self.metrics.counter(
+            'orloclient_requests_total', endpoint='/releases/:id',
+            method='GET', status='200'), 1)
+        self.assertEqual(self.metrics.histogram(
+            'orloclient_json_decode_seconds', endpoint='/releases/:id').count,
+            1)
+
+    @httpretty.activate
+    def test_post_size(self):
+        url = '{}/releases'.format(self.URI)
+        httpretty.register_uri(httpretty.POST, url, status=200,
+                               body=json.dumps({'id': self.RELEASE.id}))
+        self.orlo.create_release(self.USER, self.PLATFORMS)
+        self.assertTrue(self.events[0].request_bytes > 0)
+
+    def test_error(self):
+        with patch.object(self.orlo.session, 'request', side_effect=[
+                requests.exceptions.ConnectionError('refused')]):
+            with self.assertRaises(ConnectionError):
+                self.orlo.get_release_json(self.RELEASE.id)
+        self.assertEqual(self.events[0].status, None)
+        self.assertEqual(self.events[0].error, 'ConnectionError')
+        self.assertEqual(self.metrics.counter(
+            'orloclient_requests_total', endpoint='/releases/:id',
+            method='GET', status='ConnectionError'), 1)
+
+    @httpretty.activate
+    def test_cache(self):
+        httpretty.register_uri(
+            httpretty.GET, '{}/info/packages/versions'.format(self.URI),
+            body=json.dumps({}), status=200)
+        self.orlo.cache = ResponseCache()
+        self.orlo.get_versions()
+        self.orlo.get_versions()
+        self.assertEqual([e.result for e in self.events
+                          if isinstance(e, CacheEvent)], ['miss', 'hit'])
+
+    @httpretty.activate
+    def test_failing_hook(self):
+        def broken(event):
+            raise RuntimeError('broken hook')
+
+        httpretty.register_uri(httpretty.GET, self.url, body='{}', status=200)
+        self.orlo.hooks.insert(0, broken)
+        self.assertEqual(self.orlo.get_release_json(self.RELEASE.id), {})
+        self.assertEqual(len(self.events), 2)
+
+    @httpretty.activate
+    def test_prometheus(self):
+        httpretty.register_uri(httpretty.GET, self.url, body='{}', status=200)
+        self.orlo.get_release_json(self.RELEASE.id)
+        text = self.metrics.prometheus()
+        self.assertIn('# TYPE orloclient_request_seconds histogram\n', text)
+        self.assertIn(
+            'orloclient_requests_total{endpoint="/releases/:id",method="GET",'
+            'status="200"} 1\n', text)
+        self.assertIn(
+            'orloclient_request_seconds_bucket{endpoint="/releases/:id",'
+            'method="GET",le="+Inf"} 1\n', text)
+
+        tmpdir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tmpdir, 'orloclient.prom')
+            self.metrics.write_textfile(path)
+            with open(path) as f:
+                self.assertEqual(f.read(), text)
+        finally:
+            shutil.rmtree(tmpdir)
+
+
+class TestStatsdExporter(OrloClientTest):
+    EVENT = RequestEvent('GET', '/releases/:id', 200, 0.0125, 0.01, 0, 1024,
+                         1, None)
+
+    def test_lines(self):
+        exporter = StatsdExporter(prefix='orlo')
+        self.assertEqual(exporter.lines(self.EVENT), [
+            'orlo.request.GET.releases_id:12.500|ms',
+            'orlo.request.GET.releases_id.status.200:1|c',
+            'orlo.request.GET.releases_id.ttfb:10.000|ms',
+            'orlo.request.GET.releases_id.response_bytes:1024|c',
+            'orlo.request.GET.releases_id.retries:1|c',
+        ])
+        self.assertEqual(
+            exporter.lines(CacheEvent('/info/packages/versions', 'hit')),
+            ['orlo.cache.info_packages_versions.hit:1|c'])
+
+    def test_udp(self):
+        receiver = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        receiver.bind(('127.0.0.1', 0))
+        receiver.settimeout(5)
+        try:
+            exporter = StatsdExporter(port=receiver.getsockname()[1])
+            exporter(DecodeEvent('/releases', 0.002, 100))
+            exporter.close()
+            self.assertEqual(receiver.recv(1024),
+                             b'orloclient.decode.releases:2.000|ms')
+        finally:
+            receiver.close()
+
+    def test_nothing_listening(self):
+        # UDP, so this does not fail even when StatsD is not running
+        exporter = StatsdExporter(port=1)
+        exporter(self.EVENT)
+        exporter.close()
+
+
+class TestSampledTrace(OrloClientTest):
+    EVENT = CacheEvent('/info/packages/versions', 'hit')
+
+    def test_logs_json(self):
+        with self.assertLogs('orloclient.trace', logging.DEBUG) as logs:
+            SampledTrace(rate=1)(self.EVENT)
+        self.assertEqual(json.loads(logs.records[0].getMessage()), {
+            'event': 'CacheEvent', 'endpoint': '/info/packages/versions',
+            'result': 'hit'})
+
+    def test_sampled(self):
+        trace = SampledTrace(rate=0)
+        trace.logger.setLevel(logging.DEBUG)
+        try:
+            with patch.object(trace.logger, 'debug') as debug:
+                trace(self.EVENT)
+            self.assertFalse(debug.called)
+        finally:
+            trace.logger.setLevel(logging.NOTSET)
+
+
+class CountingResponse(requests.Response):
+    """
+    Response counting accesses to its decoded text
+    """
+    text_reads = 0
+
+    @property
+    def text(self):
+        self.text_reads += 1
+        return super(CountingResponse, self).text
+
+
+class TestLazyLogging(OrloClientTest):
+    def test_text_not_decoded_without_debug(self):
+        response = CountingResponse()
+        response.status_code = 200
+        response._content = b'{"releases": []}'
+        logger = logging.getLogger('orloclient')
+        level = logger.level
+        logger.setLevel(logging.INFO)
+        try:
+            self.assertEqual(self.orlo._expect_200_json_response(response),
+                             {'releases': []})
+            self.assertEqual(response.text_reads, 0)
+
+            logger.setLevel(logging.DEBUG)
+            with self.assertLogs('orloclient.client', logging.DEBUG):
+                self.orlo._expect_200_json_response(response)
+            self.assertEqual(response.text_reads, 1)
+        finally:
+            logger.setLevel(level)
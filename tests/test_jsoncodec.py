@@ -0,0 +1,86 @@
+from __future__ import print_function
+import json
+import os
+import unittest
+from collections import OrderedDict
+from mock import patch
+from orloclient import ClientError, jsoncodec
+from orloclient.jsoncodec import CODECS
+
+__author__ = 'alforbes'
+
+'''
+test_jsoncodec.py
+
+Tests of the JSON codecs, each tested when installed
+'''
+
+DOCUMENT = OrderedDict([
+    ('releases', [OrderedDict([
+        ('id', 'a2a8f5c2-2d2a-4a4f-9d5e-0b6b5d6a1f00'),
+        ('platforms', ['web']),
+        ('team', None),
+        ('duration', 57),
+        ('ratio', 0.5),
+        ('rollback', False),
+        ('references', []),
+        ('metadata', {}),
+    ])]),
+])
+
+
+def available():
+    codecs = []
+    for name, codec_class in CODECS.items():
+        try:
+            codecs.append(codec_class())
+        except ImportError:
+            pass
+    return codecs
+
+
+class TestCodecs(unittest.TestCase):
+    def test_round_trip(self):
+        text = json.dumps(DOCUMENT)
+        for codec in available():
+            self.assertEqual(codec.loads(text.encode('utf-8')), DOCUMENT,
+                             codec.name)
+            self.assertEqual(codec.loads(text), DOCUMENT, codec.name)
+            self.assertEqual(json.loads(codec.dumps(DOCUMENT)), DOCUMENT,
+                             codec.name)
+
+    def test_indent_matches_json(self):
+        for codec in available():
+            self.assertEqual(codec.dumps(DOCUMENT, indent=2),
+                             json.dumps(DOCUMENT, indent=2), codec.name)
+
+    def test_wide_integers(self):
+        for codec in available():
+            self.assertEqual(codec.loads(b'{"n": 100000000000000000000}'),
+                             {'n': 10 ** 20}, codec.name)
+
+    def test_invalid(self):
+        for codec in available():
+            with self.assertRaises(ValueError):
+                codec.loads(b'{"releases": ')
+
+
+class TestSelection(unittest.TestCase):
+    def tearDown(self):
+        jsoncodec._codec = None
+
+    def test_fastest_installed(self):
+        jsoncodec._codec = None
+        with patch.dict(os.environ):
+            os.environ.pop('ORLOCLIENT_JSON', None)
+            self.assertEqual(jsoncodec.get_codec().name, available()[0].name)
+
+    def test_environment(self):
+        with patch.dict(os.environ, {'ORLOCLIENT_JSON': 'json'}):
+            jsoncodec.set_codec()
+        self.assertEqual(jsoncodec.get_codec().name, 'json')
+        self.assertEqual(jsoncodec.dumps({'a': 1}), '{"a": 1}')
+
+    def test_unknown(self):
+        with self.assertRaises(ClientError):
+            jsoncodec.set_codec('yaml')
@@ -0,0 +1,149 @@
+from __future__ import print_function
+import os
+import shutil
+import tempfile
+import unittest
+import uuid
+from orloclient import ClientError, Release, ReleaseRecord
+from orloclient.exceptions import ServerError
+from orloclient.mirror import LocalMirror
+from orloclient.objects import Package
+
+__author__ = 'alforbes'
+
+'''
+test_mirror.py
+
+Tests of the local SQLite mirror, against a fake client serving releases from
+a list
+'''
+
+
+def make_release(stime, ftime=None, user='alice', team='search',
+                 platforms=('web',), packages=(('app', '1.0', 'SUCCESSFUL'),)):
+    rid = str(uuid.uuid4())
+    return {
+        'id': rid, 'user': user, 'team': team, 'platforms': list(platforms),
+        'stime': stime, 'ftime': ftime, 'duration': None if ftime else 10,
+        'references': [], 'metadata': {},
+        'packages': [{
+            'id': str(uuid.uuid4()), 'name': name, 'version': version,
+            'status': status, 'rollback': False, 'stime': stime,
+            'ftime': ftime, 'duration': 5, 'diff_url': None,
+        } for name, version, status in packages],
+    }
+
+
+class FakeClient(object):
+    uri = 'http://orlo.example.com'
+
+    def __init__(self, releases):
+        self.releases = releases
+        self.streamed = []
+        self.fetched = []
+
+    def stream_releases(self, raw=False, **filters):
+        self.streamed.append(filters)
+        after = filters.get('stime_after')
+        for r in self.releases:
+            if after is None or r['stime'] > after:
+                yield r
+
+    def get_release_json(self, release_id):
+        self.fetched.append(release_id)
+        for r in self.releases:
+            if r['id'] == release_id:
+                return {'releases': [r]}
+        raise ServerError('Not found')
+
+
+class TestLocalMirror(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'mirror.sqlite')
+        self.releases = [
+            make_release('2016-03-01T10:00:00Z', '2016-03-01T10:05:00Z'),
+            make_release('2016-03-02T10:00:00Z', '2016-03-02T10:05:00Z',
+                         user='bob', team='payments', platforms=['web', 'api'],
+                         packages=[('app', '1.1', 'FAILED'),
+                                   ('worker', '2.0', 'SUCCESSFUL')]),
+            make_release('2016-03-03T10:00:00Z'),
+        ]
+        self.client = FakeClient(self.releases)
+        self.mirror = LocalMirror(self.client, self.path)
+        self.mirror.sync()
+
+    def tearDown(self):
+        self.mirror.close()
+        shutil.rmtree(self.directory)
+
+    def test_first_sync(self):
+        self.assertEqual(self.client.streamed, [{}])
+        stats = self.mirror.stats()
+        self.assertEqual(stats['releases'], 3)
+        self.assertEqual(stats['packages'], 4)
+        self.assertEqual(stats['unfinished'], 1)
+        self.assertIsNotNone(stats['synced_at'])
+
+    def test_incremental_sync(self):
+        """
+        Test that only new and unfinished releases are fetched again
+        """
+        new = make_release('2016-03-04T10:00:00Z', '2016-03-04T10:01:00Z')
+        self.releases.append(new)
+        self.releases[2]['ftime'] = '2016-03-04T11:00:00Z'
+        self.mirror.overlap = 0
+        # The unfinished release is older than the newest release
+        self.assertEqual(self.mirror.sync(), {'fetched': 1, 'refreshed': 1})
+        self.assertEqual(self.client.streamed[-1],
+                         {'stime_after': '2016-03-03T10:00:00Z'})
+        self.assertEqual(self.client.fetched, [self.releases[2]['id']])
+        self.assertEqual(self.mirror.stats()['unfinished'], 0)
+
+    def test_overlap(self):
+        self.mirror.sync()
+        self.assertEqual(self.client.streamed[-1],
+                         {'stime_after': '2016-03-03T09:59:00Z'})
+
+    def test_refresh_error(self):
+        self.releases.pop()
+        self.mirror.overlap = 0
+        self.mirror.sync()
+        self.assertEqual(self.mirror.stats()['releases'], 3)
+
+    def test_release_filters(self):
+        ids = lambda **f: [r['id'] for r in
+                           self.mirror.get_releases(raw=True, **f)]
+        self.assertEqual(ids(user='bob'), [self.releases[1]['id']])
+        self.assertEqual(ids(platform='api'), [self.releases[1]['id']])
+        self.assertEqual(ids(package_name='worker'), [self.releases[1]['id']])
+        self.assertEqual(ids(stime_after='2016-03-01T12:00:00+01:00'),
+                         [r['id'] for r in self.releases[1:]])
+        self.assertEqual(ids(desc=True, limit=1), [self.releases[2]['id']])
+        self.assertEqual(ids(limit=1, offset=1), [self.releases[1]['id']])
+
+    def test_package_filters(self):
+        failed = self.mirror.get_packages(raw=True, status='FAILED')
+        self.assertEqual([p['version'] for p in failed], ['1.1'])
+        self.assertEqual(failed[0]['release_id'], self.releases[1]['id'])
+        versions = self.mirror.get_packages(raw=True, name='app',
+                                            platform='web', team='search')
+        self.assertEqual([p['version'] for p in versions], ['1.0', '1.0'])
+
+    def test_objects(self):
+        release = self.mirror.get_releases(user='bob')[0]
+        self.assertIsInstance(release, Release)
+        self.assertEqual(release.team, 'payments')
+        self.assertIsInstance(
+            self.mirror.get_releases(compact=True)[0], ReleaseRecord)
+        self.assertIsInstance(self.mirror.get_packages()[0], Package)
+
+    def test_unknown_filter(self):
+        with self.assertRaises(ClientError):
+            self.mirror.get_releases(colour='blue')
+
+    def test_other_server(self):
+        client = FakeClient([])
+        client.uri = 'http://other.example.com'
+        with self.assertRaises(ClientError):
+            LocalMirror(client, self.path)
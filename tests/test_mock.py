@@ -86,6 +86,10 @@ class TestMockOrlo(TestCase):
         result = self.mock_client.get_release(str(uuid.uuid4()))
         self.assertIsInstance(result, Release)
 
+    def test_get_releases_by_id(self):
+        result = self.mock_client.get_releases_by_id([str(uuid.uuid4())])
+        self.assertIsInstance(result[0].result, Release)
+
     def test_deploy_release(self):
         result = self.mock_client.deploy_release(str(uuid.uuid4()))
         self.assertIs(result, True)
@@ -1,7 +1,8 @@
 from __future__ import print_function
 import httpretty
 import json
-from orloclient import ClientError, ServerError
+from orloclient import ClientError, ServerError, OrloClient, Package
+from orloclient.bulk import run_bulk
 from tests import OrloClientTest
 import uuid
 import logging
@@ -34,6 +35,56 @@ class TestOrloBase(OrloClientTest):
         self.assertEqual(self.orlo.ping(), True)
 
 
+class SessionTest(OrloClientTest):
+    """
+    Test the pooled session
+    """
+
+    def test_session_reused(self):
+        """
+        Test that the same session is used for consecutive requests
+        """
+        self.assertIs(self.orlo.session, self.orlo.session)
+
+    def test_pool_size(self):
+        """
+        Test that the pool arguments reach the transport adapter
+        """
+        orlo = OrloClient(self.URI, pool_maxsize=42)
+        adapter = orlo.session.get_adapter(self.URI)
+        self.assertEqual(adapter._pool_maxsize, 42)
+
+    def test_keep_alive_disabled(self):
+        """
+        Test that disabling keep-alive asks the server to close connections
+        """
+        orlo = OrloClient(self.URI, keep_alive=False)
+        self.assertEqual(orlo.session.headers['Connection'], 'close')
+
+    def test_close(self):
+        """
+        Test that close discards the session and a new one is created on use
+        """
+        session = self.orlo.session
+        self.orlo.close()
+        self.assertIsNot(self.orlo.session, session)
+
+    @httpretty.activate
+    def test_context_manager(self):
+        """
+        Test that the client releases its session when used as a context manager
+        """
+        httpretty.register_uri(
+                httpretty.GET, "http://localhost:1337/ping",
+                body="pong",
+                status=200,
+        )
+
+        with OrloClient(self.URI) as orlo:
+            self.assertEqual(orlo.ping(), True)
+        self.assertIsNone(orlo._session)
+
+
 class TestGetReleases(OrloClientTest):
     DUMMY_JSON = {"message": "dummy json"}
     # Raw string for httpretty to return:
@@ -78,6 +129,22 @@ class TestGetReleases(OrloClientTest):
         result = self.orlo.get_release(rid)
         self.assertEqual(result.id, str(rid))
 
+    @httpretty.activate
+    def test_get_release_single_request(self):
+        """
+        Test that the Release returned by get_release does not fetch again
+        """
+        rid = self.RELEASE_JSON['releases'][0]['id']
+        httpretty.register_uri(
+            httpretty.GET, '{}/releases/{}'.format(self.URI, rid),
+            body=self.RELEASE_JSON_S,
+            status=200,
+        )
+
+        result = self.orlo.get_release(rid)
+        self.assertEqual(result.data, self.RELEASE_JSON)
+        self.assertEqual(len(httpretty.latest_requests()), 1)
+
     @httpretty.activate
     def test_get_releases(self):
         """
@@ -92,6 +159,7 @@ class TestGetReleases(OrloClientTest):
 
         release_list = self.orlo.get_releases(foo='bar')
         self.assertEqual(release_list[0].id, self.RELEASE_JSON['releases'][0]['id'])
+        self.assertFalse(release_list[0].stale)
 
     @httpretty.activate
     def test_get_releases_filter(self):
@@ -222,6 +290,83 @@ class TestGetPackages(OrloClientTest):
         )
 
 
+class PaginationTest(OrloClientTest):
+    """
+    Test iter_releases and iter_packages
+    """
+    RELEASES = [{'id': str(uuid.uuid4())} for _ in range(250)]
+
+    def _register(self, collection='releases', items=None):
+        items = self.RELEASES if items is None else items
+
+        def callback(request, uri, response_headers):
+            limit = int(request.querystring['limit'][0])
+            offset = int(request.querystring['offset'][0])
+            page = items[offset:offset + limit]
+            status = 200 if page else 404
+            return [status, response_headers, json.dumps({collection: page})]
+
+        httpretty.register_uri(
+            httpretty.GET, '{}/{}'.format(self.URI, collection),
+            body=callback,
+        )
+
+    @httpretty.activate
+    def test_iter_releases_pages(self):
+        """
+        Test that all pages are fetched and yielded in order
+        """
+        self._register()
+        ids = [r.id for r in self.orlo.iter_releases(page_size=100)]
+        self.assertEqual(ids, [r['id'] for r in self.RELEASES])
+        self.assertEqual(len(httpretty.latest_requests()), 3)
+
+    @httpretty.activate
+    def test_iter_releases_filters(self):
+        """
+        Test that filters are passed with every page
+        """
+        self._register()
+        list(self.orlo.iter_releases(raw=True, page_size=200, user='bob'))
+        self.assertEqual(
+            httpretty.last_request().querystring,
+            {'user': ['bob'], 'limit': ['200'], 'offset': ['200']})
+
+    @httpretty.activate
+    def test_iter_releases_limit(self):
+        """
+        Test that limit caps the total number of results
+        """
+        self._register()
+        ids = [r['id'] for r in
+               self.orlo.iter_releases(raw=True, page_size=100, limit=150)]
+        self.assertEqual(ids, [r['id'] for r in self.RELEASES[:150]])
+        self.assertEqual(
+            httpretty.last_request().querystring['limit'], ['50'])
+
+    @httpretty.activate
+    def test_iter_releases_exact_multiple(self):
+        """
+        Test the empty 404 page after an exact multiple of page_size
+        """
+        self._register(items=self.RELEASES[:200])
+        self.assertEqual(
+            len(list(self.orlo.iter_releases(raw=True, page_size=100))), 200)
+
+    @httpretty.activate
+    def test_iter_releases_empty(self):
+        self._register(items=[])
+        self.assertEqual(list(self.orlo.iter_releases()), [])
+
+    @httpretty.activate
+    def test_iter_packages(self):
+        packages = [{'id': str(uuid.uuid4()), 'release_id': str(uuid.uuid4()),
+                     'name': 'p', 'version': '1'} for _ in range(3)]
+        self._register('packages', packages)
+        result = list(self.orlo.iter_packages(page_size=2, name='p'))
+        self.assertEqual([p.id for p in result], [p['id'] for p in packages])
+
+
 class CreateReleaseTest(OrloClientTest):
     """
     Testing the create_release function
@@ -341,6 +486,21 @@ class WorkflowTest(OrloClientTest):
             self.orlo.package_start(self.PACKAGE),
             True)
 
+    @httpretty.activate
+    def test_package_start_client_error(self):
+        """
+        Test that a 4xx on start is a ClientError, which is not retried
+        """
+        httpretty.register_uri(
+            httpretty.POST, '{}/releases/{}/packages/{}/start'.format(
+                self.URI, self.PACKAGE.release_id, self.PACKAGE.id),
+            status=404,
+            body='Not found',
+        )
+
+        with self.assertRaises(ClientError):
+            self.orlo.package_start(self.PACKAGE)
+
     @httpretty.activate
     def test_package_stop(self):
         """
@@ -407,6 +567,209 @@ class WorkflowTest(OrloClientTest):
         self.assertEqual(False, body['success'])
 
 
+class BulkTest(OrloClientTest):
+    """
+    Test the bulk package methods
+    """
+
+    def _packages(self, n):
+        rid = str(uuid.uuid4())
+        return [Package(rid, str(uuid.uuid4()), 'p{}'.format(i), '1.0')
+                for i in range(n)]
+
+    @httpretty.activate
+    def test_packages_start(self):
+        """
+        Test that every package is started and results are in order
+        """
+        packages = self._packages(5)
+        for p in packages:
+            httpretty.register_uri(
+                httpretty.POST, '{}/releases/{}/packages/{}/start'.format(
+                    self.URI, p.release_id, p.id),
+                status=204,
+            )
+
+        results = self.orlo.packages_start(packages, max_workers=3)
+        self.assertEqual([r.item for r in results], packages)
+        self.assertTrue(all(r.ok and r.result is True for r in results))
+
+    @httpretty.activate
+    def test_packages_stop_partial_failure(self):
+        """
+        Test that one failure is reported without hiding the others
+        """
+        packages = self._packages(3)
+        for i, p in enumerate(packages):
+            httpretty.register_uri(
+                httpretty.POST, '{}/releases/{}/packages/{}/stop'.format(
+                    self.URI, p.release_id, p.id),
+                status=500 if i == 1 else 204,
+            )
+
+        results = self.orlo.packages_stop(packages)
+        self.assertEqual([r.ok for r in results], [True, False, True])
+        self.assertIsInstance(results[1].error, ServerError)
+
+    @httpretty.activate
+    def test_packages_stop_success_dict(self):
+        """
+        Test per-package success values
+        """
+        package = self._packages(1)[0]
+        httpretty.register_uri(
+            httpretty.POST, '{}/releases/{}/packages/{}/stop'.format(
+                self.URI, package.release_id, package.id),
+            status=204,
+        )
+
+        self.orlo.packages_stop([package], success={package.id: False})
+        body = json.loads(httpretty.last_request().body)
+        self.assertEqual(False, body['success'])
+
+    @httpretty.activate
+    def test_packages_stop_success_dict_uuid_keys(self):
+        """
+        Test that UUID keys match packages with string ids, and back
+        """
+        packages = self._packages(2)
+        packages[1].id = uuid.UUID(packages[1].id)
+        for p in packages:
+            httpretty.register_uri(
+                httpretty.POST, '{}/releases/{}/packages/{}/stop'.format(
+                    self.URI, p.release_id, p.id),
+                status=204,
+            )
+
+        results = self.orlo.packages_stop(packages, success={
+            uuid.UUID(packages[0].id): False, str(packages[1].id): False})
+        self.assertTrue(all(r.ok for r in results))
+        bodies = dict((r.path, json.loads(r.body))
+                      for r in httpretty.latest_requests())
+        self.assertEqual(len(bodies), 2)
+        self.assertEqual([b['success'] for b in bodies.values()],
+                         [False, False])
+
+    @httpretty.activate
+    def test_packages_stop_success_dict_missing(self):
+        packages = self._packages(2)
+        with self.assertRaises(ClientError):
+            self.orlo.packages_stop(packages, success={packages[0].id: True})
+        self.assertEqual(httpretty.latest_requests(), [])
+
+    @httpretty.activate
+    def test_create_packages(self):
+        """
+        Test creating packages in bulk
+        """
+        httpretty.register_uri(
+            httpretty.POST, '{}/releases/{}/packages'.format(
+                self.URI, self.RELEASE.release_id),
+            status=200,
+            body='{{"id": "{}"}}'.format(uuid.uuid4()),
+        )
+
+        results = self.orlo.create_packages(
+            self.RELEASE, [('one', '1.0'), ('two', '2.0')])
+        self.assertEqual([r.result.name for r in results], ['one', 'two'])
+
+    def test_empty(self):
+        self.assertEqual(self.orlo.packages_start([]), [])
+
+    @httpretty.activate
+    def test_get_releases_by_id(self):
+        """
+        Test results in input order, fetched once per id, missing ones reported
+        """
+        releases = [{'id': str(uuid.uuid4()), 'user': 'u{}'.format(i),
+                     'packages': []} for i in range(3)]
+        for r in releases:
+            httpretty.register_uri(
+                httpretty.GET, '{}/releases/{}'.format(self.URI, r['id']),
+                body=json.dumps({'releases': [r]}),
+            )
+        missing = str(uuid.uuid4())
+        httpretty.register_uri(
+            httpretty.GET, '{}/releases/{}'.format(self.URI, missing),
+            status=404, body='{"message": "not found"}',
+        )
+
+        ids = [releases[2]['id'], missing, releases[0]['id'],
+               releases[2]['id'], releases[1]['id']]
+        results = self.orlo.get_releases_by_id(ids, max_workers=2)
+        self.assertEqual([r.item for r in results], ids)
+        self.assertEqual([r.ok for r in results],
+                         [True, False, True, True, True])
+        self.assertIsInstance(results[1].error, ClientError)
+        self.assertEqual([r.result.user for r in results if r.ok],
+                         ['u2', 'u0', 'u2', 'u1'])
+        self.assertEqual(len(httpretty.latest_requests()), 4)
+
+    @httpretty.activate
+    def test_get_releases_by_id_hydrated(self):
+        """
+        Test that attributes are read without another request
+        """
+        release = {'id': str(uuid.uuid4()), 'user': 'bob', 'packages': []}
+        httpretty.register_uri(
+            httpretty.GET, '{}/releases/{}'.format(self.URI, release['id']),
+            body=json.dumps({'releases': [release]}),
+        )
+        result = self.orlo.get_releases_by_id([release['id']])[0].result
+        self.assertEqual(result.user, 'bob')
+        self.assertEqual(len(httpretty.latest_requests()), 1)
+
+    @httpretty.activate
+    def test_get_packages_by_id(self):
+        package = self._packages(1)[0]
+        httpretty.register_uri(
+            httpretty.GET, '{}/packages/{}'.format(self.URI, package.id),
+            body=json.dumps({'packages': [{
+                'id': package.id, 'release_id': package.release_id,
+                'name': package.name, 'version': package.version}]}),
+        )
+        results = self.orlo.get_packages_by_id([package.id])
+        self.assertEqual(results[0].result.release_id, package.release_id)
+        self.assertEqual(results[0].result.name, 'p0')
+
+    @httpretty.activate
+    def test_get_packages_by_id_unfinished(self):
+        """
+        Test packages that have not started or finished, with null times
+        """
+        packages = self._packages(2)
+        for package, status, stime in zip(
+                packages, ['NOT_STARTED', 'IN_PROGRESS'],
+                [None, '2016-03-03T10:00:00Z']):
+            httpretty.register_uri(
+                httpretty.GET, '{}/packages/{}'.format(self.URI, package.id),
+                body=json.dumps({'packages': [{
+                    'id': package.id, 'release_id': package.release_id,
+                    'name': package.name, 'version': package.version,
+                    'status': status, 'stime': stime, 'ftime': None,
+                    'duration': None}]}),
+            )
+        results = self.orlo.get_packages_by_id([p.id for p in packages])
+        self.assertTrue(all(r.ok for r in results))
+        self.assertEqual([r.result.status for r in results],
+                         ['NOT_STARTED', 'IN_PROGRESS'])
+        self.assertIsNone(results[0].result.stime)
+        self.assertEqual(results[1].result.stime.hour, 10)
+        self.assertIsNone(results[1].result.ftime)
+
+    def test_unexpected_error_per_item(self):
+        """
+        Test that an exception other than OrloError doesn't abort the batch
+        """
+        def fetch(n):
+            if n == 1:
+                raise ValueError(n)
+            return n
+        results = run_bulk(fetch, [0, 1, 2], 2)
+        self.assertEqual([r.result for r in results], [0, None, 2])
+        self.assertIsInstance(results[1].error, ValueError)
+
+
 class ErrorTest(OrloClientTest):
     """
     Test error conditions
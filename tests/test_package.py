@@ -44,3 +44,51 @@ class TestPackage(OrloClientTest):
         self.assertIsInstance(self.package.duration, int)
         self.assertEqual(self.package.duration,
                          client.example_package_dict['duration'])
+
+
+class TestPackageFromDict(OrloClientTest):
+    def setUp(self):
+        self.package = Package.from_dict(client.example_package_dict)
+
+    def test_required_attributes_as_given(self):
+        self.assertEqual(self.package.id, client.example_package_dict['id'])
+        self.assertEqual(self.package.release_id,
+                         client.example_package_dict['release_id'])
+
+    def test_attributes_cast(self):
+        self.assertEqual(self.package.status, 'SUCCESSFUL')
+        self.assertIsInstance(self.package.stime, arrow.arrow.Arrow)
+
+    def test_to_dict_unchanged(self):
+        self.assertEqual(
+            sorted(self.package.to_dict().keys()),
+            ['id', 'name', 'release_id', 'version'])
+
+    def test_release_id_fallback(self):
+        d = dict(client.example_package_dict)
+        del d['release_id']
+        package = Package.from_dict(d, release_id='foo')
+        self.assertEqual(package.release_id, 'foo')
+
+    def test_not_started(self):
+        """
+        Test that the null times of an unstarted package are kept as None
+        """
+        d = dict(client.example_package_dict, stime=None, ftime=None,
+                 duration=None, status='NOT_STARTED')
+        package = Package.from_dict(d)
+        self.assertIsNone(package.stime)
+        self.assertIsNone(package.ftime)
+        self.assertEqual(package.status, 'NOT_STARTED')
+
+
+class TestPackageFromDicts(OrloClientTest):
+    def test_same_as_from_dict(self):
+        d = dict(client.example_package_dict)
+        del d['release_id']
+        bulk = Package.from_dicts([d, client.example_package_dict],
+                                  release_id='foo')
+        for package, expected in zip(
+                bulk, [Package.from_dict(d, release_id='foo'),
+                       Package.from_dict(client.example_package_dict)]):
+            self.assertEqual(vars(package), vars(expected))
@@ -0,0 +1,112 @@
+from __future__ import print_function
+from tests import OrloClientTest
+from orloclient.mock_orlo import MockOrloClient
+from orloclient import Release, ReleaseRecord, PackageRecord
+from orloclient.exceptions import ClientError
+import arrow
+import copy
+import uuid
+
+__author__ = 'alforbes'
+
+client = MockOrloClient('http://dummy.example.com')
+
+"""
+Tests of the compact record types, which should behave like Release/Package
+"""
+
+
+class TestReleaseRecord(OrloClientTest):
+    def setUp(self):
+        self.release_dict = copy.deepcopy(client.example_release_dict)
+        self.record = ReleaseRecord(self.release_dict)
+        self.release = Release.from_dict(client, self.release_dict)
+
+    def test_attributes_match_release(self):
+        """
+        Test that the record exposes the same values as a Release
+        """
+        for attribute in ('id', 'release_id', 'uuid', 'user', 'team',
+                          'duration', 'platforms', 'references', 'metadata',
+                          'stime', 'ftime'):
+            self.assertEqual(getattr(self.record, attribute),
+                             getattr(self.release, attribute), attribute)
+
+    def test_metadata_none(self):
+        """
+        Test that null or missing metadata stays None, as on a Release
+        """
+        self.release_dict['metadata'] = None
+        release = Release.from_dict(client, self.release_dict)
+        self.assertIsNone(ReleaseRecord(self.release_dict).metadata)
+        self.assertIsNone(release.metadata)
+        del self.release_dict['metadata']
+        record = ReleaseRecord(self.release_dict)
+        self.assertIsNone(record.metadata)
+        self.assertIsNone(record.to_dict()['metadata'])
+
+    def test_stime_cast(self):
+        self.assertIsInstance(self.record.stime, arrow.arrow.Arrow)
+
+    def test_uuid(self):
+        self.assertEqual(self.record.uuid, uuid.UUID(self.release_dict['id']))
+
+    def test_no_dict(self):
+        """
+        Test that records carry no instance __dict__
+        """
+        self.assertFalse(hasattr(self.record, '__dict__'))
+        self.assertFalse(hasattr(self.record.packages[0], '__dict__'))
+
+    def test_strings_interned(self):
+        """
+        Test that repeated values share one string object
+        """
+        other_dict = copy.deepcopy(self.release_dict)
+        other_dict['user'] = ''.join(['test', 'user'])
+        other = ReleaseRecord(other_dict)
+        self.assertIs(other.user, self.record.user)
+        self.assertIs(other.packages[0].status, self.record.packages[0].status)
+
+    def test_packages(self):
+        package = self.record.packages[0]
+        self.assertIsInstance(package, PackageRecord)
+        self.assertEqual(package.release_id, self.release_dict['id'])
+        self.assertEqual(package.name, 'package_one')
+
+    def test_extra_field(self):
+        """
+        Test that unknown fields are kept, as given
+        """
+        self.release_dict['something_id'] = str(uuid.uuid4())
+        record = ReleaseRecord(self.release_dict)
+        self.assertEqual(record.something_id, self.release_dict['something_id'])
+
+    def test_bad_attribute(self):
+        with self.assertRaises(ClientError):
+            return self.record.bad_attribute_19847
+
+    def test_to_dict_round_trip(self):
+        d = self.record.to_dict()
+        for key, value in self.release_dict.items():
+            if key != 'packages':
+                self.assertEqual(d[key], value, key)
+        self.assertEqual(d['packages'][0]['id'],
+                         self.release_dict['packages'][0]['id'])
+        self.assertEqual(self.record.data, {'releases': [d]})
+
+
+class TestPackageRecord(OrloClientTest):
+    def setUp(self):
+        self.record = PackageRecord(client.example_package_dict)
+
+    def test_attributes(self):
+        self.assertEqual(self.record.id, client.example_package_dict['id'])
+        self.assertEqual(self.record.version, '1.2.3')
+        self.assertEqual(self.record.ftime,
+                         arrow.get(client.example_package_dict['ftime']))
+
+    def test_to_dict(self):
+        d = self.record.to_dict()
+        for key, value in client.example_package_dict.items():
+            self.assertEqual(d[key], value, key)
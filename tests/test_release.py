@@ -2,7 +2,9 @@ from __future__ import print_function
 from tests import OrloClientTest
 from orloclient.mock_orlo import MockOrloClient
 from orloclient import Release, Package
+import orloclient.objects
 from orloclient.exceptions import ClientError
+from mock import Mock, patch
 import arrow
 import uuid
 
@@ -93,3 +95,211 @@ class TestRelease(OrloClientTest):
                 'test-package', '1.0.0'),
             Package
         )
+
+    def test_add_packages(self):
+        """
+        Test adding several packages
+        """
+        results = self.release.add_packages([('one', '1.0'), ('two', '2.0')])
+        self.assertEqual([r.item for r in results],
+                         [('one', '1.0'), ('two', '2.0')])
+        self.assertIsInstance(results[0].result, Package)
+
+
+class CountingClient(MockOrloClient):
+    """
+    Mock client that counts fetches
+    """
+    fetches = 0
+
+    def get_release_json(self, release_id):
+        self.fetches += 1
+        return super(CountingClient, self).get_release_json(release_id)
+
+
+class TestReleaseStaleness(OrloClientTest):
+    def setUp(self):
+        self.client = CountingClient('http://dummy.example.com')
+        self.release_id = self.client.example_release_dict['id']
+        self.doc = {'releases': [self.client.example_release_dict]}
+
+    def test_release_lazy_fetch(self):
+        """
+        Test that a release without data fetches it once on first access
+        """
+        release = Release(self.client, self.release_id)
+        self.assertTrue(release.stale)
+        release.user
+        release.team
+        self.assertEqual(self.client.fetches, 1)
+
+    def test_release_pre_hydrated(self):
+        """
+        Test that a release created with data does not fetch it
+        """
+        release = Release(self.client, self.release_id, data=self.doc)
+        self.assertFalse(release.stale)
+        self.assertEqual(release.user, 'testuser')
+        self.assertEqual(self.client.fetches, 0)
+
+    def test_release_from_dict(self):
+        release = Release.from_dict(
+            self.client, self.client.example_release_dict)
+        self.assertEqual(release.id, self.release_id)
+        self.assertEqual(release.data, self.doc)
+        self.assertEqual(self.client.fetches, 0)
+
+    def test_release_max_age(self):
+        """
+        Test that data older than max_age is fetched again
+        """
+        release = Release(self.client, self.release_id, data=self.doc,
+                          max_age=60)
+        self.assertFalse(release.stale)
+        release._fetched_at -= 61
+        self.assertTrue(release.stale)
+        release.user
+        self.assertEqual(self.client.fetches, 1)
+        self.assertLess(release.age, 60)
+
+    def test_release_refresh(self):
+        release = Release(self.client, self.release_id, data=self.doc)
+        self.assertIs(release.refresh(), release)
+        self.assertEqual(self.client.fetches, 1)
+
+    def test_release_invalidate(self):
+        release = Release(self.client, self.release_id, data=self.doc)
+        release.invalidate()
+        self.assertTrue(release.stale)
+        self.assertIsNone(release.age)
+        release.user
+        self.assertEqual(self.client.fetches, 1)
+
+
+class TestReleaseCache(OrloClientTest):
+    def setUp(self):
+        self.client = CountingClient('http://dummy.example.com')
+        self.release = Release.from_dict(
+            self.client, self.client.example_release_dict)
+
+    def test_cast_once(self):
+        """
+        Test that values are cast once and then served from the cache
+        """
+        cast = Mock(wraps=orloclient.objects.cast_time)
+        with patch.dict(orloclient.objects.RELEASE_SCHEMA, {'stime': cast}):
+            stime = self.release.stime
+            self.assertIs(self.release.stime, stime)
+            self.assertEqual(cast.call_count, 1)
+
+    def test_packages_memoized(self):
+        self.assertIs(self.release.packages, self.release.packages)
+
+    def test_cache_cleared_on_fetch(self):
+        """
+        Test that fetching new data discards the cast values
+        """
+        stime = self.release.stime
+        packages = self.release.packages
+        self.release.fetch()
+        self.assertIsNot(self.release.stime, stime)
+        self.assertIsNot(self.release.packages, packages)
+
+    def test_cache_cleared_on_invalidate(self):
+        stime = self.release.stime
+        self.release.invalidate()
+        self.assertIsNot(self.release.stime, stime)
+        self.assertEqual(self.client.fetches, 1)
+
+
+class TestCastTime(OrloClientTest):
+    def test_matches_arrow(self):
+        for value in ('2016-03-03T16:55:05Z', '2016-03-03T16:55:05',
+                      '2016-03-03T16:55:05.123456+00:00',
+                      '2016-03-03T16:55:05.5-05:30', '2016-03-03'):
+            cast = orloclient.objects.cast_time(value)
+            expected = arrow.get(value)
+            self.assertEqual(cast, expected, value)
+            self.assertEqual(cast.utcoffset(), expected.utcoffset(), value)
+
+    def test_new_object_each_time(self):
+        value = client.example_release_dict['stime']
+        self.assertIsNot(orloclient.objects.cast_time(value),
+                         orloclient.objects.cast_time(value))
+
+
+class TestCastRecords(OrloClientTest):
+    def setUp(self):
+        self.packages = [
+            dict(client.example_package_dict, id=str(uuid.uuid4()),
+                 ftime=None) for _ in range(3)]
+
+    def test_same_as_cast_type(self):
+        for record, cast in zip(
+                [client.example_package_dict],
+                orloclient.objects.cast_records(
+                    [client.example_package_dict])):
+            self.assertEqual(
+                cast, dict((k, orloclient.objects.cast_type(k, v))
+                           for k, v in record.items()))
+
+    def test_none_kept(self):
+        cast = orloclient.objects.cast_records(self.packages)
+        self.assertIsNone(cast[0]['ftime'])
+        self.assertIsInstance(cast[0]['id'], uuid.UUID)
+
+    def test_schema(self):
+        cast = orloclient.objects.cast_records(
+            self.packages, {'stime': orloclient.objects.cast_time})
+        self.assertIsInstance(cast[0]['stime'], arrow.arrow.Arrow)
+        self.assertEqual(cast[0]['id'], self.packages[0]['id'])
+        # The records given are not modified
+        self.assertEqual(self.packages[0]['stime'],
+                         client.example_package_dict['stime'])
+
+    def test_package_schema(self):
+        cast = orloclient.objects.cast_records(
+            self.packages, orloclient.objects.PACKAGE_SCHEMA)
+        self.assertIsInstance(cast[0]['release_id'], uuid.UUID)
+
+
+class TestReleaseFromDicts(OrloClientTest):
+    def setUp(self):
+        self.client = CountingClient('http://dummy.example.com')
+
+    def test_cast_up_front(self):
+        releases = Release.from_dicts(
+            self.client, [self.client.example_release_dict] * 2)
+        self.assertEqual(len(releases), 2)
+        cast = Mock()
+        with patch.dict(orloclient.objects.RELEASE_SCHEMA, {'stime': cast}):
+            self.assertEqual(
+                releases[1].stime,
+                arrow.get(self.client.example_release_dict['stime']))
+            self.assertFalse(cast.called)
+        self.assertEqual(releases[0].packages[0].name, 'package_one')
+        self.assertEqual(self.client.fetches, 0)
+
+
+class TestSchema(OrloClientTest):
+    def test_unknown_items_as_given(self):
+        """
+        Test that items merely named like ids and times are not cast
+        """
+        d = dict(client.example_release_dict, runtime_note='slow',
+                 build_id='42')
+        release = Release.from_dict(client, d)
+        self.assertEqual(release.runtime_note, 'slow')
+        self.assertEqual(release.build_id, '42')
+        self.assertEqual(orloclient.objects.cast_type('runtime_note', 'x'), 'x')
+
+    def test_none_as_given(self):
+        d = dict(client.example_release_dict, ftime=None)
+        self.assertIsNone(Release.from_dict(client, d).ftime)
+        self.assertIsNone(orloclient.objects.cast_type('ftime', None))
+        self.assertIsNone(orloclient.objects.cast_type('release_id', None))
+
+    def test_converter(self):
+        self.assertIs(orloclient.objects.converter('release_id'), uuid.UUID)
+        self.assertIsNone(orloclient.objects.converter(
+            'release_id', orloclient.objects.RELEASE_SCHEMA))
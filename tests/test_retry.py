@@ -0,0 +1,230 @@
+from __future__ import print_function
+import httpretty
+import io
+import json
+import requests
+import time
+from email.utils import formatdate
+from mock import Mock, patch
+from orloclient import CircuitOpenError, ConnectionError, OrloClient, \
+    ServerError
+from orloclient.retry import CircuitBreaker, CircuitBreakers, RetryPolicy
+from tests import OrloClientTest
+
+__author__ = 'alforbes'
+
+'''
+test_retry.py
+
+Tests of retries and circuit breaking
+'''
+
+
+class FakeResponse(object):
+    def __init__(self, status_code, headers=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+
+
+class RecordingPolicy(RetryPolicy):
+    """
+    RetryPolicy recording delays rather than sleeping
+    """
+
+    def __init__(self, **kwargs):
+        super(RecordingPolicy, self).__init__(**kwargs)
+        self.delays = []
+
+    def sleep(self, delay):
+        self.delays.append(delay)
+
+
+class TestRetryPolicy(OrloClientTest):
+    def test_backoff(self):
+        policy = RetryPolicy(backoff=1, max_backoff=5)
+        for attempt, cap in enumerate([1, 2, 4, 5, 5]):
+            for _ in range(20):
+                self.assertTrue(0 <= policy.delay(attempt) <= cap)
+
+    def test_retry_after_seconds(self):
+        policy = RetryPolicy()
+        self.assertEqual(
+            policy.delay(0, FakeResponse(503, {'Retry-After': '7'})), 7)
+
+    def test_retry_after_date(self):
+        policy = RetryPolicy()
+        date = formatdate(time.time() + 30, usegmt=True)
+        delay = policy.delay(0, FakeResponse(503, {'Retry-After': date}))
+        self.assertTrue(25 < delay <= 30)
+
+    def test_retry_after_too_long(self):
+        policy = RetryPolicy(max_retry_after=60)
+        self.assertIsNone(
+            policy.delay(0, FakeResponse(503, {'Retry-After': '3600'})))
+
+    def test_methods(self):
+        response = FakeResponse(503)
+        self.assertIsNotNone(RetryPolicy().next_delay('GET', 0,
+                                                      response=response))
+        self.assertIsNone(RetryPolicy().next_delay('POST', 0,
+                                                   response=response))
+        self.assertIsNotNone(RetryPolicy(retry_post=True).next_delay(
+            'POST', 0, response=response))
+
+    def test_not_retryable(self):
+        policy = RetryPolicy()
+        self.assertIsNone(policy.next_delay('GET', 0,
+                                            response=FakeResponse(404)))
+        self.assertIsNone(policy.next_delay('GET', 0,
+                                            response=FakeResponse(500)))
+
+    def test_exhausted(self):
+        policy = RetryPolicy(total=2)
+        error = requests.exceptions.ConnectionError()
+        self.assertIsNotNone(policy.next_delay('GET', 1, error=error))
+        self.assertIsNone(policy.next_delay('GET', 2, error=error))
+        self.assertEqual(policy.stats(), {'retries': 1, 'exhausted': 1})
+
+
+class TestCircuitBreaker(OrloClientTest):
+    def setUp(self):
+        self.breaker = CircuitBreaker(failure_rate=0.5, min_requests=4,
+                                      reset_timeout=10)
+
+    def open(self):
+        for ok in (True, False, True, False):
+            self.assertTrue(self.breaker.allow())
+            self.breaker.record(ok)
+        self.assertEqual(self.breaker.state, CircuitBreaker.OPEN)
+
+    def expire(self):
+        self.breaker._changed_at -= 11
+
+    def test_stays_closed(self):
+        for ok in (True, False, True, True, False, True):
+            self.breaker.record(ok)
+        self.assertEqual(self.breaker.state, CircuitBreaker.CLOSED)
+
+    def test_min_requests(self):
+        for _ in range(3):
+            self.breaker.record(False)
+        self.assertEqual(self.breaker.state, CircuitBreaker.CLOSED)
+
+    def test_opens_and_rejects(self):
+        self.open()
+        self.assertFalse(self.breaker.allow())
+        self.assertEqual(self.breaker.stats()['rejected'], 1)
+        self.assertEqual(self.breaker.stats()['opened'], 1)
+
+    def test_probe_closes(self):
+        self.open()
+        self.expire()
+        self.assertTrue(self.breaker.allow())
+        self.assertEqual(self.breaker.state, CircuitBreaker.HALF_OPEN)
+        # Only one probe at a time
+        self.assertFalse(self.breaker.allow())
+        self.breaker.record(True)
+        self.assertEqual(self.breaker.state, CircuitBreaker.CLOSED)
+        self.assertTrue(self.breaker.allow())
+
+    def test_probe_fails(self):
+        self.open()
+        self.expire()
+        self.assertTrue(self.breaker.allow())
+        self.breaker.record(False)
+        self.assertEqual(self.breaker.state, CircuitBreaker.OPEN)
+        self.assertFalse(self.breaker.allow())
+
+    def test_window(self):
+        breaker = CircuitBreaker(min_requests=2, window=0)
+        breaker.record(False)
+        time.sleep(0.01)
+        breaker.record(True)
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+
+    def test_per_host(self):
+        breakers = CircuitBreakers(min_requests=1)
+        breakers.get('http://a:1/releases').record(False)
+        self.assertIs(breakers.get('http://a:1/packages'),
+                      breakers.get('http://a:1/releases'))
+        self.assertEqual(breakers.stats()['a:1']['state'], 'open')
+        self.assertEqual(breakers.get('http://b/').state, 'closed')
+
+
+class TestClientRetry(OrloClientTest):
+    def setUp(self):
+        self.policy = RecordingPolicy()
+        self.orlo = OrloClient(self.URI, retry=self.policy)
+        self.url = '{}/info/users'.format(self.URI)
+
+    @httpretty.activate
+    def test_get_retried(self):
+        httpretty.register_uri(httpretty.GET, self.url, responses=[
+            httpretty.Response(body='', status=503),
+            httpretty.Response(body='', status=503,
+                               adding_headers={'Retry-After': '2'}),
+            httpretty.Response(body=json.dumps({'a': 1}), status=200),
+        ])
+        self.assertEqual(self.orlo.get_info('users'), {'a': 1})
+        self.assertEqual(len(self.policy.delays), 2)
+        self.assertEqual(self.policy.delays[1], 2)
+
+    @httpretty.activate
+    def test_gives_up(self):
+        httpretty.register_uri(httpretty.GET, self.url, body='', status=503)
+        with self.assertRaises(ServerError):
+            self.orlo.get_info('users')
+        self.assertEqual(len(self.policy.delays), 3)
+
+    @httpretty.activate
+    def test_post_not_retried(self):
+        url = '{}/releases/{}/stop'.format(self.URI, self.RELEASE.id)
+        httpretty.register_uri(httpretty.POST, url, body='', status=503)
+        with self.assertRaises(ServerError):
+            self.orlo.release_stop(self.RELEASE)
+        self.assertEqual(self.policy.delays, [])
+
+    def test_connection_error_retried(self):
+        response = requests.Response()
+        response.status_code = 200
+        response._content = b'{"a": 1}'
+        with patch.object(self.orlo.session, 'request', side_effect=[
+                requests.exceptions.ConnectionError('refused'), response]):
+            self.assertEqual(self.orlo.get_info('users'), {'a': 1})
+        self.assertEqual(len(self.policy.delays), 1)
+
+    def test_stream_retried_response_closed(self):
+        """
+        Test that a retried streamed response is closed before retrying
+        """
+        failed = Mock(spec=requests.Response, status_code=503, headers={})
+        response = requests.Response()
+        response.status_code = 200
+        response.raw = io.BytesIO(b'{"releases": [{"id": "a"}]}')
+        with patch.object(self.orlo.session, 'request',
+                          side_effect=[failed, response]):
+            releases = list(self.orlo.stream_releases(raw=True))
+        self.assertEqual(releases, [{'id': 'a'}])
+        failed.close.assert_called_once_with()
+        self.assertEqual(len(self.policy.delays), 1)
+
+    def test_no_retry(self):
+        orlo = OrloClient(self.URI, retry=False)
+        with patch.object(orlo.session, 'request', side_effect=[
+                requests.exceptions.ConnectionError('refused')]) as request:
+            with self.assertRaises(ConnectionError):
+                orlo.get_info('users')
+        self.assertEqual(request.call_count, 1)
+
+    @httpretty.activate
+    def test_circuit_breaker(self):
+        httpretty.register_uri(httpretty.GET, self.url, body='', status=500)
+        breakers = CircuitBreakers(min_requests=2)
+        orlo = OrloClient(self.URI, retry=False, circuit_breaker=breakers)
+        for _ in range(2):
+            with self.assertRaises(ServerError):
+                orlo.get_info('users')
+        with self.assertRaises(CircuitOpenError):
+            orlo.get_info('users')
+        self.assertEqual(len(httpretty.latest_requests()), 2)
+        self.assertEqual(breakers.stats()['localhost:1337']['rejected'], 1)
@@ -0,0 +1,157 @@
+from __future__ import print_function
+import threading
+import time
+import unittest
+import requests
+from mock import patch
+from orloclient import ConnectionError, OrloClient
+from orloclient.singleflight import SingleFlight, flight_key
+from tests import OrloClientTest
+
+__author__ = 'alforbes'
+
+'''
+test_singleflight.py
+
+Tests of coalescing concurrent identical requests
+'''
+
+
+def run_threads(count, target):
+    """
+    Run target in count threads, returning what each returned or raised
+    """
+    results = [None] * count
+
+    def run(n):
+        try:
+            results[n] = target()
+        except Exception as e:
+            results[n] = e
+
+    threads = [threading.Thread(target=run, args=(n,)) for n in range(count)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return results
+
+
+class SlowCall(object):
+    """
+    Function that blocks until released, counting its calls
+    """
+
+    def __init__(self, result=None, error=None):
+        self.result = result
+        self.error = error
+        self.calls = 0
+        self.started = threading.Event()
+        self.release = threading.Event()
+
+    def __call__(self):
+        self.calls += 1
+        self.started.set()
+        self.release.wait(5)
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+
+class TestSingleFlight(unittest.TestCase):
+    def concurrent(self, flight, func, count=10):
+        """
+        Call func through flight from count threads, releasing it once they
+        are all waiting
+        """
+        def release():
+            func.started.wait(5)
+            while flight.stats()['shared'] < count - 1:
+                time.sleep(0.001)
+            func.release.set()
+
+        releaser = threading.Thread(target=release)
+        releaser.start()
+        results = run_threads(count, lambda: flight.do('key', func))
+        releaser.join()
+        return results
+
+    def test_shares_result(self):
+        flight = SingleFlight()
+        func = SlowCall(result={'a': 1})
+        results = self.concurrent(flight, func)
+        self.assertEqual(func.calls, 1)
+        for result in results:
+            self.assertIs(result, func.result)
+        self.assertEqual(flight.stats(),
+                         {'calls': 1, 'shared': 9, 'in_flight': 0})
+
+    def test_shares_exception(self):
+        flight = SingleFlight()
+        func = SlowCall(error=ConnectionError('down'))
+        results = self.concurrent(flight, func)
+        self.assertEqual(func.calls, 1)
+        for result in results:
+            self.assertIs(result, func.error)
+
+    def test_sequential_calls_not_shared(self):
+        flight = SingleFlight()
+        self.assertEqual(flight.do('key', lambda: 1), 1)
+        self.assertEqual(flight.do('key', lambda: 2), 2)
+        self.assertEqual(flight.stats()['shared'], 0)
+
+    def test_keys(self):
+        self.assertEqual(flight_key('u', {'a': 1, 'b': 2}),
+                         flight_key('u', {'b': 2, 'a': 1}))
+        self.assertNotEqual(flight_key('u', {'a': 1}), flight_key('u'))
+        self.assertNotEqual(flight_key('u', headers={'If-None-Match': '"x"'}),
+                            flight_key('u'))
+
+
+class TestClientCoalescing(OrloClientTest):
+    def slow_request(self, calls, release):
+        def request(method, url, **kwargs):
+            calls.append(url)
+            release.wait(5)
+            response = requests.Response()
+            response.status_code = 200
+            response._content = b'{"releases": [{"id": "1"}]}'
+            return response
+        return request
+
+    def get_concurrently(self, orlo, count=10):
+        calls = []
+        release = threading.Event()
+
+        def release_when_waiting():
+            while not calls or \
+                    orlo.singleflight.stats()['shared'] < count - 1:
+                time.sleep(0.001)
+            release.set()
+
+        with patch.object(orlo.session, 'request',
+                          side_effect=self.slow_request(calls, release)):
+            releaser = threading.Thread(target=release_when_waiting)
+            releaser.start()
+            results = run_threads(count, lambda: orlo.get_release_json('1'))
+            releaser.join()
+        return calls, results
+
+    def test_one_request(self):
+        orlo = OrloClient(self.URI)
+        calls, results = self.get_concurrently(orlo)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results[0], {'releases': [{'id': '1'}]})
+        # Each caller decodes its own copy
+        self.assertEqual(len(set(id(r) for r in results)), 10)
+
+    def test_disabled(self):
+        orlo = OrloClient(self.URI, coalesce=False)
+        self.assertIsNone(orlo.singleflight)
+        response = requests.Response()
+        response.status_code = 200
+        response._content = b'{}'
+        with patch.object(orlo.session, 'request',
+                          return_value=response) as request:
+            run_threads(3, lambda: orlo.get_release_json('1'))
+        self.assertEqual(request.call_count, 3)
@@ -0,0 +1,233 @@
+from __future__ import print_function
+import httpretty
+import json
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+import weakref
+from mock import patch
+from orloclient import ClientError, ConnectionError, OrloClient, ServerError
+from orloclient.spool import WriteBehindQueue, _flush_at_exit
+from tests import OrloClientTest
+
+__author__ = 'alforbes'
+
+'''
+test_spool.py
+
+Tests of the write-behind queue for package events
+'''
+
+
+class RecordingSend(object):
+    """
+    Stand-in for OrloClient._send_event, failing as told
+    """
+
+    def __init__(self, failures=None):
+        """
+        :param dict failures: package id -> list of exceptions to raise, one
+            per attempt
+        """
+        self.failures = failures or {}
+        self.sent = []
+        self.lock = threading.Lock()
+
+    def __call__(self, event):
+        with self.lock:
+            errors = self.failures.get(event.package_id)
+            if errors:
+                raise errors.pop(0)
+            self.sent.append((event.package_id, event.action, event.kwargs))
+
+
+class TestWriteBehindQueue(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, 'spool', 'events.jsonl')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_order_per_package(self):
+        send = RecordingSend()
+        queue = WriteBehindQueue(send)
+        for n in range(3):
+            queue.put('start', 'r', 'p{}'.format(n))
+        for n in range(3):
+            queue.put('stop', 'r', 'p{}'.format(n), success=n != 1)
+        self.assertTrue(queue.close())
+
+        for n in range(3):
+            package = 'p{}'.format(n)
+            self.assertEqual(
+                [(a, k) for p, a, k in send.sent if p == package],
+                [('start', {}), ('stop', {'success': n != 1})])
+        self.assertEqual(queue.stats()['sent'], 6)
+
+    def test_retry(self):
+        send = RecordingSend({'p': [ConnectionError('down'),
+                                    ServerError('500')]})
+        queue = WriteBehindQueue(send, backoff=0.001)
+        queue.put('start', 'r', 'p')
+        queue.put('stop', 'r', 'p')
+        self.assertTrue(queue.flush(5))
+        self.assertEqual([a for _, a, _ in send.sent], ['start', 'stop'])
+        self.assertEqual(queue.stats()['retries'], 2)
+        queue.close()
+
+    def test_failing_package_does_not_block(self):
+        """
+        Test that other packages are sent while one is backing off
+        """
+        send = RecordingSend({'a': [ConnectionError('down')] * 100})
+        queue = WriteBehindQueue(send, backoff=60)
+        queue.put('start', 'r', 'a')
+        queue.put('start', 'r', 'b')
+        queue.put('stop', 'r', 'a')
+        queue.put('stop', 'r', 'b')
+        self.assertFalse(queue.flush(0.5))
+        self.assertEqual(send.sent, [('b', 'start', {}), ('b', 'stop', {})])
+        self.assertEqual(len(queue), 2)
+        self.assertFalse(queue.close(timeout=0))
+
+    def test_client_error_dropped(self):
+        send = RecordingSend({'p': [ClientError('404')]})
+        queue = WriteBehindQueue(send)
+        queue.put('start', 'r', 'p')
+        queue.put('stop', 'r', 'p')
+        self.assertTrue(queue.flush(5))
+        self.assertEqual(send.sent, [('p', 'stop', {})])
+        self.assertEqual(queue.failed[0][0].action, 'start')
+        queue.close()
+
+    def test_max_attempts(self):
+        send = RecordingSend({'p': [ServerError('500')] * 3})
+        queue = WriteBehindQueue(send, backoff=0.001, max_attempts=2)
+        queue.put('start', 'r', 'p')
+        self.assertTrue(queue.flush(5))
+        self.assertEqual(send.sent, [])
+        self.assertEqual(len(queue.failed), 1)
+        queue.close()
+
+    def test_max_attempts_default(self):
+        """
+        Test that the queue drains when the server never accepts an event
+        """
+        send = RecordingSend({'p': [ServerError('500')] * 100})
+        queue = WriteBehindQueue(send, backoff=0.0001)
+        queue.put('start', 'r', 'p')
+        self.assertTrue(queue.flush(5))
+        self.assertEqual(queue.stats()['retries'], 9)
+        self.assertEqual(len(queue.failed), 1)
+        queue.close()
+
+    def test_closed(self):
+        queue = WriteBehindQueue(RecordingSend())
+        queue.close()
+        with self.assertRaises(ClientError):
+            queue.put('start', 'r', 'p')
+
+    def test_spool_survives_restart(self):
+        """
+        Test that events not sent are sent by the next queue on the spool
+        """
+        down = RecordingSend({'p': [ConnectionError('down')] * 100})
+        queue = WriteBehindQueue(down, path=self.path, backoff=60)
+        queue.put('start', 'r', 'p')
+        queue.put('add_results', 'r', 'p', results='ok')
+        queue.put('stop', 'r', 'p', success=True)
+        queue.close(timeout=0.1)
+
+        # As left by a write interrupted by a crash
+        with open(self.path, 'a') as f:
+            f.write('{"seq": 4, "act')
+
+        send = RecordingSend()
+        queue = WriteBehindQueue(send, path=self.path)
+        self.assertTrue(queue.flush(5))
+        self.assertEqual(send.sent, [
+            ('p', 'start', {}),
+            ('p', 'add_results', {'results': 'ok'}),
+            ('p', 'stop', {'success': True}),
+        ])
+        # The invalid line is skipped, sequence numbers carry on
+        queue.put('start', 'r', 'q')
+        self.assertTrue(queue.flush(5))
+        with open(self.path) as f:
+            records = [json.loads(line) for line in f]
+        self.assertEqual(records[-2]['seq'], 4)
+        self.assertEqual(records[-1], {'ack': 4})
+
+        # Emptied on a clean shutdown
+        queue.close()
+        self.assertEqual(os.path.getsize(self.path), 0)
+
+    def test_flush_at_exit(self):
+        """
+        Test the exit handler for a queue held in memory
+        """
+        queue = WriteBehindQueue(RecordingSend({'p': [ServerError('500')]}),
+                                 backoff=0.001)
+        queue.put('start', 'r', 'p')
+        _flush_at_exit(weakref.ref(queue))
+        self.assertEqual(len(queue), 0)
+        queue.close()
+
+    def test_spool_in_use(self):
+        queue = WriteBehindQueue(RecordingSend(), path=self.path)
+        with self.assertRaises(ClientError):
+            WriteBehindQueue(RecordingSend(), path=self.path)
+        queue.close()
+
+
+class TestClientWriteBehind(OrloClientTest):
+    def setUp(self):
+        super(TestClientWriteBehind, self).setUp()
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+        environ = patch.dict(os.environ, {'XDG_CACHE_HOME': self.tmpdir})
+        environ.start()
+        self.addCleanup(environ.stop)
+
+    def test_default_spool(self):
+        orlo = OrloClient(self.URI, write_behind=True)
+        self.assertEqual(orlo.write_behind._spool.path, os.path.join(
+            self.tmpdir, 'orloclient', 'events.jsonl'))
+        # A second client falls back to memory rather than failing
+        other = OrloClient(self.URI, write_behind=True)
+        self.assertIsNone(other.write_behind._spool)
+        other.close()
+        orlo.close()
+
+    def test_memory_only(self):
+        orlo = OrloClient(self.URI, write_behind=True, spool_path=False)
+        self.assertIsNone(orlo.write_behind._spool)
+        orlo.close()
+
+    @httpretty.activate
+    def test_package_events(self):
+        for action in ('start', 'stop', 'results'):
+            httpretty.register_uri(
+                httpretty.POST, '{}/releases/{}/packages/{}/{}'.format(
+                    self.URI, self.PACKAGE.release_id, self.PACKAGE.id,
+                    action),
+                status=204,
+            )
+
+        orlo = OrloClient(self.URI, write_behind=True)
+        self.assertIs(orlo.package_start(self.PACKAGE), True)
+        orlo.package_add_results(self.PACKAGE, 'results')
+        orlo.package_stop(self.PACKAGE, success=False)
+        self.assertTrue(orlo.flush(5))
+        orlo.close()
+
+        self.assertEqual(
+            json.loads(httpretty.last_request().body), {'success': False})
+        # httpretty can record a request with a body twice
+        paths = [r.path.rsplit('/', 1)[1] for r in httpretty.latest_requests()]
+        self.assertEqual([p for n, p in enumerate(paths)
+                          if n == 0 or paths[n - 1] != p],
+                         ['start', 'results', 'stop'])
@@ -0,0 +1,152 @@
+from __future__ import print_function
+import httpretty
+import json
+import random
+import unittest
+import uuid
+from orloclient import ClientError, ServerError, Package
+from orloclient.streaming import ArrayItemParser
+from tests import OrloClientTest
+
+__author__ = 'alforbes'
+
+'''
+test_streaming.py
+
+Tests of the incremental array parser, and of stream_releases and
+stream_packages
+'''
+
+DOCUMENT = {
+    'meta': {'releases': ['not', 'these'], 'note': 'a "releases": [1] here'},
+    'releases': [
+        {'id': 'one', 'platforms': ['web'], 'user': u'bébé'},
+        {'id': 'two', 'references': [], 'metadata': {'k': '[{]}"\\'}},
+        12.5e3, -7, True, None, u'☃', [[], {}],
+    ],
+    'total': 8,
+}
+
+
+def chunks(data, size):
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+def parse(data, size):
+    parser = ArrayItemParser('releases')
+    items = []
+    for chunk in chunks(data, size):
+        items.extend(parser.feed(chunk))
+    items.extend(parser.close())
+    return items
+
+
+class TestArrayItemParser(unittest.TestCase):
+    def test_any_chunk_size(self):
+        """
+        Test that elements are the same however the document is split
+        """
+        data = json.dumps(DOCUMENT, ensure_ascii=False).encode('utf-8')
+        for size in (1, 2, 3, 7, 64, len(data)):
+            self.assertEqual(parse(data, size), DOCUMENT['releases'], size)
+
+    def test_random_documents(self):
+        rng = random.Random(42)
+        for _ in range(200):
+            items = [rng.choice([
+                rng.randint(-10 ** 12, 10 ** 12),
+                rng.random() * 1000,
+                str(uuid.uuid4()),
+                {'id': str(uuid.uuid4()), 'n': [rng.randint(0, 9)] * 3},
+            ]) for _ in range(rng.randint(0, 20))]
+            data = json.dumps({'releases': items},
+                              indent=rng.choice([None, 2])).encode('utf-8')
+            self.assertEqual(parse(data, rng.randint(1, 40)), items)
+
+    def test_elements_as_they_complete(self):
+        parser = ArrayItemParser('releases')
+        self.assertEqual(parser.feed(b'{"releases": [{"id": 1}, {"id"'),
+                         [{'id': 1}])
+        self.assertEqual(parser.feed(b': 2}]'), [{'id': 2}])
+        self.assertTrue(parser.done)
+        self.assertEqual(parser.close(), [])
+
+    def test_number_split_across_chunks(self):
+        parser = ArrayItemParser('releases')
+        self.assertEqual(parser.feed(b'{"releases": [1'), [])
+        self.assertEqual(parser.feed(b'5.25, 3'), [15.25])
+        self.assertEqual(parser.feed(b']}'), [3])
+
+    def test_empty(self):
+        self.assertEqual(parse(b'{"releases": []}', 4), [])
+
+    def test_missing_array(self):
+        with self.assertRaises(ClientError):
+            parse(b'{"packages": [1, 2]}', 4)
+
+    def test_truncated(self):
+        with self.assertRaises(ClientError):
+            parse(b'{"releases": [{"id": 1}, {"id": 2', 4)
+
+    def test_invalid_element(self):
+        with self.assertRaises(ClientError):
+            parse(b'{"releases": [{"id": 1}, {"id" 2}, ' + b' ' * 64 + b']}', 8)
+
+
+class StreamTest(OrloClientTest):
+    """
+    Test stream_releases and stream_packages
+    """
+    RELEASES = [{'id': str(uuid.uuid4()), 'platforms': ['web']}
+                for _ in range(50)]
+
+    def _register(self, collection, items, status=200):
+        httpretty.register_uri(
+            httpretty.GET, '{}/{}'.format(self.URI, collection),
+            body=json.dumps({collection: items}),
+            status=status,
+        )
+
+    @httpretty.activate
+    def test_stream_releases(self):
+        self._register('releases', self.RELEASES)
+        releases = list(self.orlo.stream_releases(chunk_size=16, user='bob'))
+        self.assertEqual([r.id for r in releases],
+                         [r['id'] for r in self.RELEASES])
+        self.assertEqual(httpretty.last_request().querystring,
+                         {'user': ['bob']})
+
+    @httpretty.activate
+    def test_stream_releases_raw(self):
+        self._register('releases', self.RELEASES)
+        self.assertEqual(list(self.orlo.stream_releases(raw=True)),
+                         self.RELEASES)
+
+    @httpretty.activate
+    def test_stream_releases_compact(self):
+        self._register('releases', self.RELEASES[:1])
+        record = next(self.orlo.stream_releases(compact=True))
+        self.assertEqual(record.platforms, ['web'])
+
+    @httpretty.activate
+    def test_stream_empty(self):
+        self._register('releases', [], status=404)
+        self.assertEqual(list(self.orlo.stream_releases()), [])
+
+    @httpretty.activate
+    def test_stream_error(self):
+        httpretty.register_uri(
+            httpretty.GET, '{}/releases'.format(self.URI),
+            body='oops', status=500,
+        )
+        with self.assertRaises(ServerError):
+            list(self.orlo.stream_releases())
+
+    @httpretty.activate
+    def test_stream_packages(self):
+        packages = [{'id': str(uuid.uuid4()), 'release_id': str(uuid.uuid4()),
+                     'name': 'p', 'version': '1'} for _ in range(3)]
+        self._register('packages', packages)
+        result = list(self.orlo.stream_packages(name='p'))
+        self.assertIsInstance(result[0], Package)
+        self.assertEqual([p.id for p in result], [p['id'] for p in packages])
@@ -0,0 +1,184 @@
+from __future__ import print_function
+import copy
+import httpretty
+import json
+import unittest
+import uuid
+from mock import patch
+from orloclient.watch import ReleaseTracker, Interval, PACKAGE_STARTED, \
+    PACKAGE_STOPPED, RELEASE_FINISHED
+from tests import OrloClientTest
+
+__author__ = 'alforbes'
+
+'''
+test_watch.py
+
+Tests of watch(), against releases that move on by one step on every poll
+'''
+
+
+def make_release(stime='2016-03-03T10:00:00Z'):
+    return {
+        'id': str(uuid.uuid4()), 'stime': stime, 'ftime': None,
+        'packages': [{'id': str(uuid.uuid4()), 'name': 'app',
+                      'stime': None, 'ftime': None, 'status': 'NOT_STARTED'}],
+    }
+
+
+def progress(release, step):
+    """
+    The release after "step" polls: started, stopped then finished
+    """
+    release = copy.deepcopy(release)
+    package = release['packages'][0]
+    if step >= 1:
+        package['stime'] = '2016-03-03T10:00:01Z'
+        package['status'] = 'IN_PROGRESS'
+    if step >= 2:
+        package['ftime'] = '2016-03-03T10:00:02Z'
+        package['status'] = 'SUCCESSFUL'
+    if step >= 3:
+        release['ftime'] = '2016-03-03T10:00:03Z'
+    return release
+
+
+class TestReleaseTracker(unittest.TestCase):
+    def test_events(self):
+        release = make_release()
+        tracker = ReleaseTracker([release['id']])
+        self.assertEqual(tracker.update(progress(release, 0)), [])
+        self.assertEqual([e.kind for e in tracker.update(
+            progress(release, 3))],
+            [PACKAGE_STARTED, PACKAGE_STOPPED, RELEASE_FINISHED])
+        self.assertEqual(tracker.active, [])
+
+    def test_each_change_once(self):
+        release = make_release()
+        tracker = ReleaseTracker([release['id']])
+        tracker.update(progress(release, 1))
+        events = tracker.update(progress(release, 2))
+        self.assertEqual([(e.kind, e.status) for e in events],
+                         [(PACKAGE_STOPPED, 'SUCCESSFUL')])
+
+    def test_stime_after(self):
+        releases = [make_release('2016-03-03T10:00:00Z'),
+                    make_release('2016-03-02T10:00:00+01:00')]
+        tracker = ReleaseTracker([r['id'] for r in releases])
+        tracker.update(releases[0])
+        self.assertIsNone(tracker.stime_after())
+        tracker.update(releases[1])
+        self.assertEqual(tracker.stime_after(), '2016-03-02T08:59:59Z')
+
+
+class TestInterval(unittest.TestCase):
+    def test_adaptive(self):
+        interval = Interval(1, 4, 2)
+        self.assertEqual([interval.next(False) for _ in range(4)],
+                         [2, 4, 4, 4])
+        self.assertEqual(interval.next(True), 1)
+
+
+class WatchTest(OrloClientTest):
+    def setUp(self):
+        super(WatchTest, self).setUp()
+        self.releases = [make_release(), make_release()]
+        self.polls = dict((r['id'], 0) for r in self.releases)
+        self.queries = []
+        self.sleeps = []
+        sleep = patch.object(Interval, 'sleep', self.sleeps.append)
+        sleep.start()
+        self.addCleanup(sleep.stop)
+
+    def _next(self, release):
+        step = self.polls[release['id']]
+        self.polls[release['id']] += 1
+        return progress(release, step)
+
+    def _register(self, etag=False):
+        def single(request, uri, headers):
+            rid = uri.rsplit('/', 1)[-1].split('?')[0]
+            release = [r for r in self.releases if r['id'] == rid][0]
+            if etag and request.headers.get('If-None-Match') == rid:
+                return [304, headers, '']
+            if etag:
+                headers['ETag'] = rid
+            return [200, headers,
+                    json.dumps({'releases': [self._next(release)]})]
+
+        def query(request, uri, headers):
+            self.queries.append(request.querystring)
+            return [200, headers, json.dumps(
+                {'releases': [self._next(r) for r in self.releases]})]
+
+        for release in self.releases:
+            httpretty.register_uri(
+                httpretty.GET,
+                '{}/releases/{}'.format(self.URI, release['id']), body=single)
+        httpretty.register_uri(
+            httpretty.GET, '{}/releases'.format(self.URI), body=query)
+
+    @httpretty.activate
+    def test_watch_one(self):
+        self._register()
+        release = self.releases[0]
+        events = list(self.orlo.watch([release['id']], interval=1,
+                                      backoff=2))
+        self.assertEqual(
+            [(e.kind, e.status) for e in events],
+            [(PACKAGE_STARTED, None), (PACKAGE_STOPPED, 'SUCCESSFUL'),
+             (RELEASE_FINISHED, None)])
+        self.assertEqual(events[-1].release_id, release['id'])
+        # Polled until finished, then stopped
+        self.assertEqual(self.polls[release['id']], 4)
+        self.assertEqual(self.sleeps, [2, 1, 1])
+
+    @httpretty.activate
+    def test_watch_batched(self):
+        """
+        Test that the releases are polled together after the first poll
+        """
+        self._register()
+        events = list(self.orlo.watch([r['id'] for r in self.releases]))
+        self.assertEqual(len(events), 6)
+        self.assertEqual(self.queries[0], {'stime_after': ['2016-03-03T09:59:59Z']})
+        self.assertEqual(len(self.queries), 3)
+
+    @httpretty.activate
+    def test_conditional(self):
+        """
+        Test that an unchanged release is revalidated rather than sent again
+        """
+        release = self.releases[0]
+        responses = [
+            (200, progress(release, 2), {'ETag': '"a"'}),
+            (304, None, {}),
+            (200, progress(release, 3), {}),
+        ]
+        validators = []
+
+        def single(request, uri, headers):
+            validators.append(request.headers.get('If-None-Match'))
+            status, document, extra = responses.pop(0)
+            headers.update(extra)
+            return [status, headers,
+                    json.dumps({'releases': [document]}) if document else '']
+
+        httpretty.register_uri(
+            httpretty.GET, '{}/releases/{}'.format(self.URI, release['id']),
+            body=single)
+        events = list(self.orlo.watch([release['id']], interval=1,
+                                      backoff=2))
+        self.assertEqual([e.kind for e in events],
+                         [PACKAGE_STARTED, PACKAGE_STOPPED, RELEASE_FINISHED])
+        self.assertEqual(validators, [None, '"a"', '"a"'])
+        self.assertEqual(self.sleeps, [1, 2])
+
+    @httpretty.activate
+    def test_timeout(self):
+        self._register()
+        release = self.releases[0]
+        with patch.object(Interval, 'clock', side_effect=[0, 10]):
+            events = list(self.orlo.watch([release['id']], timeout=5))
+        self.assertEqual(events, [])
+        self.assertEqual(self.polls[release['id']], 1)